@@ -0,0 +1,27 @@
+"""Token store for the Gmail accounts this service digests."""
+import os, re
+
+TOKEN_DIR = os.getenv("TOKEN_DIR", "tokens")
+# The account behind the original single token.pickle
+DEFAULT_ACCOUNT = "me"
+
+_ACCOUNT_RE = re.compile(r"^[\w.@+-]+$")
+
+
+def token_path(account=None):
+    """Pickle file holding the credentials of `account`."""
+    if not account or account == DEFAULT_ACCOUNT:
+        return 'token.pickle'
+    if not _ACCOUNT_RE.match(account) or account.startswith('.'):
+        raise ValueError(f"Invalid account name: {account!r}")
+    return os.path.join(TOKEN_DIR, f"{account}.pickle")
+
+
+def list_accounts():
+    """Accounts with a stored token, e.g. tokens/alice@example.com.pickle."""
+    accounts = []
+    if os.path.isdir(TOKEN_DIR):
+        accounts = sorted(name[:-len('.pickle')] for name in os.listdir(TOKEN_DIR) if name.endswith('.pickle'))
+    if not accounts and os.path.exists(token_path(DEFAULT_ACCOUNT)):
+        accounts = [DEFAULT_ACCOUNT]
+    return accounts
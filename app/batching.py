@@ -0,0 +1,119 @@
+"""Summarize several emails per chat completion."""
+import json, os
+from .budget import count_tokens
+from .cache import summary_key
+from .llm import SUMMARY_MODEL, get_backend
+from .ranker import SYSTEM_PROMPT, prompt_inputs
+from .summary import SummaryRecord, priority_from
+
+# Emails per request; 1 turns batching off
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "1"))
+# Upper bound on the prompt tokens of one batch
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "3000"))
+# Completion tokens reserved per email in a batch
+BATCH_TOKENS_PER_EMAIL = 200
+BATCH_PROMPT_VERSION = "batch-3"
+
+BATCH_INSTRUCTIONS = """Aşağıdaki e-postaların her birini analiz et ve Türkçe özetle.
+Yanıtı yalnızca JSON olarak ver; anahtarlar e-posta kimlikleri, değerler şu alanları içeren nesneler olsun:
+{"<kimlik>": {"oncelik": 1-5 (1=Acil, 5=Düşük), "ozet": "2-3 satırlık özet",
+ "yapilacak": "yapılacak işlem veya İşlem gerekmiyor", "son_tarih": "tarih/saat veya Son tarih yok",
+ "kategori": "İş/Kişisel/Bülten/Promosyon"}}
+Her e-posta için tam olarak bir kayıt döndür."""
+
+
+def email_block(item_id, subject, sender, body):
+    return f"""### {item_id}
+📧 Konu: {subject}
+👤 Gönderen: {sender}
+📝 İçerik: {body}
+"""
+
+
+def pack_batches(items, max_emails=None, token_budget=None):
+    """Greedily group `(item_id, block)` pairs under both limits.
+
+    An email that alone exceeds the budget still gets a batch of its own.
+    """
+    max_emails = max_emails or SUMMARY_BATCH_SIZE
+    token_budget = token_budget or BATCH_TOKEN_BUDGET
+    overhead = count_tokens(SYSTEM_PROMPT + BATCH_INSTRUCTIONS)
+    batches, current, used = [], [], overhead
+    for item in items:
+        cost = count_tokens(item[1])
+        if current and (len(current) >= max_emails or used + cost > token_budget):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_reply(reply):
+    """JSON object from the model reply, tolerating code fences and chatter."""
+    start, end = reply.find("{"), reply.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("No JSON object in batch reply")
+    return json.loads(reply[start:end + 1])
+
+
+def record_from_fields(fields, message_id):
+    """SummaryRecord from one entry of the batch reply."""
+    return SummaryRecord(
+        priority=priority_from(fields.get("oncelik", "")),
+        category=str(fields.get("kategori") or "Genel").strip(),
+        action=fields.get("yapilacak"),
+        deadline=fields.get("son_tarih"),
+        text=str(fields.get("ozet", "")).strip(),
+        source_ids=[message_id] if message_id else []
+    )
+
+
+def summarize_batch(messages, complete=None, timeout=None, cache=None, model=None):
+    """Summarize `messages` with as few completions as the batch limits allow.
+
+    Returns one SummaryRecord per message, in order, with None for every email
+    that a failed or incomplete batch reply did not cover; callers retry
+    those one at a time with `generate_summary`. The caller decides how
+    many emails to pass; only BATCH_TOKEN_BUDGET splits them further.
+    """
+    complete = complete or get_backend()
+    model = model or getattr(complete, "model", SUMMARY_MODEL)
+    summaries = [None] * len(messages)
+    inputs = [prompt_inputs(message) for message in messages]
+    keys = [summary_key(message.get("id"), model, BATCH_PROMPT_VERSION, *inp)
+            for message, inp in zip(messages, inputs)]
+
+    todo = []
+    for index, key in enumerate(keys):
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            summaries[index] = SummaryRecord.model_validate_json(cached)
+        else:
+            # Short positional IDs keep the reply small and unambiguous
+            todo.append((f"e{index}", email_block(f"e{index}", *inputs[index])))
+
+    for batch in pack_batches(todo, max_emails=len(messages)):
+        try:
+            reply = complete(
+                [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": BATCH_INSTRUCTIONS + "\n\n" + "\n".join(block for _, block in batch)}
+                ],
+                model=model,
+                max_tokens=BATCH_TOKENS_PER_EMAIL * len(batch),
+                timeout=timeout
+            )
+            entries = parse_batch_reply(reply)
+        except Exception:
+            entries = {}
+        for item_id, _ in batch:
+            index = int(item_id[1:])
+            fields = entries.get(item_id)
+            if isinstance(fields, dict) and fields.get("ozet"):
+                summaries[index] = record_from_fields(fields, messages[index].get("id"))
+                if cache:
+                    cache.put(keys[index], summaries[index].model_dump_json())
+    return summaries
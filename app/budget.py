@@ -0,0 +1,159 @@
+"""Token counting and token budgets for the summary prompts."""
+import functools, os, re, threading, traceback
+from . import keywords
+from .metrics import add, llm_tokens_total
+
+try:
+    import tiktoken
+except ImportError:  # Listed in requirements.txt; without it counts fall back to the heuristic below
+    tiktoken = None
+
+# Prompt tokens one email's body may use, alone or inside a batch
+EMAIL_TOKEN_BUDGET = int(os.getenv("EMAIL_TOKEN_BUDGET", "400"))
+# Share of the email budget always given to the start of the body
+LEAD_SHARE = 0.4
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\s*\n\s*")
+GAP = " [...] "
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The BPE file is downloaded on first use; offline hosts fall back to the estimate
+        traceback.print_exc()
+        return None
+
+
+def tokenizer(model="gpt-3.5-turbo"):
+    """How token counts (and the costs derived from them) are obtained: "tiktoken" or "estimate"."""
+    return "tiktoken" if _encoding(model) is not None else "estimate"
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Tokens of `text` for `model`; estimated when tiktoken is not installed or cannot load."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # BPE vocabularies split long (and non-English) words into ~4 character pieces
+    return sum((len(token) + 3) // 4 for token in _WORD_RE.findall(text))
+
+
+def count_messages(messages, model="gpt-3.5-turbo"):
+    """Prompt tokens of a chat request, with the per-message framing overhead."""
+    return sum(count_tokens(m["content"], model) + 4 for m in messages) + 3
+
+
+def sentences(text):
+    return [s for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def fit_text(text, budget=None, model="gpt-3.5-turbo"):
+    """Shorten `text` to `budget` tokens, keeping the most useful sentences.
+
+    The opening sentences come first, then sentences with action or deadline
+    keywords (see app.keywords), then the rest in order. Kept sentences stay
+    in their original order; dropped stretches are marked with GAP.
+    """
+    budget = budget or EMAIL_TOKEN_BUDGET
+    if count_tokens(text, model) <= budget:
+        return text
+    parts = sentences(text)
+    costs = [count_tokens(s, model) for s in parts]
+    keep, order, used = set(), [], 0
+
+    def take(i, limit):
+        nonlocal used
+        if i not in keep and used + costs[i] <= limit:
+            keep.add(i)
+            order.append(i)
+            used += costs[i]
+            return True
+        return False
+
+    # The lead, cut mid-sentence if the first sentence alone is too long
+    for i in range(len(parts)):
+        if not take(i, budget * LEAD_SHARE):
+            break
+    if not keep:
+        return _cut(parts[0], budget - count_tokens(GAP, model), model) + GAP.rstrip()
+    body = keywords.matchers["body"]
+    for i, part in enumerate(parts):
+        if body.groups(part) & {"action", "deadline"}:
+            take(i, budget)
+    for i in range(len(parts)):
+        take(i, budget)
+
+    # Gap markers cost tokens too; give up the last picks until they fit
+    while True:
+        text = _join(parts, keep)
+        if len(order) == 1 or count_tokens(text, model) <= budget:
+            return text
+        keep.discard(order.pop())
+
+
+def _join(parts, keep):
+    out, last = [], -1
+    for i in sorted(keep):
+        if out and i != last + 1:
+            out.append(GAP.strip())
+        out.append(parts[i])
+        last = i
+    if last != len(parts) - 1:
+        out.append(GAP.strip())
+    return " ".join(out)
+
+
+def _cut(text, budget, model):
+    """The longest prefix of `text` within `budget` tokens, ending at a word if possible."""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid], model) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    space = text.rfind(" ", 0, low + 1)
+    return text[:space] if space > low // 2 else text[:low]
+
+
+class TokenMeter:
+    """Wraps a completion function and counts the tokens it is sent.
+
+    Calls answered from a cache never reach the wrapper, so the totals are
+    what the backend actually billed. `cost` uses the backend's prices
+    (see app.llm) and stays 0 for plain functions.
+    """
+
+    def __init__(self, complete):
+        self.complete = complete
+        self.model = getattr(complete, "model", None)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, messages, model="gpt-3.5-turbo", **kwargs):
+        prompt_tokens = count_messages(messages, model)
+        reply = self.complete(messages, model=model, **kwargs)
+        completion_tokens = count_tokens(reply, model)
+        cost = self.complete.cost(model, prompt_tokens, completion_tokens) if hasattr(self.complete, "cost") else 0.0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+        add(llm_tokens_total, prompt_tokens, "prompt_tokens", kind="prompt", tokenizer=tokenizer(model))
+        add(llm_tokens_total, completion_tokens, "completion_tokens", kind="completion", tokenizer=tokenizer(model))
+        return reply
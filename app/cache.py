@@ -0,0 +1,128 @@
+"""Persistent cache of LLM summaries keyed on message ID and prompt inputs."""
+import hashlib, os, threading, time
+from .db import connect, data_path
+from .metrics import add, cache_lookups_total
+
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.sqlite3")
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+
+# How many writes to accept between eviction passes
+EVICT_EVERY = 100
+
+
+def _normalize(text):
+    return " ".join((text or "").split())
+
+
+def summary_key(message_id, model, prompt_version, *inputs):
+    """Cache key for one summary.
+
+    The hash covers the normalized prompt inputs plus the model and prompt
+    version, so an edited message or a prompt change never reuses an old
+    summary.
+    """
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, *inputs):
+        digest.update(_normalize(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f"{message_id or '-'}:{digest.hexdigest()}"
+
+
+class SummaryCache:
+    """SQLite-backed summary cache with TTL and LRU eviction."""
+
+    def __init__(self, path, max_entries=SUMMARY_CACHE_MAX_ENTRIES, ttl=SUMMARY_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY, summary TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_accessed ON summaries (accessed_at)")
+        self.evict()
+
+    def get(self, key):
+        """Return the cached summary or None; counts a hit or a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                add(cache_lookups_total, 1, "cache_misses", result="miss")
+                return None
+            self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            add(cache_lookups_total, 1, "cache_hits", result="hit")
+            return row[0]
+
+    def put(self, key, summary):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, summary, now, now)
+            )
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then the least recently used ones over max_entries."""
+        with self._lock:
+            if self.ttl:
+                self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl,))
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN"
+                    " (SELECT key FROM summaries ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+
+_summary_cache = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    """Process-wide summary cache; None when SUMMARY_CACHE_PATH is empty."""
+    global _summary_cache
+    if not SUMMARY_CACHE_PATH:
+        return None
+    with _summary_cache_lock:
+        if _summary_cache is None:
+            path = SUMMARY_CACHE_PATH if SUMMARY_CACHE_PATH == ":memory:" else data_path(SUMMARY_CACHE_PATH)
+            _summary_cache = SummaryCache(path)
+    return _summary_cache
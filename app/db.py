@@ -0,0 +1,23 @@
+"""SQLite helpers shared by the on-disk stores (cache, sync state, ...)."""
+import os, sqlite3
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+
+def data_path(name):
+    """Path of a file inside DATA_DIR, creating the directory if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def connect(path):
+    """Open a connection that can be shared between threads.
+
+    Callers serialize access with their own lock. WAL keeps readers from
+    blocking the writer when several processes use the same file.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,114 @@
+"""Rolling per-account store of digest cards, filled as mail arrives and read at send time."""
+import os, threading, time
+from .db import connect, data_path
+from .summary import SummaryRecord, as_record
+
+DIGEST_STORE_PATH = os.getenv("DIGEST_STORE_PATH", "digest_store.sqlite3")
+# Cards of mail older than this are left out of the digest
+DIGEST_WINDOW_HOURS = float(os.getenv("DIGEST_WINDOW_HOURS", "24"))
+# Most cards one digest from the store shows
+DIGEST_MAX_CARDS = int(os.getenv("DIGEST_MAX_CARDS", "50"))
+# Sent and expired cards are deleted after this many days
+DIGEST_RETENTION_DAYS = float(os.getenv("DIGEST_RETENTION_DAYS", "7"))
+
+
+class DigestStore:
+    """One card per thread (or message) and account, with when it arrived and when it was sent.
+
+    A card that is written again, e.g. because its thread got a reply,
+    becomes unsent and shows up in the next digest.
+    """
+
+    def __init__(self, path, window_hours=DIGEST_WINDOW_HOURS, retention_days=DIGEST_RETENTION_DAYS):
+        self.window = window_hours * 3600
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS digest_cards ("
+            " account TEXT NOT NULL, card_id TEXT NOT NULL, subject TEXT NOT NULL, from_ TEXT NOT NULL,"
+            " priority INTEGER NOT NULL, summary TEXT NOT NULL, route TEXT, error TEXT,"
+            " received_at REAL NOT NULL, updated_at REAL NOT NULL, sent_at REAL,"
+            " PRIMARY KEY (account, card_id))"
+        )
+        # Serves the send-time query: unsent cards of one account in rank order
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS digest_cards_pending ON digest_cards (account, sent_at, priority, received_at)"
+        )
+
+    def put(self, account, cards):
+        """Insert or replace cards: dicts with card_id, subject, from_, summary, route, error, received_at."""
+        now = time.time()
+        rows = [(account, card["card_id"], card["subject"], card["from_"], as_record(card["summary"]).priority,
+                 as_record(card["summary"]).model_dump_json(), card.get("route"), card.get("error"),
+                 card.get("received_at") or now, now) for card in cards]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO digest_cards (account, card_id, subject, from_, priority, summary, route,"
+                " error, received_at, updated_at, sent_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)", rows
+            )
+
+    def pending(self, account, limit=DIGEST_MAX_CARDS):
+        """Unsent cards of the last window, most urgent and then newest first.
+
+        Returns `(summaries, cards)`; the summaries have the shape of
+        EmailResponse dicts, ready for the renderers, and `cards` holds the
+        `(card_id, updated_at)` versions to hand to mark_sent.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT card_id, subject, from_, summary, route, error, updated_at FROM digest_cards"
+                " WHERE account = ? AND sent_at IS NULL AND received_at >= ?"
+                " ORDER BY priority, received_at DESC LIMIT ?",
+                (account, time.time() - self.window, limit)
+            ).fetchall()
+        summaries = [{"subject": subject, "from_": from_, "summary": SummaryRecord.model_validate_json(summary),
+                      "error": error, "latency": None, "route": route}
+                     for _, subject, from_, summary, route, error, _ in rows]
+        return summaries, [(row[0], row[6]) for row in rows]
+
+    def mark_sent(self, account, cards):
+        """Mark the `(card_id, updated_at)` versions from pending() sent.
+
+        A card rewritten since, e.g. by a reply that arrived during the
+        send, keeps its newer version unsent.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE digest_cards SET sent_at = ? WHERE account = ? AND card_id = ? AND updated_at <= ?",
+                [(now, account, card_id, updated_at) for card_id, updated_at in cards]
+            )
+
+    def prune(self):
+        """Delete cards sent or received longer than the retention period ago; returns how many."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM digest_cards WHERE sent_at < ? OR received_at < ?", (cutoff, cutoff)
+            )
+        return cursor.rowcount
+
+    def stats(self, account):
+        with self._lock:
+            pending, sent = self._conn.execute(
+                "SELECT COUNT(*) FILTER (WHERE sent_at IS NULL), COUNT(sent_at) FROM digest_cards WHERE account = ?",
+                (account,)
+            ).fetchone()
+        return {"pending": pending, "sent": sent, "window_hours": self.window / 3600}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM digest_cards")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_digest_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DigestStore(data_path(DIGEST_STORE_PATH))
+    return _store
@@ -0,0 +1,241 @@
+"""Digest delivery: pooled SMTP connections and batched Gmail sends, with one result per recipient."""
+import base64, contextlib, os, smtplib, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+from .ratelimit import gmail_acquire
+from .resilience import RETRY_ATTEMPTS, backoff_delay, call_with_retry, is_retryable, spend_retry
+
+load_dotenv()
+
+# "gmail" sends through the account's Gmail API, "smtp" through SMTP_HOST as EMAIL_USER
+DIGEST_TRANSPORT = os.getenv("DIGEST_TRANSPORT", "gmail")
+# Comma-separated addresses that get every digest besides the mailbox owner
+DIGEST_RECIPIENTS = [a.strip() for a in os.getenv("DIGEST_RECIPIENTS", "").split(",") if a.strip()]
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() not in ("0", "false", "no")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Open connections shared by all senders; also the number of parallel sends
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+# Connections idle for longer are checked with NOOP before reuse
+SMTP_IDLE_CHECK = float(os.getenv("SMTP_IDLE_CHECK", "30"))
+
+# messages.send calls per batch request; each send is a whole MIME message
+GMAIL_SEND_BATCH = int(os.getenv("GMAIL_SEND_BATCH", "20"))
+
+
+@dataclass
+class Delivery:
+    """Outcome of sending one digest to one recipient."""
+    recipient: str
+    ok: bool
+    error: Optional[str] = None
+    message_id: Optional[str] = None  # Gmail ID of the sent message
+
+
+def recipients_for(user_email):
+    """The mailbox owner followed by DIGEST_RECIPIENTS, without duplicates."""
+    return list(dict.fromkeys([user_email] + DIGEST_RECIPIENTS))
+
+
+def _answered(error):
+    """Whether the server rejected a command but kept the session usable (smtplib resets it)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    # 421 means the server is closing the connection
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code != 421
+
+
+def _quit(server):
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+class SMTPPool:
+    """Authenticated SMTP connections reused across messages.
+
+    At most `size` connections are open at once; further senders wait for
+    a free one. A connection that fails mid-send is dropped, unless the
+    server just refused the message, so the retry in `send` starts on a
+    fresh one.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=None, password=None, size=SMTP_POOL_SIZE,
+                 starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT, idle_check=SMTP_IDLE_CHECK):
+        self.host = host
+        self.port = port
+        self.user = os.getenv("EMAIL_USER") if user is None else user
+        self.password = os.getenv("EMAIL_PASS") if password is None else password
+        self.size = size
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self.opened = 0  # Connections opened over the pool's life
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # (connection, time it was returned)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        with self._lock:
+            self.opened += 1
+        return server
+
+    def _alive(self, server, returned_at):
+        if time.monotonic() - returned_at < self.idle_check:
+            return True
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self._slots:
+            server = None
+            while server is None:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    server = self._open()
+                elif self._alive(*idle):
+                    server = idle[0]
+                else:
+                    _quit(idle[0])
+            reusable = False
+            try:
+                yield server
+                reusable = True
+            except Exception as e:
+                # Otherwise the session state is unknown after an error
+                reusable = _answered(e)
+                raise
+            finally:
+                if reusable:
+                    with self._lock:
+                        self._idle.append((server, time.monotonic()))
+                else:
+                    _quit(server)
+
+    def _send_once(self, message):
+        with self.connection() as server:
+            server.send_message(message)
+
+    def send(self, message):
+        """Send an email.message.Message, retrying transient SMTP errors."""
+        call_with_retry(self._send_once, message)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            _quit(server)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool()
+    return _pool
+
+
+def close_smtp_pool():
+    """Log out of every idle pooled connection (on shutdown)."""
+    if _pool is not None:
+        _pool.close()
+
+
+def send_smtp(messages, pool=None):
+    """Send `(recipient, message)` pairs over the pool, as many at once as it has connections."""
+    pool = pool or get_smtp_pool()
+
+    def send(item):
+        recipient, message = item
+        try:
+            pool.send(message)
+            return Delivery(recipient, True)
+        except Exception as e:
+            return Delivery(recipient, False, str(e))
+
+    if len(messages) == 1:
+        return [send(messages[0])]
+    with ThreadPoolExecutor(max_workers=min(pool.size, len(messages)), thread_name_prefix="smtp") as executor:
+        return list(executor.map(send, messages))
+
+
+def send_gmail(service, messages, limiter=None, chunk_size=None):
+    """Send `(recipient, message)` pairs with batched messages.send calls of `service`.
+
+    Sends that fail with quota or server errors are retried together in
+    the next batch, like app.gmail_service.fetch_messages.
+    """
+    chunk_size = chunk_size or GMAIL_SEND_BATCH
+    raw = [base64.urlsafe_b64encode(message.as_bytes()).decode("ascii") for _, message in messages]
+    sent = [None] * len(messages)
+    errors = {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            errors[int(request_id)] = exception
+        else:
+            sent[int(request_id)] = response
+
+    todo = list(range(len(messages)))
+    for attempt in range(RETRY_ATTEMPTS):
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            try:
+                gmail_acquire(limiter, "messages.send", len(chunk))
+                if len(chunk) == 1:
+                    # A batch of one only adds the multipart envelope
+                    on_response(str(chunk[0]), service.users().messages().send(
+                        userId="me", body={"raw": raw[chunk[0]]}).execute(), None)
+                    continue
+                batch = service.new_batch_http_request(callback=on_response)
+                for index in chunk:
+                    batch.add(service.users().messages().send(userId="me", body={"raw": raw[index]}),
+                              request_id=str(index))
+                batch.execute()
+            except Exception as e:
+                for index in chunk:
+                    if sent[index] is None and index not in errors:
+                        errors[index] = e
+
+        retry = [i for i in todo if sent[i] is None and is_retryable(errors.get(i))]
+        if not retry or attempt == RETRY_ATTEMPTS - 1 or not spend_retry():
+            break
+        time.sleep(max(backoff_delay(attempt, errors[i]) for i in retry))
+        for index in retry:
+            del errors[index]
+        todo = retry
+
+    return [
+        Delivery(recipient, True, message_id=sent[i].get("id")) if sent[i] is not None
+        else Delivery(recipient, False, str(errors.get(i, "No response")))
+        for i, (recipient, _) in enumerate(messages)
+    ]
+
+
+def send_messages(service, messages, limiter=None, transport=None):
+    """Deliver `(recipient, message)` pairs over DIGEST_TRANSPORT (or `transport`)."""
+    if (transport or DIGEST_TRANSPORT) == "smtp":
+        return send_smtp(messages)
+    return send_gmail(service, messages, limiter)
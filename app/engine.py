@@ -0,0 +1,226 @@
+"""Concurrent summarization of many emails with bounded parallelism."""
+import asyncio, contextvars, functools, os, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from .budget import TokenMeter, tokenizer
+from .cache import get_summary_cache
+from .batching import summarize_batch, SUMMARY_BATCH_SIZE
+from .llm import SUMMARY_MODEL, backend_for
+from .metrics import stage
+from .ranker import generate_summary, error_summary
+from .resilience import CircuitOpenError, is_retryable
+from .threads import needs_context, remember, summarize_thread
+from .summary import SummaryRecord
+from .triage import triage, template_summary, heuristic_summary, TRIAGE_ENABLED, TEMPLATE, CHEAP, FULL, CHEAP_MODEL, CHEAP_MAX_TOKENS
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "30"))
+
+_executor = None
+
+
+def get_executor():
+    """Shared worker threads for the blocking LLM client."""
+    global _executor
+    if _executor is None:
+        # The semaphore in summarize_all is the real limit, so leave headroom
+        # for callers that ask for more parallelism than the default
+        _executor = ThreadPoolExecutor(max_workers=max(SUMMARY_CONCURRENCY, 32), thread_name_prefix="summarize")
+    return _executor
+
+
+@dataclass
+class SummaryResult:
+    """Outcome of summarizing one email."""
+    index: int
+    message_id: Optional[str]
+    summary: SummaryRecord
+    latency: float
+    error: Optional[str] = None
+    route: str = FULL  # See app.triage
+    tokens: int = 0  # Prompt tokens sent to the LLM for this summary
+    cost: float = 0.0  # Estimated USD, see app.llm
+
+
+async def _call(semaphore, timeout, func, *args, **kwargs):
+    """Run a blocking LLM call in the pool; returns `(value, exception, latency)`."""
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        # The worker thread must see the run's retry budget (see app.resilience)
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        try:
+            value = await asyncio.wait_for(loop.run_in_executor(get_executor(), call), timeout)
+            return value, None, time.perf_counter() - start
+        except asyncio.TimeoutError:
+            return None, TimeoutError(f"Summary timed out after {timeout:g}s"), time.perf_counter() - start
+        except Exception as e:
+            return None, e, time.perf_counter() - start
+
+
+def _backend(route, complete=None):
+    """`(completion function, options)` for a route; an explicit `complete` wins over the configured backend."""
+    backend = complete or backend_for(cheap=route == CHEAP)
+    if route == CHEAP:
+        return backend, {"model": getattr(backend, "cheap_model", CHEAP_MODEL), "max_tokens": CHEAP_MAX_TOKENS}
+    return backend, {"model": getattr(backend, "model", SUMMARY_MODEL)}
+
+
+def default_concurrency(complete=None):
+    """SUMMARY_CONCURRENCY, capped by what the backend accepts at once."""
+    backend = complete or backend_for()
+    return min(SUMMARY_CONCURRENCY, getattr(backend, "max_concurrency", SUMMARY_CONCURRENCY))
+
+
+async def summarize_one(index, message, semaphore, timeout=None, complete=None, cache=None, route=FULL):
+    """Summarize one message (or the thread it carries, see app.threads) once a
+    slot is free; never raises except on cancellation."""
+    timeout = timeout or SUMMARY_TIMEOUT
+    func = summarize_thread if "thread" in message else generate_summary
+    backend, options = _backend(route, complete)
+    meter = TokenMeter(backend)
+    summary, error, latency = await _call(semaphore, timeout, func, message, meter, timeout, cache, **options)
+    if error is not None:
+        # An unavailable LLM still leaves a ranked card; other errors are shown
+        if isinstance(error, CircuitOpenError) or is_retryable(error):
+            summary = heuristic_summary(message)
+        else:
+            summary = error_summary(str(error))
+        error = str(error)
+    return SummaryResult(index, message.get("id"), summary, latency, error, route, meter.prompt_tokens, meter.cost)
+
+
+async def summarize_group(items, semaphore, timeout=None, complete=None, cache=None, route=FULL):
+    """Summarize `(index, message)` pairs in one batched request (see app.batching).
+
+    Emails the batch did not answer are retried one at a time, outside the
+    slot the batch held so retries cannot starve each other.
+    """
+    timeout = timeout or SUMMARY_TIMEOUT
+    backend, options = _backend(route, complete)
+    meter = TokenMeter(backend)
+    summaries, error, latency = await _call(
+        semaphore, timeout, summarize_batch, [message for _, message in items], meter, timeout, cache,
+        options["model"]
+    )
+    summaries = summaries or [None] * len(items)
+    for (_, message), summary in zip(items, summaries):
+        if summary is not None:
+            remember(message, summary)
+    # The batch prompt is shared, so each answered email carries its share
+    answered = max(1, sum(summary is not None for summary in summaries))
+    results = [
+        SummaryResult(index, message.get("id"), summary, latency, route=route,
+                      tokens=meter.prompt_tokens // answered, cost=meter.cost / answered)
+        for (index, message), summary in zip(items, summaries) if summary is not None
+    ]
+    retries = [
+        summarize_one(index, message, semaphore, timeout, complete, cache, route)
+        for (index, message), summary in zip(items, summaries) if summary is None
+    ]
+    return results + list(await asyncio.gather(*retries))
+
+
+async def _template_group(items, decisions):
+    return [
+        SummaryResult(index, message.get("id"), template_summary(message, decisions[index]), 0.0, route=TEMPLATE)
+        for index, message in items
+    ]
+
+
+def plan(messages, semaphore, timeout=None, complete=None, cache=None, use_triage=None, batch_size=None):
+    """Split the work into coroutines that each return a list of SummaryResult.
+
+    Messages are triaged first; template mail needs no LLM, the rest is
+    summarized alone or, with `batch_size` > 1, several per request.
+    """
+    use_triage = TRIAGE_ENABLED if use_triage is None else use_triage
+    batch_size = batch_size or SUMMARY_BATCH_SIZE
+    with stage("triage"):
+        decisions = {i: triage(message) for i, message in enumerate(messages)} if use_triage else {}
+    by_route = {TEMPLATE: [], CHEAP: [], FULL: []}
+    for i, message in enumerate(messages):
+        by_route[decisions[i].route if use_triage else FULL].append((i, message))
+
+    units = []
+    if by_route[TEMPLATE]:
+        units.append(_template_group(by_route[TEMPLATE], decisions))
+    for route in (CHEAP, FULL):
+        items = by_route[route]
+        if batch_size > 1:
+            # Threads with earlier replies need their own prompt
+            alone = {i for i, m in items if needs_context(m)}
+            units.extend(_single(summarize_one(i, m, semaphore, timeout, complete, cache, route))
+                         for i, m in items if i in alone)
+            items = [(i, m) for i, m in items if i not in alone]
+            for start in range(0, len(items), batch_size):
+                units.append(summarize_group(items[start:start + batch_size], semaphore, timeout, complete,
+                                             cache, route))
+        else:
+            units.extend(_single(summarize_one(i, m, semaphore, timeout, complete, cache, route)) for i, m in items)
+    return units
+
+
+async def _single(coro):
+    return [await coro]
+
+
+async def summarize_all(messages, concurrency=None, timeout=None, complete=None, cache=None, use_triage=None,
+                        batch_size=None):
+    """Summarize messages with at most `concurrency` LLM calls in flight.
+
+    Results come back in input order. A call that exceeds `timeout` seconds
+    gets the error card instead of failing the whole run. Cancelling the
+    caller cancels every summary that has not finished yet. `cache`
+    defaults to the shared summary cache; `batch_size` defaults to
+    SUMMARY_BATCH_SIZE.
+    """
+    semaphore = asyncio.Semaphore(concurrency or default_concurrency(complete))
+    cache = cache or get_summary_cache()
+    units = plan(messages, semaphore, timeout, complete, cache, use_triage, batch_size)
+    results = [result for unit in await asyncio.gather(*units) for result in unit]
+    return sorted(results, key=lambda result: result.index)
+
+
+async def iter_summaries(messages, concurrency=None, timeout=None, complete=None, cache=None, use_triage=None,
+                         batch_size=None):
+    """Like summarize_all but yields each SummaryResult as soon as it is ready.
+
+    `result.index` gives the position in `messages`. Closing the generator
+    early cancels the summaries still in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency or default_concurrency(complete))
+    cache = cache or get_summary_cache()
+    tasks = [
+        asyncio.ensure_future(unit)
+        for unit in plan(messages, semaphore, timeout, complete, cache, use_triage, batch_size)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for result in await next_done:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def triage_report(results):
+    """How many summaries took each route and how many LLM calls were skipped."""
+    report = {TEMPLATE: 0, CHEAP: 0, FULL: 0}
+    for result in results:
+        report[result.route] += 1
+    report["llm_calls_avoided"] = report[TEMPLATE]
+    return report
+
+
+def token_report(results):
+    """Prompt tokens actually sent for `results` (cache hits cost nothing).
+
+    "tokenizer" says how they were counted; with "estimate" (tiktoken not
+    installed or its encoding could not be loaded) the tokens and the cost
+    are approximations.
+    """
+    total = sum(result.tokens for result in results)
+    return {"prompt_tokens": total, "per_email": round(total / len(results)) if results else 0,
+            "cost_usd": round(sum(result.cost for result in results), 6), "tokenizer": tokenizer()}
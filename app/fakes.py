@@ -0,0 +1,420 @@
+"""Offline stand-ins for the Gmail API, SMTP and the LLM, used for benchmarks and local runs."""
+import base64, hashlib, json, re, socketserver, threading, time
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def http_error(status, reason=""):
+    """Build a googleapiclient HttpError like the real transport raises."""
+    resp = httplib2.Response({"status": status})
+    resp.reason = reason
+    return HttpError(resp, reason.encode("utf-8"))
+
+
+def make_message(index, subject=None, sender="sender@example.com", body="Merhaba, bu bir test e-postasıdır.",
+                 to="me@example.com", thread_id=None, labels=None, headers=None):
+    """Build a minimal Gmail API message resource; `headers` adds extra headers."""
+    data = base64.urlsafe_b64encode(body.encode("utf-8")).decode("ascii")
+    return {
+        "id": f"msg{index:05d}",
+        "threadId": thread_id or f"thr{index:05d}",
+        "labelIds": labels or ["INBOX"],
+        "snippet": body[:100],
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "Subject", "value": subject or f"Test message {index}"},
+                {"name": "From", "value": sender},
+                {"name": "To", "value": to},
+            ] + [{"name": name, "value": value} for name, value in (headers or {}).items()],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"size": len(body), "data": data}},
+            ],
+        },
+    }
+
+
+def _parse_fields(fields):
+    """Parse a partial-response mask like "id,payload(headers,body/data)" into a nested dict."""
+    tree, stack, name = {}, [], ""
+    node = tree
+    for char in fields + ",":
+        if char in ",()":
+            if name:
+                *path, last = name.strip().split("/")
+                target = node
+                for key in path:
+                    target = target.setdefault(key, {})
+                child = target.setdefault(last, {})
+            if char == "(":
+                stack.append(node)
+                node = child
+            elif char == ")":
+                node = stack.pop()
+            name = ""
+        else:
+            name += char
+    return tree
+
+
+def apply_fields(resource, fields):
+    """Keep only the parts of `resource` selected by a Gmail `fields` mask."""
+    def select(value, tree):
+        if not tree:
+            return value
+        if isinstance(value, list):
+            return [select(item, tree) for item in value]
+        if isinstance(value, dict):
+            return {key: select(value[key], sub) for key, sub in tree.items() if key in value}
+        return value
+    return select(resource, _parse_fields(fields))
+
+
+class _Request:
+    """A prepared call; `execute()` is one HTTP round trip."""
+
+    def __init__(self, service, func, kwargs):
+        self.service = service
+        self.func = func
+        self.kwargs = kwargs
+
+    def execute(self):
+        self.service._round_trip()
+        return self.func(**self.kwargs)
+
+
+class FakeBatch:
+    """Mimics googleapiclient.http.BatchHttpRequest."""
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        self.service._round_trip()
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.func(**request.kwargs), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class _Messages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId="me", q=None, maxResults=100, pageToken=None, **kwargs):
+        return _Request(self.service, self.service._list, {"maxResults": maxResults, "pageToken": pageToken})
+
+    def get(self, userId="me", id=None, format="full", metadataHeaders=None, fields=None, **kwargs):
+        return _Request(self.service, self.service._get, {"message_id": id, "format": format,
+                                                          "metadata_headers": metadataHeaders, "fields": fields})
+
+    def send(self, userId="me", body=None):
+        return _Request(self.service, self.service._send, {"body": body})
+
+
+class _History:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId="me", startHistoryId=None, historyTypes=None, pageToken=None, maxResults=100, **kwargs):
+        return _Request(self.service, self.service._history,
+                        {"start": startHistoryId, "pageToken": pageToken, "maxResults": maxResults})
+
+
+class _Users:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return _Messages(self.service)
+
+    def history(self):
+        return _History(self.service)
+
+    def getProfile(self, userId="me"):
+        return _Request(self.service, self.service._profile, {})
+
+    def watch(self, userId="me", body=None):
+        return _Request(self.service, self.service._watch, {"body": body})
+
+
+class FakeGmailService:
+    """In-memory Gmail service with injectable per-round-trip latency.
+
+    Only the calls this app makes are implemented. `round_trips` counts
+    simulated HTTP requests so batched and serial paths can be compared.
+    Once watched, every delivered message calls `on_change(email,
+    history_id)`, e.g. a FakePublisher.
+    """
+
+    def __init__(self, messages=None, latency=0.0, failing_ids=(), email="me@example.com", on_change=None):
+        self.messages = {}
+        self.order = []
+        self.latency = latency
+        self.failing_ids = set(failing_ids)
+        self.email = email
+        self.sent = []
+        self.round_trips = 0
+        # (history id, message id) for every delivered message
+        self.history_log = []
+        self.history_id = 1000
+        # History older than this is treated as expired
+        self.history_floor = 0
+        self.last_date = 0
+        self.on_change = on_change
+        self.watch = None
+        for message in messages or []:
+            self.add_message(message)
+
+    def add_message(self, message):
+        """Deliver a message, as if it just arrived in the mailbox."""
+        self.history_id += 1
+        message.setdefault("historyId", str(self.history_id))
+        # Gmail's arrival time in ms, strictly increasing in delivery order
+        self.last_date = max(int(time.time() * 1000), self.last_date + 1)
+        message.setdefault("internalDate", str(self.last_date))
+        self.messages[message["id"]] = message
+        self.order.append(message["id"])
+        self.history_log.append((self.history_id, message["id"]))
+        if self.watch and self.on_change:
+            self.on_change(self.email, self.history_id)
+
+    def expire_history(self):
+        """Make every stored history ID too old, like Gmail after about a week."""
+        self.history_floor = self.history_id
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _list(self, maxResults=100, pageToken=None):
+        start = int(pageToken or 0)
+        ids = list(reversed(self.order))[start:start + maxResults]
+        result = {"messages": [{"id": i, "threadId": self.messages[i]["threadId"]} for i in ids],
+                  "resultSizeEstimate": len(ids)}
+        if start + maxResults < len(self.order):
+            result["nextPageToken"] = str(start + maxResults)
+        return result
+
+    def _get(self, message_id, format="full", metadata_headers=None, fields=None):
+        if message_id in self.failing_ids or message_id not in self.messages:
+            raise http_error(404, "Requested entity was not found.")
+        message = self.messages[message_id]
+        if format == "metadata":
+            wanted = {h.lower() for h in metadata_headers or []}
+            payload = message.get("payload", {})
+            message = dict(message, payload={
+                "mimeType": payload.get("mimeType"),
+                "headers": [h for h in payload.get("headers", []) if not wanted or h["name"].lower() in wanted],
+            })
+        return apply_fields(message, fields) if fields else message
+
+    def _profile(self):
+        return {"emailAddress": self.email, "messagesTotal": len(self.order), "historyId": str(self.history_id)}
+
+    def _history(self, start, pageToken=None, maxResults=100):
+        start = int(start)
+        if start < self.history_floor:
+            raise http_error(404, "Requested entity was not found.")
+        entries = [(h, m) for h, m in self.history_log if h > start]
+        offset = int(pageToken or 0)
+        page = entries[offset:offset + maxResults]
+        result = {"historyId": str(self.history_id)}
+        if page:
+            result["history"] = [
+                {"id": str(h), "messagesAdded": [{"message": {"id": m, "threadId": self.messages[m]["threadId"],
+                                                              "labelIds": self.messages[m]["labelIds"]}}]}
+                for h, m in page
+            ]
+        if offset + maxResults < len(entries):
+            result["nextPageToken"] = str(offset + maxResults)
+        return result
+
+    def _watch(self, body):
+        self.watch = body
+        expiration = int((time.time() + 7 * 86400) * 1000)
+        return {"historyId": str(self.history_id), "expiration": str(expiration)}
+
+    def _send(self, body):
+        self.sent.append(body)
+        return {"id": f"sent{len(self.sent):05d}", "labelIds": ["SENT"]}
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+class FakePublisher:
+    """Local stand-in for the Pub/Sub push subscription of Gmail notifications.
+
+    `publish(email, history_id)` wraps the notification in a push request
+    body and hands it to `push`, e.g. a TestClient posting to /push/gmail
+    or a PushCoalescer-backed callable.
+    """
+
+    def __init__(self, push, subscription="projects/local/subscriptions/gmail-push"):
+        self.push = push
+        self.subscription = subscription
+        self.published = 0
+
+    def envelope(self, email, history_id):
+        data = json.dumps({"emailAddress": email, "historyId": history_id}).encode()
+        return {
+            "message": {"data": base64.b64encode(data).decode("ascii"), "messageId": str(self.published),
+                        "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+            "subscription": self.subscription,
+        }
+
+    def publish(self, email, history_id):
+        self.published += 1
+        return self.push(self.envelope(email, history_id))
+
+    __call__ = publish
+
+
+class FakeCompletion:
+    """Deterministic stand-in for `ranker.openai_complete`.
+
+    Sleeps `latency` seconds per call to mimic a remote model and answers
+    in the format the summary prompt asks for. Safe to call from threads.
+    """
+
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, messages, model=None, temperature=0.2, max_tokens=300, timeout=None):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.prompt_chars += sum(len(m["content"]) for m in messages)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and call % self.fail_every == 0:
+            raise RuntimeError("Fake completion failure")
+        prompt = messages[-1]["content"]
+        batch_ids = re.findall(r"^### (\S+)$", prompt, flags=re.MULTILINE)
+        if batch_ids:
+            # Batched prompt (see app.batching): answer with JSON keyed by email ID
+            return json.dumps({
+                item_id: {"oncelik": self._priority(item_id + prompt), "ozet": "Bu e-posta otomatik test için özetlendi.",
+                          "yapilacak": "İşlem gerekmiyor", "son_tarih": "Son tarih yok", "kategori": "İş"}
+                for item_id in batch_ids
+            }, ensure_ascii=False)
+        priority = self._priority(prompt)
+        return f"""━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🎯 ÖNCELİK SEVİYESİ
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+⭐ Öncelik: {priority}
+
+📋 TEMEL BİLGİLER
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📄 Özet: Bu e-posta otomatik test için özetlendi.
+✅ Yapılması Gereken: İşlem gerekmiyor
+⏰ Son Tarih: Son tarih yok
+🏷️ Kategori: İş"""
+
+    @staticmethod
+    def _priority(text):
+        return int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % 5 + 1
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        if self.server.fake.latency:
+            time.sleep(self.server.fake.latency)
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        fake = self.server.fake
+        with fake._lock:
+            fake.connections += 1
+        self.reply("220 fake-smtp ready")
+        sender, recipients = None, []
+        for raw in self.rfile:
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-fake-smtp\r\n250-AUTH PLAIN\r\n250 8BITMIME")
+            elif verb == "AUTH":
+                with fake._lock:
+                    fake.logins += 1
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command[8:].strip("<> ")
+                if recipient in fake.rejected:
+                    self.reply(f"550 5.1.1 {recipient}: mailbox unavailable")
+                else:
+                    recipients.append(recipient)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                with fake._lock:
+                    fake.messages.append((sender, recipients, b"".join(lines)))
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class FakeSMTPServer:
+    """Minimal SMTP server on localhost for dispatch tests and benchmarks.
+
+    Accepts AUTH PLAIN without STARTTLS (use SMTPPool(starttls=False)),
+    keeps every message, and counts connections and logins so pooled and
+    per-message sending can be compared. `latency` seconds are added to
+    every reply to mimic a remote server; mail to `rejected` addresses is
+    refused with 550.
+    """
+
+    def __init__(self, latency=0.0, rejected=()):
+        self.latency = latency
+        self.rejected = set(rejected)
+        self.messages = []  # (sender, recipients, raw message)
+        self.connections = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-smtp").start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,14 +1,26 @@
 from __future__ import print_function
-import base64, os, datetime as dt
-from googleapiclient.discovery import build
+import os, datetime as dt, functools, json, threading, time
+import httplib2
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 import pickle
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import html
+from email.mime.application import MIMEApplication
+from .accounts import token_path, DEFAULT_ACCOUNT
+from .digest_store import get_digest_store
+from .dispatch import DIGEST_TRANSPORT, send_messages
+from .metrics import stage
+from .ratelimit import gmail_acquire
+from .resilience import RETRY_ATTEMPTS, backoff_delay, is_retryable, spend_retry
+from .render import render_digest
+from .sync import sync_messages
+from .threads import group_threads
 load_dotenv()
 
 # If modifying these scopes, delete the file token.pickle.
@@ -17,305 +29,281 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.send'
 ]
 
-def gmail_build():
-    """Build Gmail API service with proper authentication."""
+# Gmail accepts up to 100 calls per batch but recommends staying at 50 or below
+GMAIL_BATCH_SIZE = int(os.getenv('GMAIL_BATCH_SIZE', '50'))
+GMAIL_BATCH_LIMIT = 100
+
+# Refresh access tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = float(os.getenv('TOKEN_REFRESH_MARGIN', '300'))
+GMAIL_HTTP_TIMEOUT = float(os.getenv('GMAIL_HTTP_TIMEOUT', '60'))
+
+# Headers the digest and triage read; everything else stays on the server
+METADATA_HEADERS = ['Subject', 'From', 'To', 'List-Unsubscribe', 'List-Id', 'Precedence']
+# internalDate orders threads oldest first (see threads.group_threads) and dates digest cards
+METADATA_FIELDS = 'id,threadId,labelIds,snippet,internalDate,payload(mimeType,headers)'
+
+
+def _part_fields(depth):
+    fields = 'mimeType,filename,headers,body/data'
+    return fields if depth == 0 else f'{fields},parts({_part_fields(depth - 1)})'
+
+
+# Full messages without attachment IDs, sizes and part IDs; MIME trees nested
+# deeper than this are rare enough to read as "No readable content"
+FULL_FIELDS = f'id,threadId,labelIds,snippet,internalDate,payload({_part_fields(4)})'
+
+def load_credentials(account=None):
+    """Load (and if needed refresh or authorize) the credentials of `account`.
+
+    `account` selects a token from the token store (see app.accounts); the
+    default is the interactive single-user token.pickle.
+    """
+    token_file = token_path(account)
     creds = None
-    # The file token.pickle stores the user's access and refresh tokens
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
+    # The token file stores the user's access and refresh tokens
+    if os.path.exists(token_file):
+        with open(token_file, 'rb') as token:
             creds = pickle.load(token)
             
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif account and account != DEFAULT_ACCOUNT:
+            # Stored accounts cannot open a browser, they have to be re-authorized
+            raise RuntimeError(f"No valid token for account {account}")
         else:
             flow = InstalledAppFlow.from_client_secrets_file(
                 'credentials.json', SCOPES)
             creds = flow.run_local_server(port=0)
             
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+        save_credentials(account, creds)
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
 
-def create_html_summary(summaries):
-    """Create a beautiful HTML email with all summaries"""
-    html_content = """
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body { 
-                font-family: 'Segoe UI', Arial, sans-serif; 
-                line-height: 1.6; 
-                color: #2c3e50; 
-                background-color: #f5f6fa;
-                margin: 0;
-                padding: 0;
-            }
-            .email-container { 
-                max-width: 800px; 
-                margin: 20px auto; 
-                padding: 20px;
-                background: white;
-                box-shadow: 0 2px 15px rgba(0,0,0,0.1);
-                border-radius: 12px;
-            }
-            .summary-box { 
-                border: 1px solid #e1e8ed; 
-                border-radius: 12px; 
-                padding: 20px; 
-                margin-bottom: 25px;
-                background: white;
-                transition: all 0.3s ease;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-                position: relative;
-                overflow: hidden;
-            }
-            .summary-box:hover {
-                transform: translateY(-2px);
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-            }
-            .header { 
-                background: linear-gradient(135deg, #2c3e50 0%, #3498db 100%);
-                color: white; 
-                padding: 25px;
-                border-radius: 12px;
-                margin-bottom: 30px;
-                text-align: center;
-            }
-            .header h2 {
-                margin: 0;
-                font-size: 24px;
-                font-weight: 600;
-            }
-            .header p {
-                margin: 10px 0 0 0;
-                opacity: 0.9;
-            }
-            .section { 
-                margin: 15px 0;
-                line-height: 1.8;
-            }
-            .importance { 
-                font-size: 1.2em; 
-                color: #e67e22;
-                font-weight: 600;
-            }
-            .divider { 
-                border-top: 1px solid #edf2f7;
-                margin: 15px 0;
-            }
-            .priority-badge {
-                display: inline-block;
-                padding: 5px 12px;
-                border-radius: 15px;
-                font-size: 14px;
-                font-weight: 500;
-                margin-bottom: 10px;
-            }
-            .priority-1 { background: #ff4757; color: white; }
-            .priority-2 { background: #ffa502; color: white; }
-            .priority-3 { background: #2ed573; color: white; }
-            .priority-4 { background: #747d8c; color: white; }
-            .priority-5 { background: #a4b0be; color: white; }
-            .category-tag {
-                display: inline-block;
-                padding: 4px 10px;
-                border-radius: 12px;
-                font-size: 12px;
-                background: #f1f2f6;
-                color: #2f3542;
-                margin-right: 5px;
-                margin-top: 5px;
-            }
-            .footer {
-                text-align: center;
-                margin-top: 30px;
-                padding-top: 20px;
-                border-top: 1px solid #edf2f7;
-                color: #a4b0be;
-                font-size: 14px;
-            }
-            .email-link {
-                color: #2c3e50;
-                text-decoration: none;
-                transition: color 0.2s ease;
-                display: block;
-            }
-            .email-link:hover {
-                color: #3498db;
-            }
-            .view-original {
-                position: absolute;
-                top: 20px;
-                right: 20px;
-                background: #f8f9fa;
-                padding: 8px 15px;
-                border-radius: 20px;
-                color: #2c3e50;
-                text-decoration: none;
-                font-size: 13px;
-                transition: all 0.2s ease;
-                border: 1px solid #e1e8ed;
-            }
-            .view-original:hover {
-                background: #3498db;
-                color: white;
-                border-color: #3498db;
-            }
-            .view-original i {
-                margin-left: 5px;
-            }
-            .metadata {
-                color: #7f8c8d;
-                font-size: 14px;
-                margin: 10px 0;
-            }
-            .action-required {
-                background: #fff3cd;
-                border-left: 4px solid #ffa502;
-                padding: 10px 15px;
-                margin: 10px 0;
-                border-radius: 4px;
-            }
-            .deadline {
-                background: #f8d7da;
-                border-left: 4px solid #ff4757;
-                padding: 10px 15px;
-                margin: 10px 0;
-                border-radius: 4px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="email-container">
-            <div class="header">
-                <h2>📧 Günlük E-posta Özetiniz</h2>
-                <p>""" + dt.datetime.now().strftime("%d.%m.%Y %H:%M") + """ tarihinde oluşturuldu</p>
-            </div>
+def save_credentials(account, creds):
+    """Save the credentials for the next run"""
+    with open(token_path(account), 'wb') as token:
+        pickle.dump(creds, token)
+
+@functools.lru_cache(maxsize=None)
+def discovery_document():
+    """Gmail discovery document bundled with google-api-python-client, parsed once."""
+    return json.loads(discovery_cache.get_static_doc('gmail', 'v1'))
+
+class ThreadLocalHttp:
+    """Authorized HTTP transport with one keep-alive connection pool per thread.
+
+    httplib2 is not thread safe, so a single shared service object sends
+    each request over the calling thread's own connection instead.
     """
-    
-    priority_names = {
-        "1": "Acil",
-        "2": "Yüksek Öncelik",
-        "3": "Normal",
-        "4": "Düşük Öncelik",
-        "5": "Bilgi"
-    }
-    
-    for summary in summaries:
-        # Convert the summary text to HTML-safe format and preserve line breaks
-        formatted_summary = html.escape(summary['summary']).replace('\n', '<br>')
-        
-        # Extract priority number from the summary
-        priority = "3"  # default priority
-        if "Priority:" in formatted_summary:
-            priority = formatted_summary.split("Priority:")[1].strip()[0]
-        
-        # Extract category if available
-        category = "Genel"
-        if "Category:" in formatted_summary:
-            category = formatted_summary.split("Category:")[1].split("<br>")[0].strip()
-            
-        # Extract action and deadline
-        action = None
-        if "Action Required:" in formatted_summary:
-            action = formatted_summary.split("Action Required:")[1].split("<br>")[0].strip()
-            
-        deadline = None
-        if "Deadline:" in formatted_summary:
-            deadline = formatted_summary.split("Deadline:")[1].split("<br>")[0].strip()
-        
-        # Create Gmail link
-        gmail_link = f"https://mail.google.com/mail/u/0/#search/{html.escape(summary['subject'].replace(' ', '%20'))}"
-        
-        html_content += f"""
-            <div class="summary-box">
-                <div class="priority-badge priority-{priority}">
-                    ⭐ {priority_names[priority]}
-                </div>
-                <a href="{gmail_link}" target="_blank" class="email-link">
-                    <h3 style="margin: 10px 0;">📌 {html.escape(summary['subject'])}</h3>
-                </a>
-                <a href="{gmail_link}" target="_blank" class="view-original">
-                    Orijinal E-postayı Aç ↗
-                </a>
-                <div class="metadata">
-                    <strong>Gönderen:</strong> {html.escape(summary['from_'])}
-                </div>
-                <div class="divider"></div>
-                <div class="section">
-                    {formatted_summary}
-                </div>
-                {f'<div class="action-required">✅ Yapılması Gereken: {action}</div>' if action and action.lower() != "no action needed" else ''}
-                {f'<div class="deadline">⏰ Son Tarih: {deadline}</div>' if deadline and deadline.lower() != "no deadline" else ''}
-                <div style="margin-top: 15px;">
-                    <span class="category-tag">📑 {category}</span>
-                </div>
-            </div>
-        """
-    
-    html_content += """
-            <div class="footer">
-                <p>Bu özet e-postası otomatik olarak oluşturulmuştur.</p>
-                <p>© 2025 Email Özet Sistemi</p>
-            </div>
-        </div>
-    </body>
-    </html>
+
+    def __init__(self, credentials, timeout=GMAIL_HTTP_TIMEOUT):
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+class GmailServiceManager:
+    """Long-lived Gmail service and credentials per account.
+
+    The service is built once from the bundled discovery document; later
+    calls only check the token and refresh it under a per-account lock
+    when it is about to expire.
     """
-    return html_content
 
-def send_email_summary(service, to_email, summaries):
-    """Send email summary with beautiful formatting"""
-    message = MIMEMultipart('alternative')
+    def __init__(self, load=load_credentials, save=save_credentials, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.load = load
+        self.save = save
+        self.refresh_margin = dt.timedelta(seconds=refresh_margin)
+        self._services = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _account_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _expires_soon(self, creds):
+        if not creds.valid:
+            return True
+        return creds.expiry is not None and creds.expiry - dt.datetime.utcnow() < self.refresh_margin
+
+    def get(self, account=None):
+        key = account or DEFAULT_ACCOUNT
+        with self._account_lock(key):
+            entry = self._services.get(key)
+            if entry is None:
+                creds = self.load(account)
+                service = build_from_document(discovery_document(), http=ThreadLocalHttp(creds))
+                entry = self._services[key] = (creds, service)
+            elif self._expires_soon(entry[0]) and entry[0].refresh_token:
+                # Refreshed in place, so every thread's transport picks up the new token
+                entry[0].refresh(Request())
+                self.save(account, entry[0])
+            return entry[1]
+
+    def invalidate(self, account=None):
+        """Drop the cached service, e.g. after the token was revoked."""
+        with self._account_lock(account or DEFAULT_ACCOUNT):
+            self._services.pop(account or DEFAULT_ACCOUNT, None)
+
+service_manager = GmailServiceManager()
+
+def gmail_build(account=None):
+    """Gmail API service for `account`, shared across requests and threads."""
+    with stage("auth"):
+        return service_manager.get(account)
+
+def create_html_summary(summaries):
+    """Create a beautiful HTML email with all summaries (see app.render)"""
+    return render_digest(summaries)
+
+def build_summary_message(to_email, html_content, sender=None, pdf=None):
+    """The digest as a MIME message; `sender` sets From (Gmail fills it in otherwise), `pdf` is attached"""
+    message = MIMEMultipart('mixed' if pdf else 'alternative')
     message['to'] = to_email
-    message['subject'] = f"📋 Günlük E-posta Özetiniz - {dt.datetime.now().strftime('%d.%m.%Y')}"
-    
-    # Create HTML content
+    if sender:
+        message['from'] = sender
+    today = dt.datetime.now()
+    message['subject'] = f"📋 Günlük E-posta Özetiniz - {today.strftime('%d.%m.%Y')}"
+    message.attach(MIMEText(html_content, 'html', 'utf-8'))
+    if pdf:
+        attachment = MIMEApplication(pdf, 'pdf')
+        attachment.add_header('Content-Disposition', 'attachment',
+                              filename=f"email_digest_{today.strftime('%Y%m%d')}.pdf")
+        message.attach(attachment)
+    return message
+
+def send_email_summaries(service, recipients, summaries, limiter=None, transport=None, pdf=None):
+    """Send one digest to several recipients; returns a dispatch.Delivery per recipient"""
+    # Rendered once; only the To header differs
     html_content = create_html_summary(summaries)
-    
-    # Attach HTML part
-    html_part = MIMEText(html_content, 'html', 'utf-8')
-    message.attach(html_part)
-    
-    # Encode the message
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-    
-    try:
-        service.users().messages().send(
-            userId='me',
-            body={'raw': raw_message}
-        ).execute()
-        return True
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
+    sender = os.getenv("EMAIL_USER") if (transport or DIGEST_TRANSPORT) == "smtp" else None
+    messages = [(to, build_summary_message(to, html_content, sender, pdf)) for to in recipients]
+    with stage("send"):
+        deliveries = send_messages(service, messages, limiter, transport)
+    for delivery in deliveries:
+        if not delivery.ok:
+            print(f"Error sending email to {delivery.recipient}: {delivery.error}")
+    return deliveries
+
+def send_email_summary(service, to_email, summaries=None, limiter=None, account=None, pdf=None):
+    """Send email summary with beautiful formatting
+
+    Without `summaries` the unsent cards of `account` in the digest store
+    are sent and then marked sent, so nothing is fetched or summarized.
+    """
+    if summaries is not None:
+        return send_email_summaries(service, [to_email], summaries, limiter, pdf=pdf)[0].ok
+    store = get_digest_store()
+    account = account or DEFAULT_ACCOUNT
+    summaries, cards = store.pending(account)
+    if not summaries:
         return False
+    sent = send_email_summaries(service, [to_email], summaries, limiter, pdf=pdf)[0].ok
+    if sent:
+        store.mark_sent(account, cards)
+    return sent
+
+def fetch_today_threads(max_results=100, incremental=False):
+    """Fetch today's messages grouped into threads, oldest message first.
 
-def fetch_today_threads(max_results=100):
+    With `incremental=True` only messages that arrived since the previous
+    incremental call are returned (see app.sync).
+    """
     service = gmail_build()
     today = dt.datetime.utcnow().strftime("%Y/%m/%d")
     query = f"after:{today}"
-    results = (
-        service.users()
-        .messages()
-        .list(userId="me", q=query, maxResults=max_results)
-        .execute()
-    )
-    msgs = results.get("messages", [])
-    full_msgs = []
-    for m in msgs:
-        data = (
+    if incremental:
+        msgs, _ = sync_messages(service, query=query, max_results=max_results)
+    else:
+        results = (
             service.users()
             .messages()
-            .get(userId="me", id=m["id"], format="full")
+            .list(userId="me", q=query, maxResults=max_results)
             .execute()
         )
-        full_msgs.append(data)
-    return full_msgs
+        msgs = results.get("messages", [])
+    full_msgs, _ = fetch_full(service, [m["id"] for m in msgs])
+    return group_threads([data for data in full_msgs if data is not None])
+
+def fetch_messages(service, message_ids, chunk_size=None, limiter=None, **get_kwargs):
+    """Fetch many messages with batched HTTP requests.
+
+    Message IDs are sent in chunks of `chunk_size` (GMAIL_BATCH_SIZE by
+    default), one HTTP round trip per chunk. Extra keyword arguments are
+    passed to `messages().get`, e.g. `format="full"`. A `limiter` (see
+    app.ratelimit) is charged the quota of each chunk before it is sent.
+
+    Returns `(messages, errors)`: `messages` follows the order of
+    `message_ids` and holds None for every item that failed, `errors` maps
+    the failed message IDs to their exception.
+    """
+    chunk_size = max(1, min(chunk_size or GMAIL_BATCH_SIZE, GMAIL_BATCH_LIMIT))
+    messages = [None] * len(message_ids)
+    errors = {}
+
+    def on_response(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            errors[message_ids[index]] = exception
+        else:
+            messages[index] = response
+
+    todo = list(range(len(message_ids)))
+    for attempt in range(RETRY_ATTEMPTS):
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            batch = service.new_batch_http_request(callback=on_response)
+            for index in chunk:
+                batch.add(
+                    service.users().messages().get(userId="me", id=message_ids[index], **get_kwargs),
+                    request_id=str(index)
+                )
+            try:
+                gmail_acquire(limiter, "messages.get", len(chunk))
+                batch.execute()
+            except Exception as e:
+                # Transport failure: mark every item of this chunk that got no answer
+                for index in chunk:
+                    if messages[index] is None and message_ids[index] not in errors:
+                        errors[message_ids[index]] = e
+
+        # Quota and server errors of single items are retried in a smaller batch
+        retry = [i for i in todo if messages[i] is None and is_retryable(errors.get(message_ids[i]))]
+        if not retry or attempt == RETRY_ATTEMPTS - 1 or not spend_retry():
+            break
+        time.sleep(max(backoff_delay(attempt, errors[message_ids[i]]) for i in retry))
+        for index in retry:
+            del errors[message_ids[index]]
+        todo = retry
+
+    return messages, errors
+
+def fetch_metadata(service, message_ids, limiter=None):
+    """Headers, labels and snippet of many messages (see fetch_messages)."""
+    return fetch_messages(service, message_ids, limiter=limiter, format='metadata',
+                          metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS)
+
+def fetch_full(service, message_ids, limiter=None):
+    """Full messages with bodies, without attachment metadata (see fetch_messages)."""
+    return fetch_messages(service, message_ids, limiter=limiter, format='full', fields=FULL_FIELDS)
+
+def response_bytes(messages):
+    """Approximate JSON size of fetched message resources."""
+    return sum(len(json.dumps(m, ensure_ascii=False).encode('utf-8')) for m in messages if m is not None)
 
 def get_header(headers, name):
     """Get a specific header value from email headers."""
@@ -0,0 +1,125 @@
+"""In-process queue and worker pool for background digest runs."""
+import asyncio, os, time, traceback, uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs stay queryable for this many seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+
+@dataclass
+class Job:
+    """One digest run for one mailbox."""
+    id: str
+    mailbox: str
+    options: dict = field(default_factory=dict)
+    status: str = "queued"  # queued, running, done, failed
+    completed: int = 0
+    total: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def progress(self, completed, total):
+        self.completed = completed
+        self.total = total
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "mailbox": self.mailbox,
+            "status": self.status,
+            "progress": {"completed": self.completed, "total": self.total},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs jobs on a fixed number of asyncio workers.
+
+    `runner(job)` is a coroutine that does the work and returns the job
+    result; it may call `job.progress()` along the way. At most one job per
+    mailbox is queued or running at any time.
+    """
+
+    def __init__(self, runner, workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self.runner = runner
+        self.workers = workers
+        self.retention = retention
+        self.jobs = {}
+        self._active_by_mailbox = {}
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, mailbox, **options):
+        """Queue a job, or return the one already pending for this mailbox.
+
+        Returns `(job, created)`.
+        """
+        self._prune()
+        active_id = self._active_by_mailbox.get(mailbox)
+        if active_id and self.jobs[active_id].active:
+            return self.jobs[active_id], False
+
+        job = Job(id=uuid.uuid4().hex, mailbox=mailbox, options=options)
+        self.jobs[job.id] = job
+        self._active_by_mailbox[mailbox] = job.id
+        self._queue.put_nowait(job)
+        return job, True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0, "jobs": counts}
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await self.runner(job)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Cancelled"
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                if self._active_by_mailbox.get(job.mailbox) == job.id:
+                    del self._active_by_mailbox[job.mailbox]
+                self._queue.task_done()
@@ -0,0 +1,130 @@
+"""Precompiled keyword matching for the priority heuristics."""
+import json, os, re
+
+# JSON file with keyword lists to use instead of (or on top of) the defaults,
+# e.g. {"vip": ["ceo", "genel müdür"], "urgent": ["acil"]}
+KEYWORDS_PATH = os.getenv("KEYWORDS_PATH", "")
+
+DEFAULT_KEYWORDS = {
+    # calculate_priority: subject
+    "urgent": ["urgent", "acil", "immediate", "asap", "emergency", "deadline", "son tarih", "önemli",
+               "kritik", "hemen", "acilen", "ivedi", "gecikmeyin", "son gün", "son fırsat"],
+    "important": ["important", "priority", "attention", "action", "required", "gerekli", "dikkat",
+                  "önemli", "öncelikli", "takip", "kontrol", "inceleme", "değerlendirme"],
+    # calculate_priority: sender
+    "vip": ["ceo", "cfo", "cto", "director", "manager", "yönetici", "müdür", "direktör",
+            "founder", "kurucu", "başkan", "genel müdür", "koordinatör", "supervisor"],
+    # calculate_priority: category
+    "category": ["İş", "Kariyer", "Work", "Career", "Job", "Interview", "Mülakat",
+                 "Staj", "Proje", "Görev", "Toplantı", "Eğitim"],
+    # calculate_priority: body
+    "deadline": ["deadline", "son tarih", "son gün", "bitiş tarihi", "son başvuru",
+                 "dönüş tarihi", "teslim tarihi", "geç kalma"],
+    # budget.fit_text: sentences worth keeping in a shortened body
+    "action": ["lütfen", "rica ederim", "rica ediyoruz", "onay", "yanıtlayın", "dönüş yapın", "gönderin",
+               "tamamlayın", "gerekiyor", "please", "action required", "confirm", "approve", "reply", "respond",
+               "review", "submit"],
+    # basic_priority
+    "basic_urgent": ["urgent", "asap", "emergency", "critical", "immediate", "action required", "deadline"],
+    "basic_vip": ["ceo", "cfo", "cto", "president", "director", "board"],
+}
+
+
+def fold(text):
+    """Turkish-aware case folding: "ACİL", "acil" and "acıl" all fold to "acil"."""
+    # "İ".lower() leaves a combining dot behind; dotless ı is folded onto i
+    # so both spellings of an upper-case I match
+    return text.lower().replace("\u0307", "").replace("ı", "i")
+
+
+def _trie_pattern(words):
+    """Regex for a set of literals, factored as a trie so alternation stays cheap."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Finds the keywords of several groups in a single scan of the text.
+
+    Matching is by substring, like the `keyword in text` checks it replaces,
+    unless `whole_words` is set.
+    """
+
+    def __init__(self, groups, whole_words=False):
+        self.keywords = {}
+        for group, words in groups.items():
+            for word in words:
+                key = fold(word)
+                if key:
+                    self.keywords.setdefault(key, set()).add(group)
+        # The scan reports the longest keyword at each position, so a match
+        # also counts for every keyword it contains ("son gün" hides "son")
+        self._groups_of = {
+            key: set().union(*(groups for other, groups in self.keywords.items() if other in key))
+            for key in self.keywords
+        }
+        pattern = _trie_pattern(self.keywords)
+        if pattern and whole_words:
+            pattern = r"\b" + pattern + r"\b"
+        self._regex = re.compile(pattern) if pattern else None
+
+    def hits(self, text):
+        """Folded keywords found in `text`."""
+        if not text or self._regex is None:
+            return set()
+        return set(self._regex.findall(fold(text)))
+
+    def groups(self, text):
+        """Names of the groups with at least one keyword in `text`."""
+        groups = set()
+        for key in self.hits(text):
+            groups |= self._groups_of[key]
+        return groups
+
+
+def load_keywords(path=None):
+    """Default keyword lists, with groups replaced by those in the JSON file at `path`."""
+    keywords = {group: list(words) for group, words in DEFAULT_KEYWORDS.items()}
+    path = path if path is not None else KEYWORDS_PATH
+    if path:
+        with open(path, encoding="utf-8") as f:
+            keywords.update(json.load(f))
+    return keywords
+
+
+def build_matchers(keywords=None):
+    """One matcher per field the heuristics look at."""
+    keywords = keywords or load_keywords()
+    return {
+        "subject": KeywordMatcher({g: keywords[g] for g in ("urgent", "important", "basic_urgent")}),
+        "sender": KeywordMatcher({g: keywords[g] for g in ("vip", "basic_vip")}),
+        # Category names are matched as words so "Kişisel" does not count as "İş"
+        "category": KeywordMatcher({"category": keywords["category"]}, whole_words=True),
+        "body": KeywordMatcher({g: keywords[g] for g in ("deadline", "action")}),
+    }
+
+
+matchers = build_matchers()
+
+
+def reload(path=None):
+    """Rebuild the matchers, e.g. after editing the keyword file."""
+    global matchers
+    matchers = build_matchers(load_keywords(path))
+    return matchers
@@ -0,0 +1,175 @@
+"""Chat-completion backends: OpenAI, a local OpenAI-compatible server and an offline fake."""
+import os, threading, time
+import openai
+from dotenv import load_dotenv
+from .metrics import add, llm_calls_total, stage
+from .ratelimit import openai_limiter
+from .resilience import CircuitBreaker, call_with_retry
+load_dotenv()
+
+# Retries happen in app.resilience, with a shared budget and a breaker
+openai.max_retries = 0
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+CHEAP_MODEL = os.getenv("CHEAP_MODEL", "gpt-4o-mini")
+
+# Backend for regular summaries and for the cheap triage route (see app.triage)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+CHEAP_BACKEND = os.getenv("CHEAP_BACKEND", "") or LLM_BACKEND
+
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+# USD per 1000 prompt / completion tokens
+OPENAI_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+}
+
+# llama.cpp (`llama-server`), vLLM, Ollama and similar speak the OpenAI API
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+# A CPU server handles only a few requests at a time
+LOCAL_LLM_CONCURRENCY = int(os.getenv("LOCAL_LLM_CONCURRENCY", "2"))
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "120"))
+
+
+class LLMBackend:
+    """A completion function with its limits and prices.
+
+    Instances are called like `ranker.openai_complete` and return the reply
+    text. At most `max_concurrency` calls run at once; extra callers wait.
+    Transient errors are retried within `timeout`, and once too many calls
+    fail the breaker fails calls fast with CircuitOpenError.
+    """
+    name = "base"
+    model = SUMMARY_MODEL
+    cheap_model = SUMMARY_MODEL
+    max_concurrency = 1
+    # USD per 1000 prompt / completion tokens
+    prompt_price = 0.0
+    completion_price = 0.0
+
+    def __init__(self):
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker(f"LLM backend {self.name}")
+
+    def __call__(self, messages, model=None, temperature=0.2, max_tokens=300, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._slots:
+            try:
+                with stage("llm"):
+                    reply = call_with_retry(self.complete, messages, model or self.model, temperature, max_tokens,
+                                            timeout, breaker=self.breaker, deadline=deadline)
+            except Exception:
+                add(llm_calls_total, 1, "llm_failures", backend=self.name, outcome="error")
+                raise
+            add(llm_calls_total, 1, "llm_calls", backend=self.name, outcome="ok")
+            return reply
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        raise NotImplementedError
+
+    def prices(self, model):
+        return self.prompt_price, self.completion_price
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        """Estimated USD cost of one call."""
+        prompt_price, completion_price = self.prices(model or self.model)
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def info(self):
+        return {
+            "name": self.name,
+            "model": self.model,
+            "cheap_model": self.cheap_model,
+            "max_concurrency": self.max_concurrency,
+            "prompt_price_per_1k": self.prices(self.model)[0],
+            "completion_price_per_1k": self.prices(self.model)[1],
+            "breaker": self.breaker.stats(),
+        }
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+    model = SUMMARY_MODEL
+    cheap_model = CHEAP_MODEL
+    max_concurrency = OPENAI_CONCURRENCY
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        if openai_limiter:
+            openai_limiter.acquire()
+        # Passing timeout=None to the client would disable its default timeout
+        extra = {"timeout": timeout} if timeout else {}
+        response = openai.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+        return response.choices[0].message.content.strip()
+
+    def prices(self, model):
+        return OPENAI_PRICES.get(model, OPENAI_PRICES["gpt-3.5-turbo"])
+
+
+class LocalBackend(LLMBackend):
+    """An OpenAI-compatible server on this machine; serves one model and costs nothing per token."""
+    name = "local"
+    model = LOCAL_LLM_MODEL
+    cheap_model = LOCAL_LLM_MODEL
+    max_concurrency = LOCAL_LLM_CONCURRENCY
+
+    def __init__(self, base_url=LOCAL_LLM_URL):
+        super().__init__()
+        self.client = openai.OpenAI(base_url=base_url, api_key=os.getenv("LOCAL_LLM_API_KEY", "local"),
+                                    timeout=LOCAL_LLM_TIMEOUT, max_retries=0)
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        extra = {"timeout": timeout} if timeout else {}
+        response = self.client.chat.completions.create(
+            model=self.model,  # The server decides; names of hosted models mean nothing here
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+        return response.choices[0].message.content.strip()
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic offline answers (see fakes.FakeCompletion) for tests, CI and benchmarks."""
+    name = "fake"
+    model = "fake"
+    cheap_model = "fake"
+    max_concurrency = 64
+
+    def __init__(self, latency=0.0, fail_every=0):
+        from .fakes import FakeCompletion
+        super().__init__()
+        self.fake = FakeCompletion(latency, fail_every)
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        return self.fake(messages, model, temperature, max_tokens, timeout)
+
+
+BACKENDS = {"openai": OpenAIBackend, "local": LocalBackend, "fake": FakeBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name=None):
+    """The shared backend instance called `name` (LLM_BACKEND by default)."""
+    name = name or LLM_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown LLM backend {name!r}; expected one of {', '.join(BACKENDS)}")
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def backend_for(cheap=False):
+    """Backend of the regular or the cheap summary route."""
+    return get_backend(CHEAP_BACKEND if cheap else LLM_BACKEND)
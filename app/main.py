@@ -1,10 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import json, os
-from .gmail_service import gmail_build, send_email_summary
-from .ranker import summarize
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from datetime import datetime
+import asyncio, json, os, secrets
+from .gmail_service import gmail_build
+from .engine import iter_summaries, token_report, triage_report
+from .cache import get_summary_cache
+from .pipeline import (DIGEST_PDF, collect_messages, apply_result, deliver, presummarize, run_digest,
+                       run_stored_digest)
+from .pdf_builder import close_pdf_pool, render_pdf_async
+from .digest_store import get_digest_store
+from .dispatch import close_smtp_pool
+from .jobs import JobQueue
+from .llm import backend_for
+from .metrics import render as render_metrics, runs_total, start_trace
+from .push import PUSH_TOPIC, PUSH_TOKEN, PushCoalescer, WatchRenewer, account_for, parse_notification, start_watch
+from .ratelimit import gmail_limiter
+from .resilience import start_run_budget
+from .scheduler import DigestScheduler
+from .accounts import token_path
 import traceback
 
 app = FastAPI()
@@ -18,92 +33,305 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class EmailResponse(BaseModel):
-    subject: str
-    from_: str
-    summary: str
-    error: Optional[str] = None
+# Run digests for every stored account on a schedule
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "").lower() in ("1", "true", "yes")
+# "store": scheduled digests only render the cards pre-summarized into the digest store (push or /ingest)
+DIGEST_SOURCE = os.getenv("DIGEST_SOURCE", "live")
+
+async def run_digest_job(job):
+    start_trace()
+    service = await run_in_threadpool(gmail_build, job.mailbox)
+    if not service:
+        raise RuntimeError("Failed to initialize Gmail service")
+    return await run_digest(service, job.options.get("incremental", False), on_progress=job.progress,
+                            account=job.mailbox, pdf=job.options.get("pdf", DIGEST_PDF))
+
+async def run_scheduled_digest(account):
+    start_trace()
+    service = await run_in_threadpool(gmail_build, account)
+    if not service:
+        raise RuntimeError("Failed to initialize Gmail service")
+    if DIGEST_SOURCE == "store":
+        return await run_stored_digest(service, account)
+    return await run_digest(service, incremental=True, account=account)
+
+# One pre-summarization per account at a time: /ingest and coalesced push runs
+# read the same history and would otherwise summarize its mail twice
+_presummary_locks = {}
+
+async def run_push_presummary(account):
+    async with _presummary_locks.setdefault(account, asyncio.Lock()):
+        start_trace()
+        service = await run_in_threadpool(gmail_build, account)
+        if not service:
+            raise RuntimeError("Failed to initialize Gmail service")
+        return await presummarize(service, account)
+
+async def watch_account(account):
+    service = await run_in_threadpool(gmail_build, account)
+    if not service:
+        raise RuntimeError("Failed to initialize Gmail service")
+    return await run_in_threadpool(start_watch, service, account, limiter=gmail_limiter(account))
+
+job_queue = JobQueue(run_digest_job)
+scheduler = None
+push_coalescer = None
+watch_renewer = None
+
+@app.on_event("startup")
+async def start_background_workers():
+    global scheduler, push_coalescer, watch_renewer
+    await job_queue.start()
+    if SCHEDULER_ENABLED:
+        scheduler = DigestScheduler(run_scheduled_digest)
+        await scheduler.start()
+    push_coalescer = PushCoalescer(run_push_presummary)
+    # Without a topic nothing is watched, but /push/gmail still accepts notifications
+    if PUSH_TOPIC:
+        watch_renewer = WatchRenewer(watch_account)
+        await watch_renewer.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await job_queue.stop()
+    if scheduler:
+        await scheduler.stop()
+    if watch_renewer:
+        await watch_renewer.stop()
+    if push_coalescer:
+        await push_coalescer.stop()
+    close_smtp_pool()
+    close_pdf_pool()
 
 @app.get("/")
 async def root():
     return {"status": "Email Analysis Service is running"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    cache = get_summary_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latencies, Gmail and LLM traffic, cache hits and errors in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/llm")
+async def llm_backends():
+    """Backends of the regular and the cheap summary route with their limits, prices and breaker state."""
+    return {"full": backend_for().info(), "cheap": backend_for(cheap=True).info()}
+
 @app.post("/run")
-async def run_analysis():
+async def run_analysis(incremental: bool = False, pdf: bool = False):
+    """Summarize the latest emails and mail the digest.
+
+    With `?incremental=true` only emails that arrived since the previous
+    incremental run are summarized; `?pdf=true` attaches a PDF copy.
+    """
     try:
+        start_trace()
         # Get Gmail service
-        service = gmail_build()
+        service = await run_in_threadpool(gmail_build)
         if not service:
             raise HTTPException(status_code=500, detail="Failed to initialize Gmail service")
 
-        # Get messages
-        results = service.users().messages().list(userId='me', maxResults=10).execute()
-        messages = results.get('messages', [])
-
-        if not messages:
-            return {"message": "No emails found", "summaries": []}
-
-        summaries = []
-        user_email = None  # Store user's email
-
-        for msg in messages:
-            try:
-                # Get full message details
-                full_msg = service.users().messages().get(userId='me', id=msg['id']).execute()
-                
-                # Get headers
-                headers = full_msg.get('payload', {}).get('headers', [])
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
-                from_ = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
-                
-                # Get the user's email from the 'to' field of any message
-                if not user_email:
-                    user_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), None)
-                    if user_email and '<' in user_email:
-                        user_email = user_email[user_email.find('<')+1:user_email.find('>')]
-                
-                # Get summary
-                summary = summarize(full_msg)
-                
-                summary_obj = EmailResponse(
-                    subject=subject,
-                    from_=from_,
-                    summary=summary
-                )
-                summaries.append(summary_obj)
-                
-            except Exception as e:
-                # Log the error but continue processing other emails
-                summaries.append(EmailResponse(
-                    subject="Error Processing Email",
-                    from_="System",
-                    summary="Failed to process this email",
-                    error=str(e)
-                ))
-
-        # Convert summaries to dict for email sending
-        summary_dicts = [s.dict() for s in summaries]
-        
-        # If we don't have user_email from messages, try to get it from environment
-        if not user_email:
-            user_email = os.getenv('USER_EMAIL')  # Make sure to set this in your .env file
-        
-        # Send email summary if we have the user's email
-        if user_email:
-            send_success = send_email_summary(service, user_email, summary_dicts)
-            return {
-                "message": f"Analysis complete and summary sent to {user_email}" if send_success else "Analysis complete but failed to send email",
-                "summaries": summary_dicts,
-                "email_sent": send_success,
-                "sent_to": user_email
-            }
-        else:
-            return {
-                "message": "Analysis complete but couldn't determine email address to send to",
-                "summaries": summary_dicts,
-                "email_sent": False
-            }
+        return await run_digest(service, incremental, pdf=pdf or DIGEST_PDF)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+@app.post("/run/stream")
+async def run_analysis_stream(incremental: bool = False, pdf: bool = False):
+    """Same as /run but streams NDJSON events.
 
+    Each email becomes a `{"type": "summary", "index": ...}` line as soon as
+    its summary is ready (in completion order, `index` is the position in
+    the digest). The last line is `{"type": "done", ...}` with the send
+    status, or `{"type": "error", ...}` if the run failed midway.
+    """
+    try:
+        budget = start_run_budget()
+        trace = start_trace()
+        service = await run_in_threadpool(gmail_build)
+        if not service:
+            raise HTTPException(status_code=500, detail="Failed to initialize Gmail service")
+        summaries, pending, user_email, fetch = await run_in_threadpool(collect_messages, service, incremental)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        try:
+            if not summaries:
+                runs_total.inc(outcome="empty")
+                yield _ndjson({"type": "done", "message": "No emails found", "email_sent": False,
+                               "trace": trace.summary()})
+                return
+
+            # Emails that failed to fetch are final already
+            waiting = {position for position, _ in pending}
+            for position, summary in enumerate(summaries):
+                if position not in waiting:
+                    yield _ndjson({"type": "summary", "index": position, **summary.dict()})
+
+            results = []
+            async for result in iter_summaries([full_msg for _, full_msg in pending]):
+                results.append(result)
+                position = pending[result.index][0]
+                apply_result(summaries[position], result)
+                yield _ndjson({"type": "summary", "index": position, **summaries[position].dict()})
+
+            summary_dicts = [s.dict() for s in summaries]
+            pdf_bytes = await render_pdf_async(summary_dicts) if pdf or DIGEST_PDF else None
+            outcome = await run_in_threadpool(deliver, service, user_email, summary_dicts, None, pdf_bytes)
+            runs_total.inc(outcome="sent" if outcome["email_sent"] else "not_sent")
+            yield _ndjson({"type": "done", **outcome, "triage": triage_report(results), "fetch": fetch,
+                           "tokens": token_report(results), "retries": budget.spent, "trace": trace.summary()})
+        except Exception as e:
+            traceback.print_exc()
+            yield _ndjson({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def create_job(incremental: bool = False, mailbox: str = "me", pdf: bool = False):
+    """Queue a digest run and return its job ID right away.
+
+    A job already queued or running for the same mailbox is returned
+    instead of starting a second one.
+    """
+    try:
+        token_path(mailbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job, created = job_queue.submit(mailbox, incremental=incremental, pdf=pdf or DIGEST_PDF)
+    return {"job_id": job.id, "status": job.status, "deduplicated": not created}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs")
+async def job_stats():
+    return job_queue.stats()
+
+@app.get("/scheduler")
+async def scheduler_status():
+    if scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **scheduler.status()}
+
+@app.post("/ingest")
+async def ingest(mailbox: str = "me"):
+    """Pre-summarize the mail that arrived since the last ingest into the digest store.
+
+    Push notifications do this on their own; without them, call this
+    endpoint every so often to spread the LLM work over the day.
+    """
+    try:
+        token_path(mailbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await run_push_presummary(mailbox)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/digest")
+async def stored_digest(mailbox: str = "me"):
+    """The cards the next digest from the store would send, in rank order."""
+    store = get_digest_store()
+    summaries, _ = await run_in_threadpool(store.pending, mailbox)
+    return {"summaries": summaries, **store.stats(mailbox)}
+
+@app.get("/digest/pdf")
+async def stored_digest_pdf(mailbox: str = "me"):
+    """The next digest from the store as a PDF download; nothing is marked sent."""
+    store = get_digest_store()
+    summaries, _ = await run_in_threadpool(store.pending, mailbox)
+    try:
+        content = await render_pdf_async(summaries)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+    filename = f"email_digest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    return Response(content, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/digest/send")
+async def send_stored_digest(mailbox: str = "me", pdf: bool = False):
+    """Render and send the digest from the store; no fetching or summarizing at send time."""
+    try:
+        token_path(mailbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        start_trace()
+        service = await run_in_threadpool(gmail_build, mailbox)
+        if not service:
+            raise HTTPException(status_code=500, detail="Failed to initialize Gmail service")
+        return await run_stored_digest(service, mailbox, pdf=pdf or DIGEST_PDF)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/push/gmail", status_code=204)
+async def gmail_push(request: Request, token: str = ""):
+    """Pub/Sub push endpoint for Gmail notifications.
+
+    Notifications are coalesced per account (see app.push) and each burst
+    pre-summarizes the new mail, so the next digest finds it ready.
+    Requests must carry `?token=` matching PUSH_TOKEN; without PUSH_TOKEN
+    every request is rejected. Anything that passes the check is
+    acknowledged, otherwise Pub/Sub keeps redelivering it.
+    """
+    # Every accepted notification can start paid LLM work, so there is no unauthenticated mode
+    if not PUSH_TOKEN:
+        raise HTTPException(status_code=403, detail="Push notifications are disabled; set PUSH_TOKEN")
+    if not secrets.compare_digest(token, PUSH_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    try:
+        email, history_id = parse_notification(await request.json())
+    except ValueError as e:
+        print(f"Ignoring push request: {e}")
+        return Response(status_code=204)
+    account = account_for(email)
+    if account is None:
+        print(f"Ignoring push notification for unknown mailbox {email}")
+    elif push_coalescer is not None:
+        push_coalescer.notify(account, history_id)
+    return Response(status_code=204)
+
+@app.post("/push/watch")
+async def renew_watches():
+    """Register (or renew) the Gmail watch of every stored account now."""
+    if not PUSH_TOPIC:
+        raise HTTPException(status_code=400, detail="PUSH_TOPIC is not set")
+    renewer = watch_renewer or WatchRenewer(watch_account)
+    await renewer.renew()
+    return renewer.watches
+
+@app.get("/push")
+async def push_status():
+    return {
+        "enabled": bool(PUSH_TOPIC),
+        "watches": watch_renewer.watches if watch_renewer else {},
+        **(push_coalescer.status() if push_coalescer else {}),
+    }
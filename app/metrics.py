@@ -0,0 +1,188 @@
+"""Prometheus-style counters and histograms, and a per-run trace of the digest stages."""
+import bisect, collections, contextlib, contextvars, threading, time
+
+# Pipeline stages, in the order a digest run goes through them
+STAGES = ("auth", "list", "fetch", "extract", "triage", "llm", "render", "send")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {value:g}" for key, value in sorted(items)]
+
+
+class Histogram:
+    """Observations counted into cumulative `le` buckets, with their sum."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in sorted(items):
+            cumulative = 0
+            for bound, observed in zip(self.buckets + ("+Inf",), series):
+                cumulative += observed
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-1]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram("digest_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+errors_total = Counter("digest_errors_total", "Errors by pipeline stage and exception type", ["stage", "type"])
+runs_total = Counter("digest_runs_total", "Finished digest runs", ["outcome"])
+gmail_calls_total = Counter("gmail_calls_total", "Gmail API calls by method", ["method"])
+fetched_bytes_total = Counter("gmail_fetched_bytes_total", "Bytes of message resources fetched", ["format"])
+llm_calls_total = Counter("llm_calls_total", "LLM calls by backend and outcome", ["backend", "outcome"])
+llm_tokens_total = Counter("llm_tokens_total", "Tokens sent to and received from the LLM; tokenizer=\"estimate\" "
+                           "means counted without tiktoken", ["kind", "tokenizer"])
+cache_lookups_total = Counter("summary_cache_lookups_total", "Summary cache lookups", ["result"])
+
+
+class RunTrace:
+    """Stage timings and counts of one digest run, returned with its response."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds, error=False):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "errors": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += 1
+            stage["errors"] += bool(error)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def summary(self):
+        """Seconds per stage in pipeline order, the slowest stage and the run's counts.
+
+        Stages overlap: LLM calls run concurrently, so their seconds can add
+        up to more than the run took.
+        """
+        with self._lock:
+            stages = {name: dict(self.stages[name], seconds=round(self.stages[name]["seconds"], 4))
+                      for name in STAGES if name in self.stages}
+            counts = dict(self.counts)
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+            "slowest_stage": max(stages, key=lambda name: stages[name]["seconds"]) if stages else None,
+            "counts": counts,
+        }
+
+
+_trace = contextvars.ContextVar("run_trace", default=None)
+
+
+def start_trace():
+    """Give the current task a fresh RunTrace; threads and the summary engine inherit it."""
+    trace = RunTrace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def record_error(stage_name, error):
+    """Count an error that was handled inside a stage, e.g. one failed item of a batch."""
+    errors_total.inc(stage=stage_name, type=type(error).__name__)
+    trace = _trace.get()
+    if trace is not None:
+        trace.count(f"{stage_name}_errors")
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the block as pipeline stage `name`; exceptions are counted by type and re-raised."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        errors_total.inc(stage=name, type=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed, error is not None)
+
+
+def add(metric, amount=1, trace_key=None, **labels):
+    """Increment `metric` and, under `trace_key`, the current run's trace."""
+    metric.inc(amount, **labels)
+    trace = _trace.get()
+    if trace is not None and trace_key:
+        trace.count(trace_key, amount)
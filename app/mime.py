@@ -0,0 +1,107 @@
+"""Readable text from Gmail API message payloads."""
+import base64, codecs, html, os, re
+
+# Characters of body text decoded for the summary prompt; app.budget then
+# picks what fits the token budget
+BODY_CHAR_BUDGET = int(os.getenv("BODY_CHAR_BUDGET", "6000"))
+# Characters of HTML decoded per character of wanted text before stripping
+HTML_OVERSCAN = 8
+
+_CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+_DROP_RE = re.compile(r"<!--.*?-->|<(script|style|head|title)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_BREAK_RE = re.compile(r"<(?:br|/p|/div|/tr|/li|/h[1-6]|/table)\b[^>]*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]*>")
+_SPACE_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+_BLANK_RE = re.compile(r"\s*\n\s*")
+
+
+def _header(part, name):
+    for header in part.get("headers", []):
+        if header.get("name", "").lower() == name:
+            return header.get("value", "")
+    return ""
+
+
+def _charset(part):
+    match = _CHARSET_RE.search(_header(part, "content-type"))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def iter_parts(payload):
+    """Every part of the MIME tree in document order, without recursion."""
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        yield part
+        stack.extend(reversed(part.get("parts", [])))
+
+
+def is_attachment(part):
+    return bool(part.get("filename")) or _header(part, "content-disposition").lower().startswith("attachment")
+
+
+def decode_data(data, charset="utf-8", max_chars=None):
+    """Decode base64url body data, stopping once `max_chars` characters are available.
+
+    Returns `(text, complete)`; `complete` is False when data was left undecoded.
+    """
+    complete = True
+    if max_chars is not None:
+        # Four bytes cover any character in UTF-8; base64 works in 4-char groups
+        wanted = -(-max_chars * 4 // 3) * 4
+        if wanted < len(data):
+            data, complete = data[:wanted], False
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    text = raw.decode(charset, errors="replace")
+    if not complete:
+        text = text[:max_chars]
+    return text, complete
+
+
+def html_to_text(markup):
+    """Visible text of an HTML fragment; a cut-off tag at the end is dropped."""
+    cut = markup.rfind("<")
+    if cut > markup.rfind(">"):
+        markup = markup[:cut]
+    markup = _DROP_RE.sub(" ", markup)
+    markup = _BREAK_RE.sub("\n", markup)
+    text = html.unescape(_TAG_RE.sub(" ", markup))
+    text = _SPACE_RE.sub(" ", text)
+    return _BLANK_RE.sub("\n", text).strip()
+
+
+def _html_text(part, max_chars):
+    data = part["body"]["data"]
+    if max_chars is None:
+        return html_to_text(decode_data(data, _charset(part))[0])
+    markup, complete = decode_data(data, _charset(part), max_chars * HTML_OVERSCAN)
+    text = html_to_text(markup)
+    if len(text) < max_chars and not complete:
+        # Markup-heavy mail: strip the whole part after all
+        text = html_to_text(decode_data(data, _charset(part))[0])
+    return text[:max_chars]
+
+
+def extract_body(message, max_chars=None):
+    """Plain text of `message`, preferring text/plain over text/html parts.
+
+    At most `max_chars` characters are decoded (all of them when None);
+    returns "" when the message has no readable text part.
+    """
+    html_part = None
+    for part in iter_parts(message.get("payload", {})):
+        mime_type = part.get("mimeType", "")
+        if not part.get("body", {}).get("data") or is_attachment(part):
+            continue
+        if mime_type == "text/plain":
+            return decode_data(part["body"]["data"], _charset(part), max_chars)[0]
+        if mime_type == "text/html" and html_part is None:
+            html_part = part
+    if html_part is not None:
+        return _html_text(html_part, max_chars)
+    return ""
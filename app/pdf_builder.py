@@ -1,49 +1,146 @@
-from reportlab.lib import colors
+"""PDF rendering of the digest, to memory or to uniquely named files, optionally in a process pool."""
+import asyncio, functools, io, multiprocessing, os, tempfile, threading
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+import reportlab
 from datetime import datetime
+from xml.sax.saxutils import escape
+from .metrics import stage
+from .summary import as_record
 
-def build_pdf(summaries):
-    """Build a PDF report from email summaries."""
-    filename = f"email_digest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    doc = SimpleDocTemplate(filename, pagesize=letter)
+# A TTF with Turkish glyphs; the base 14 PDF fonts have no ş, ğ or ı
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", "")
+PDF_BOLD_FONT_PATH = os.getenv("PDF_BOLD_FONT_PATH", "")
+# Where build_pdf writes files
+PDF_DIR = os.getenv("PDF_DIR", "") or tempfile.gettempdir()
+# Worker processes for building many PDFs at once; 0 builds in the calling thread
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_FONT_CANDIDATES = [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/TTF/DejaVuSans.ttf", "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf"),
+    # Bitstream Vera ships with reportlab, so there is always a Unicode font
+    (os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf"),
+     os.path.join(os.path.dirname(reportlab.__file__), "fonts", "VeraBd.ttf")),
+]
+
+
+def _font_files():
+    if PDF_FONT_PATH:
+        return PDF_FONT_PATH, PDF_BOLD_FONT_PATH or PDF_FONT_PATH
+    return next((regular, bold) for regular, bold in _FONT_CANDIDATES if os.path.exists(regular))
+
+
+@functools.lru_cache(maxsize=None)
+def digest_styles():
+    """The digest's paragraph styles, with the Unicode font registered; built once per process."""
+    regular, bold = _font_files()
+    pdfmetrics.registerFont(TTFont("DigestSans", regular))
+    pdfmetrics.registerFont(TTFont("DigestSans-Bold", bold if os.path.exists(bold) else regular))
+    # Lets <b> in paragraphs switch to the bold face
+    pdfmetrics.registerFontFamily("DigestSans", normal="DigestSans", bold="DigestSans-Bold",
+                                  italic="DigestSans", boldItalic="DigestSans-Bold")
     styles = getSampleStyleSheet()
-    
-    # Create custom styles only if they don't exist
-    if 'CustomHeading1' not in styles:
-        styles.add(ParagraphStyle(
-            name='CustomHeading1',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30
-        ))
-    
-    if 'CustomNormal' not in styles:
-        styles.add(ParagraphStyle(
-            name='CustomNormal',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=12
-        ))
-    
-    # Build the document
-    story = []
-    
-    # Add title
-    title = Paragraph(
-        f"Email Digest Report - {datetime.now().strftime('%Y-%m-%d')}",
-        styles['CustomHeading1']
-    )
-    story.append(title)
-    story.append(Spacer(1, 12))
-    
-    # Add each summary
+    return {
+        "heading": ParagraphStyle(name='CustomHeading1', parent=styles['Heading1'], fontName="DigestSans-Bold",
+                                  fontSize=24, spaceAfter=30),
+        "normal": ParagraphStyle(name='CustomNormal', parent=styles['Normal'], fontName="DigestSans",
+                                 fontSize=12, leading=15, spaceAfter=12),
+    }
+
+
+def _card(summary, style):
+    record = as_record(summary['summary'])
+    lines = [
+        f"<b>{escape(summary.get('subject', ''))}</b> — {escape(summary.get('from_', ''))}",
+        f"Öncelik: {record.priority} ({record.priority_label})",
+        f"Özet: {escape(record.text)}",
+        f"Yapılması Gereken: {escape(record.action or 'İşlem gerekmiyor')}",
+        f"Son Tarih: {escape(record.deadline or 'Son tarih yok')}",
+        f"Kategori: {escape(record.category)}",
+    ]
+    return Paragraph("<br/>".join(lines), style)
+
+
+def render_pdf(summaries, out=None, created_at=None):
+    """Write the digest PDF of `summaries` to the binary file object `out`.
+
+    Without `out` the PDF is built in memory and returned as bytes.
+    """
+    styles = digest_styles()
+    created_at = created_at or datetime.now()
+    buffer = out or io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, title="Email Digest", invariant=True)
+    story = [Paragraph(f"Email Digest Report - {created_at.strftime('%Y-%m-%d')}", styles["heading"]),
+             Spacer(1, 12)]
     for summary in summaries:
-        p = Paragraph(summary.replace('\n', '<br/>'), styles['CustomNormal'])
-        story.append(p)
+        story.append(_card(summary, styles["normal"]))
         story.append(Spacer(1, 12))
-    
-    # Generate PDF
     doc.build(story)
+    return None if out else buffer.getvalue()
+
+
+def build_pdf(summaries, directory=None):
+    """Build a PDF report from digest entries (subject, from_ and a structured summary).
+
+    The file gets a unique name in `directory` (PDF_DIR by default), so
+    concurrent builds never overwrite each other; returns its path.
+    """
+    prefix = f"email_digest_{datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+    fd, filename = tempfile.mkstemp(prefix=prefix, suffix=".pdf", dir=directory or PDF_DIR)
+    with os.fdopen(fd, "wb") as f:
+        render_pdf(summaries, f)
     return filename
+
+
+# Forking a process that runs threads (the API, SQLite stores) is not safe
+_spawn = multiprocessing.get_context("spawn")
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    """The shared process pool for PDF builds, or None when PDF_WORKERS is 0."""
+    global _pool
+    with _pool_lock:
+        if _pool is None and PDF_WORKERS > 0:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=_spawn)
+    return _pool
+
+
+def close_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+async def render_pdf_async(summaries):
+    """render_pdf in the process pool, so layout does not hold the GIL of the API process."""
+    pool = get_pdf_pool()
+    loop = asyncio.get_running_loop()
+    # Worker processes get plain dicts; they render and return bytes
+    entries = [dict(s, summary=as_record(s['summary']).model_dump()) for s in summaries]
+    with stage("render"):
+        return await loop.run_in_executor(pool, render_pdf, entries)
+
+
+def build_pdfs(digests, workers=None):
+    """PDF bytes for many digests at once, e.g. one per account.
+
+    `digests` maps a key to its summaries; the result maps the same keys
+    to PDF bytes. Builds run in `workers` processes (PDF_WORKERS by
+    default), each of which sets up fonts and styles only once.
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    keys = list(digests)
+    entries = [[dict(s, summary=as_record(s['summary']).model_dump()) for s in digests[k]] for k in keys]
+    if workers <= 0 or len(keys) <= 1:
+        return {key: render_pdf(e) for key, e in zip(keys, entries)}
+    with ProcessPoolExecutor(max_workers=min(workers, len(keys)), mp_context=_spawn) as pool:
+        return dict(zip(keys, pool.map(render_pdf, entries)))
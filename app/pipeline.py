@@ -0,0 +1,318 @@
+"""The digest pipeline shared by /run, /run/stream and background jobs."""
+import os
+from dataclasses import asdict
+from typing import Optional
+from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from .accounts import DEFAULT_ACCOUNT
+from .engine import iter_summaries, token_report, triage_report
+from .digest_store import DIGEST_MAX_CARDS, get_digest_store
+from .dispatch import recipients_for
+from .gmail_service import send_email_summaries, fetch_full, fetch_metadata, get_header, response_bytes
+from .pdf_builder import render_pdf_async
+from .push import push_sync_key
+from .metrics import add, current_trace, fetched_bytes_total, record_error, runs_total, stage, start_trace
+from .ratelimit import gmail_acquire, gmail_limiter
+from .resilience import call_with_retry, start_run_budget
+from .summary import SummaryRecord
+from .sync import sync_messages
+from .threads import THREAD_DIGEST, get_thread_store, group_threads, thread_message
+from .triage import TEMPLATE, TRIAGE_ENABLED, triage
+
+# How many of the latest emails one digest covers
+DIGEST_SIZE = int(os.getenv("DIGEST_SIZE", "10"))
+# Messages pre-summarized per history read (see presummarize)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+# Attach a PDF copy to every digest mail
+DIGEST_PDF = os.getenv("DIGEST_PDF", "").lower() in ("1", "true", "yes")
+
+
+class EmailResponse(BaseModel):
+    subject: str
+    from_: str
+    summary: SummaryRecord
+    error: Optional[str] = None
+    latency: Optional[float] = None  # Seconds spent summarizing
+    route: Optional[str] = None  # template, cheap or full, see app.triage
+
+
+def plan_fetch(service, message_ids, limiter=None, use_triage=None):
+    """Fetch metadata for every message and bodies only where the LLM needs them.
+
+    Mail that triage routes to a template summary keeps its metadata
+    resource, which has everything `template_summary` reads. Returns
+    `(messages, errors, stats)` like fetch_messages plus response sizes.
+    """
+    use_triage = TRIAGE_ENABLED if use_triage is None else use_triage
+    if not use_triage:
+        with stage("fetch"):
+            messages, errors = fetch_full(service, message_ids, limiter)
+        full_bytes = response_bytes(messages)
+        return messages, errors, fetch_stats(len(message_ids), 0, 0, len(message_ids), full_bytes, errors)
+
+    with stage("fetch"):
+        messages, errors = fetch_metadata(service, message_ids, limiter)
+    metadata_bytes = response_bytes(messages)
+    with stage("triage"):
+        wanted = [i for i, message in enumerate(messages)
+                  if message is not None and triage(message).route != TEMPLATE]
+    with stage("fetch"):
+        full_msgs, full_errors = fetch_full(service, [message_ids[i] for i in wanted], limiter)
+    for i, full_msg in zip(wanted, full_msgs):
+        messages[i] = full_msg
+    errors.update(full_errors)
+    return messages, errors, fetch_stats(len(message_ids), len(message_ids), metadata_bytes, len(wanted),
+                                         response_bytes(full_msgs), errors)
+
+
+def fetch_stats(total, metadata_count, metadata_bytes, full_count, full_bytes, errors=None):
+    add(fetched_bytes_total, metadata_bytes, "fetched_bytes", format="metadata")
+    add(fetched_bytes_total, full_bytes, "fetched_bytes", format="full")
+    for error in (errors or {}).values():
+        record_error("fetch", error)
+    return {
+        "messages": total,
+        "metadata": {"messages": metadata_count, "bytes": metadata_bytes},
+        "full": {"messages": full_count, "bytes": full_bytes},
+        "bytes_per_message": round((metadata_bytes + full_bytes) / total) if total else 0,
+    }
+
+
+def collect_messages(service, incremental=False, max_results=None, limiter=None, account=None):
+    """List and fetch the emails of one digest.
+
+    Returns `(summaries, pending, user_email, fetch)`: `summaries` has one
+    EmailResponse per email (already final for emails that failed to
+    fetch), `pending` pairs a position in `summaries` with the message
+    still waiting to be summarized and `fetch` has the response sizes of
+    plan_fetch. Gmail calls are charged to `limiter` (see app.ratelimit)
+    and threads are tracked per `account` (see app.threads).
+    """
+    max_results = max_results or DIGEST_SIZE
+
+    # Get messages
+    with stage("list"):
+        if incremental:
+            messages, _ = sync_messages(service, max_results=max_results, limiter=limiter)
+        else:
+            gmail_acquire(limiter, "messages.list")
+            results = call_with_retry(service.users().messages().list(userId='me', maxResults=max_results).execute)
+            messages = results.get('messages', [])
+
+    summaries = []
+    user_email = None  # Store user's email
+    pending = []  # (position in summaries, message) waiting for the LLM
+    if not messages:
+        return summaries, pending, user_email, fetch_stats(0, 0, 0, 0, 0)
+
+    # Metadata for all, bodies for the emails the LLM will read, in batched round trips
+    full_msgs, fetch_errors, fetch = plan_fetch(service, [msg['id'] for msg in messages], limiter)
+
+    # One card per conversation: the thread's card sits where its newest message was listed
+    threads = {}
+    if THREAD_DIGEST:
+        for thread in group_threads([m for m in full_msgs if m is not None]):
+            threads[thread[-1]['id']] = thread_message(thread, account)
+
+    for msg, full_msg in zip(messages, full_msgs):
+        try:
+            if full_msg is None:
+                raise fetch_errors[msg['id']]
+            if THREAD_DIGEST and full_msg['id'] not in threads:
+                continue  # Covered by its thread's card
+
+            # Get headers
+            headers = full_msg.get('payload', {}).get('headers', [])
+            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
+            from_ = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown Sender')
+
+            # Get the user's email from the 'to' field of any message
+            if not user_email:
+                user_email = next((h['value'] for h in headers if h['name'].lower() == 'to'), None)
+                if user_email and '<' in user_email:
+                    user_email = user_email[user_email.find('<')+1:user_email.find('>')]
+
+            # Summary is filled in once the LLM call finishes
+            summaries.append(EmailResponse(subject=subject, from_=from_, summary=SummaryRecord(source_ids=[msg['id']])))
+            pending.append((len(summaries) - 1, threads.get(full_msg['id'], full_msg)))
+
+        except Exception as e:
+            # Log the error but continue processing other emails
+            summaries.append(EmailResponse(
+                subject="Error Processing Email",
+                from_="System",
+                summary=SummaryRecord(category="Sistem Hatası", text="Failed to process this email",
+                                      source_ids=[msg['id']]),
+                error=str(e)
+            ))
+
+    return summaries, pending, user_email, fetch
+
+
+def apply_result(summary, result):
+    """Copy an engine SummaryResult onto its EmailResponse."""
+    summary.summary = result.summary
+    summary.error = result.error
+    summary.latency = round(result.latency, 3)
+    summary.route = result.route
+
+
+def deliver(service, user_email, summary_dicts, limiter=None, pdf=None):
+    """Mail the digest (with the `pdf` bytes attached, if any) and describe the outcome for the API response."""
+    # If we don't have user_email from messages, try to get it from environment
+    if not user_email:
+        user_email = os.getenv('USER_EMAIL')  # Make sure to set this in your .env file
+
+    # Send email summary if we have the user's email (and to DIGEST_RECIPIENTS)
+    if user_email:
+        recipients = recipients_for(user_email)
+        deliveries = send_email_summaries(service, recipients, summary_dicts, limiter, pdf=pdf)
+        failed = [d.recipient for d in deliveries if not d.ok]
+        if not failed:
+            message = f"Analysis complete and summary sent to {', '.join(recipients)}"
+        elif len(failed) < len(recipients):
+            message = f"Analysis complete but failed to send email to {', '.join(failed)}"
+        else:
+            message = "Analysis complete but failed to send email"
+        return {
+            "message": message,
+            "email_sent": not failed,
+            "sent_to": user_email,
+            "deliveries": [asdict(d) for d in deliveries]
+        }
+    return {
+        "message": "Analysis complete but couldn't determine email address to send to",
+        "email_sent": False
+    }
+
+
+async def run_digest(service, incremental=False, on_progress=None, account=None, pdf=DIGEST_PDF):
+    """Run the whole digest for one mailbox and return the /run response.
+
+    `on_progress(completed, total)` is called as summaries finish. Gmail
+    calls are rate limited per `account`. With `pdf` the digest mail
+    carries a PDF copy, built in the PDF process pool. The response's "trace" has the
+    time spent per stage (see app.metrics); callers that authenticate
+    first start the trace themselves so that "auth" is included.
+    """
+    limiter = gmail_limiter(account or DEFAULT_ACCOUNT)
+    budget = start_run_budget()
+    trace = current_trace() or start_trace()
+    summaries, pending, user_email, fetch = await run_in_threadpool(collect_messages, service, incremental, None,
+                                                                    limiter, account)
+    if not summaries:
+        runs_total.inc(outcome="empty")
+        return {"message": "No emails found", "summaries": [], "trace": trace.summary()}
+
+    total = len(summaries)
+    completed = total - len(pending)
+    if on_progress:
+        on_progress(completed, total)
+
+    # Summarize concurrently without blocking the event loop
+    results = []
+    async for result in iter_summaries([full_msg for _, full_msg in pending]):
+        results.append(result)
+        apply_result(summaries[pending[result.index][0]], result)
+        completed += 1
+        if on_progress:
+            on_progress(completed, total)
+
+    await run_in_threadpool(get_thread_store().prune)
+
+    # Convert summaries to dict for email sending
+    summary_dicts = [s.dict() for s in summaries]
+    pdf_bytes = await render_pdf_async(summary_dicts) if pdf else None
+    outcome = await run_in_threadpool(deliver, service, user_email, summary_dicts, limiter, pdf_bytes)
+    runs_total.inc(outcome="sent" if outcome["email_sent"] else "not_sent")
+    return {"message": outcome.pop("message"), "summaries": summary_dicts, **outcome,
+            "triage": triage_report(results), "fetch": fetch, "tokens": token_report(results),
+            "retries": budget.spent, "trace": trace.summary()}
+
+
+def card_for(message, result):
+    """Digest store card for a summarized message (or thread, see thread_message)."""
+    headers = message.get('payload', {}).get('headers', [])
+    return {
+        "card_id": message.get('threadId') if THREAD_DIGEST else message['id'],
+        "subject": get_header(headers, 'subject') or 'No Subject',
+        "from_": get_header(headers, 'from') or 'Unknown Sender',
+        "summary": result.summary,
+        "route": result.route,
+        "error": result.error,
+        "received_at": int(message.get('internalDate') or 0) / 1000 or None,
+    }
+
+
+async def presummarize(service, account=None, batch_size=None):
+    """Summarize the mail that arrived since the previous pre-summarization of `account`.
+
+    Called for Gmail push notifications (see app.push) and by /ingest.
+    History is read `batch_size` (INGEST_BATCH_SIZE) messages at a time
+    until it is drained, so a burst larger than one batch does not wait
+    for the next notification. The cards go to the digest store, so the
+    daily digest only has to query and render them (see run_stored_digest).
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    limiter = gmail_limiter(account or DEFAULT_ACCOUNT)
+    start_run_budget()
+    trace = current_trace() or start_trace()
+    store = get_digest_store()
+    modes, results, total = [], [], 0
+    while True:
+        with stage("list"):
+            refs, mode = await run_in_threadpool(sync_messages, service, push_sync_key(account), None, None,
+                                                 batch_size, limiter)
+        modes.append(mode)
+        total += len(refs)
+        if refs:
+            full_msgs, _, _ = await run_in_threadpool(plan_fetch, service, [ref['id'] for ref in refs], limiter)
+            fetched = [m for m in full_msgs if m is not None]
+            pending = [thread_message(thread, account) for thread in group_threads(fetched)] if THREAD_DIGEST else fetched
+            batch = []
+            async for result in iter_summaries(pending):
+                batch.append(result)
+            await run_in_threadpool(store.put, account or DEFAULT_ACCOUNT,
+                                    [card_for(pending[result.index], result) for result in batch])
+            results += batch
+        # A full listing is the first sync's seed; history resumes from there next time
+        if mode == "full" or len(refs) < batch_size:
+            break
+    await run_in_threadpool(get_thread_store().prune)
+    return {"mode": modes[0], "batches": len(modes), "messages": total,
+            "summarized": sum(r.error is None for r in results), "triage": triage_report(results),
+            "tokens": token_report(results), "trace": trace.summary()}
+
+
+def account_email(service, account=None, limiter=None):
+    """Address of `account`: its name in the token store, or Gmail's profile for the default account."""
+    if account and '@' in account:
+        return account
+    gmail_acquire(limiter, "getProfile")
+    return call_with_retry(service.users().getProfile(userId='me').execute)['emailAddress']
+
+
+async def run_stored_digest(service, account=None, limit=None, pdf=DIGEST_PDF):
+    """Send the digest from the cards already in the digest store; returns the /run-style response.
+
+    Nothing is fetched or summarized here: the cards are queried in rank
+    order, rendered and sent, and marked sent once delivered.
+    """
+    account = account or DEFAULT_ACCOUNT
+    limiter = gmail_limiter(account)
+    trace = current_trace() or start_trace()
+    store = get_digest_store()
+    summary_dicts, cards = await run_in_threadpool(store.pending, account, limit or DIGEST_MAX_CARDS)
+    if not summary_dicts:
+        runs_total.inc(outcome="empty")
+        return {"message": "No emails found", "summaries": [], "trace": trace.summary()}
+
+    user_email = await run_in_threadpool(account_email, service, account, limiter)
+    pdf_bytes = await render_pdf_async(summary_dicts) if pdf else None
+    outcome = await run_in_threadpool(deliver, service, user_email, summary_dicts, limiter, pdf_bytes)
+    if outcome["email_sent"]:
+        await run_in_threadpool(store.mark_sent, account, cards)
+        await run_in_threadpool(store.prune)
+    runs_total.inc(outcome="sent" if outcome["email_sent"] else "not_sent")
+    return {"message": outcome.pop("message"), "summaries": summary_dicts, **outcome, "source": "store",
+            "trace": trace.summary()}
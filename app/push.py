@@ -0,0 +1,175 @@
+"""Gmail push notifications: users.watch registration and Pub/Sub push handling with per-account debounce."""
+import asyncio, base64, binascii, json, os, random, time, traceback
+from .accounts import DEFAULT_ACCOUNT, list_accounts
+from .ratelimit import gmail_acquire
+from .resilience import call_with_retry
+from .sync import get_sync_store
+
+# Pub/Sub topic Gmail publishes to, e.g. projects/my-project/topics/gmail-push; push mode is off without it
+PUSH_TOPIC = os.getenv("PUSH_TOPIC", "")
+# Shared secret the push subscription sends as ?token=...; /push/gmail rejects everything without it
+PUSH_TOKEN = os.getenv("PUSH_TOKEN", "")
+PUSH_LABELS = [label.strip() for label in os.getenv("PUSH_LABELS", "INBOX").split(",") if label.strip()]
+# Notifications for one account within this many seconds start a single run
+PUSH_DEBOUNCE = float(os.getenv("PUSH_DEBOUNCE", "30"))
+PUSH_MAX_CONCURRENCY = int(os.getenv("PUSH_MAX_CONCURRENCY", "4"))
+# Watches expire after 7 days; Google recommends renewing daily
+PUSH_RENEW_HOURS = float(os.getenv("PUSH_RENEW_HOURS", "24"))
+
+
+def push_sync_key(account):
+    """Sync-state key of pre-summarization, separate from incremental /run so neither consumes the other's history."""
+    return f"push:{account or DEFAULT_ACCOUNT}"
+
+
+def start_watch(service, account=None, topic=None, labels=None, limiter=None, store=None):
+    """Register (or renew) the Gmail watch of `account`; returns Gmail's response.
+
+    The first registration also starts the push sync at the returned
+    historyId, so the first notification is answered from history.
+    """
+    gmail_acquire(limiter, "watch")
+    response = call_with_retry(service.users().watch(userId="me", body={
+        "topicName": topic or PUSH_TOPIC,
+        "labelIds": labels or PUSH_LABELS,
+        "labelFilterBehavior": "include",
+    }).execute)
+    store = store or get_sync_store()
+    if store.get(push_sync_key(account)) is None:
+        store.set(push_sync_key(account), response["historyId"])
+    return response
+
+
+def parse_notification(envelope):
+    """`(email address, history ID)` from a Pub/Sub push request body; ValueError if malformed."""
+    try:
+        data = base64.b64decode(envelope["message"]["data"])
+        payload = json.loads(data)
+        return payload["emailAddress"], int(payload["historyId"])
+    except (KeyError, TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Not a Gmail push notification: {e}") from e
+
+
+def account_for(email, accounts=list_accounts):
+    """The token-store account that receives mail for `email`, or None."""
+    known = accounts()
+    if email in known:
+        return email
+    # The original single token.pickle is not named after its address
+    return DEFAULT_ACCOUNT if known == [DEFAULT_ACCOUNT] else None
+
+
+class PushCoalescer:
+    """Runs `run_account(account)` once per burst of Gmail notifications.
+
+    The first notification for an account opens a `debounce`-second
+    window and later ones are merged into it. A notification that
+    arrives while the account's run is in progress schedules exactly one
+    more run after it, so no new mail is left unprocessed.
+    """
+
+    def __init__(self, run_account, debounce=PUSH_DEBOUNCE, max_concurrency=PUSH_MAX_CONCURRENCY):
+        self.run_account = run_account
+        self.debounce = debounce
+        self.received = 0
+        self.coalesced = 0
+        self.latest_history = {}
+        self.last_runs = {}
+        self._waiting = {}  # account -> task inside its debounce window
+        self._running = set()
+        self._again = set()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def notify(self, account, history_id=None):
+        """Note a notification; returns True when it opened a new window."""
+        self.received += 1
+        if history_id is not None:
+            self.latest_history[account] = max(history_id, self.latest_history.get(account, 0))
+        if account in self._waiting or account in self._again:
+            self.coalesced += 1
+            return False
+        if account in self._running:
+            self.coalesced += 1
+            self._again.add(account)
+            return False
+        self._schedule(account)
+        return True
+
+    def _schedule(self, account):
+        self._waiting[account] = asyncio.ensure_future(self._run(account))
+
+    async def _run(self, account):
+        try:
+            await asyncio.sleep(self.debounce)
+        except asyncio.CancelledError:
+            self._waiting.pop(account, None)
+            raise
+        del self._waiting[account]
+        self._running.add(account)
+        started = time.time()
+        try:
+            async with self._semaphore:
+                result = await self.run_account(account)
+            self.last_runs[account] = {"finished_at": time.time(), "duration": time.time() - started, "ok": True,
+                                       "result": result}
+        except Exception as e:
+            traceback.print_exc()
+            self.last_runs[account] = {"finished_at": time.time(), "duration": time.time() - started, "ok": False,
+                                       "message": str(e)}
+        finally:
+            self._running.discard(account)
+            if account in self._again:
+                self._again.discard(account)
+                self._schedule(account)
+
+    async def stop(self):
+        tasks = list(self._waiting.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self):
+        return {
+            "debounce": self.debounce,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "waiting": sorted(self._waiting),
+            "running": sorted(self._running),
+            "latest_history": self.latest_history,
+            "last_runs": self.last_runs,
+        }
+
+
+class WatchRenewer:
+    """Registers the Gmail watch of every account at start and renews it every `renew_hours`."""
+
+    def __init__(self, watch_account, accounts=list_accounts, renew_hours=PUSH_RENEW_HOURS):
+        self.watch_account = watch_account
+        self.accounts = accounts
+        self.renew_hours = renew_hours
+        self.watches = {}
+        self._task = None
+
+    async def renew(self):
+        for account in self.accounts():
+            try:
+                response = await self.watch_account(account)
+                self.watches[account] = {"ok": True, "history_id": response.get("historyId"),
+                                         "expiration": response.get("expiration")}
+            except Exception as e:
+                traceback.print_exc()
+                self.watches[account] = {"ok": False, "message": str(e)}
+
+    async def _loop(self):
+        while True:
+            await self.renew()
+            # A little jitter keeps many instances from renewing in lockstep
+            await asyncio.sleep(self.renew_hours * 3600 * random.uniform(0.9, 1.0))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -1,5 +1,12 @@
 import openai, re, email, os, base64, unicodedata, random
 from dotenv import load_dotenv
+from . import keywords
+from .budget import fit_text
+from .cache import summary_key
+from .mime import BODY_CHAR_BUDGET, extract_body
+from .llm import SUMMARY_MODEL, get_backend
+from .metrics import stage
+from .summary import SummaryRecord, parse_summary
 load_dotenv(); openai.api_key = os.getenv("OPENAI_API_KEY")
 
 def safe_decode(text):
@@ -13,8 +20,8 @@ def safe_decode(text):
         # If it's not a string, convert it
         if not isinstance(text, str):
             text = str(text)
-        # Remove any problematic characters
-        return ''.join(char for char in text if ord(char) < 128)
+        # Drop control characters (e.g. folded header line breaks) but keep Turkish letters
+        return ''.join(char for char in text if char.isprintable())
     except Exception:
         return ""
 
@@ -54,18 +61,10 @@ def sanitize_text(text):
 
 def basic_priority(headers):
     """Determine basic priority from email headers"""
-    subject = sanitize_text(headers.get("Subject","")).lower()
-    from_addr = sanitize_text(headers.get("From","")).lower()
-    
-    # VIP senders list - customize this
-    vip_domains = ["ceo", "cfo", "cto", "president", "director", "board"]
-    
-    # Check for VIP sender
-    is_vip = any(vip in from_addr for vip in vip_domains)
-    
-    # Check for urgent keywords in subject
-    urgent_keywords = ["urgent", "asap", "emergency", "critical", "immediate", "action required", "deadline"]
-    is_urgent = any(keyword in subject for keyword in urgent_keywords)
+    # VIP sender (e.g. ceo, director) or urgent keyword in subject;
+    # lists live in app.keywords
+    is_vip = "basic_vip" in keywords.matchers["sender"].groups(headers.get("From", ""))
+    is_urgent = "basic_urgent" in keywords.matchers["subject"].groups(headers.get("Subject", ""))
     
     if is_urgent or is_vip:
         return 1
@@ -104,26 +103,10 @@ def truncate_text(text, max_length=2000):
         return truncated[:last_period + 1] + "\n[... Content truncated ...]"
     return truncated + "\n[... Content truncated ...]"
 
-def get_body(msg):
+def get_body(msg, max_chars=None):
     """Extract email body safely"""
     try:
-        # Get parts or body
-        parts = msg.get("payload", {}).get("parts", [])
-        
-        # If no parts, try getting body directly
-        if not parts and "body" in msg.get("payload", {}):
-            data = msg["payload"]["body"].get("data", "")
-            if data:
-                return safe_decode(base64.urlsafe_b64decode(data))
-        
-        # Try to find text/plain part
-        for part in parts:
-            if part.get("mimeType") == "text/plain" and "body" in part:
-                data = part["body"].get("data", "")
-                if data:
-                    return safe_decode(base64.urlsafe_b64decode(data))
-        
-        return "No readable content"
+        return extract_body(msg, max_chars) or "No readable content"
     except Exception as e:
         return f"Error reading email: {str(e)}"
 
@@ -131,38 +114,25 @@ def calculate_priority(subject, sender, body, category):
     """Calculate email priority based on multiple factors"""
     priority = 3  # Default priority
 
-    # Priority keywords in subject
-    urgent_keywords = ["urgent", "acil", "immediate", "asap", "emergency", "deadline", "son tarih", "önemli", 
-                      "kritik", "hemen", "acilen", "ivedi", "gecikmeyin", "son gün", "son fırsat"]
-    important_keywords = ["important", "priority", "attention", "action", "required", "gerekli", "dikkat",
-                         "önemli", "öncelikli", "takip", "kontrol", "inceleme", "değerlendirme"]
-    
-    # VIP sender domains/keywords
-    vip_keywords = ["ceo", "cfo", "cto", "director", "manager", "yönetici", "müdür", "direktör", 
-                   "founder", "kurucu", "başkan", "genel müdür", "koordinatör", "supervisor"]
-    
-    # Category-based priority
-    high_priority_categories = ["İş", "Kariyer", "Work", "Career", "Job", "Interview", "Mülakat", 
-                              "Staj", "Proje", "Görev", "Toplantı", "Eğitim"]
-    
+    # Each text is scanned once for all keyword groups (see app.keywords)
+    subject_groups = keywords.matchers["subject"].groups(subject)
+
     # Check subject for urgent keywords
-    if any(keyword in subject.lower() for keyword in urgent_keywords):
+    if "urgent" in subject_groups:
         priority -= 2  # Higher priority (lower number)
-    elif any(keyword in subject.lower() for keyword in important_keywords):
+    elif "important" in subject_groups:
         priority -= 1
 
     # Check sender for VIP status
-    if any(keyword in sender.lower() for keyword in vip_keywords):
+    if "vip" in keywords.matchers["sender"].groups(sender):
         priority -= 1
 
     # Check category
-    if any(cat.lower() in category.lower() for cat in high_priority_categories):
+    if "category" in keywords.matchers["category"].groups(category):
         priority -= 1
 
     # Check for deadlines in body
-    deadline_keywords = ["deadline", "son tarih", "son gün", "bitiş tarihi", "son başvuru", 
-                        "dönüş tarihi", "teslim tarihi", "geç kalma"]
-    if any(keyword in body.lower() for keyword in deadline_keywords):
+    if "deadline" in keywords.matchers["body"].groups(body):
         priority -= 1
 
     # Ensure priority stays within bounds (1-5)
@@ -184,25 +154,17 @@ def get_motivation_quote():
     ]
     return random.choice(quotes)
 
-def summarize(message):
-    """Summarize email content with a beautiful template"""
-    try:
-        # Get headers
-        headers = message.get("payload", {}).get("headers", [])
-        
-        # Extract metadata
-        subject = get_header_value(headers, "subject")
-        sender = get_header_value(headers, "from")
-        
-        # Get and clean body
-        body = get_body(message)
-        
-        # Truncate body if too long (max 1500 chars)
-        if len(body) > 1500:
-            body = body[:1500] + "..."
-            
-        # Create prompt
-        prompt = f"""Bu e-postayı analiz et ve güzel bir özet oluştur (Türkçe olarak):
+# Bump when the prompt or its format changes so cached summaries are not reused
+PROMPT_VERSION = "2"
+SYSTEM_PROMPT = "Sen bir Türkçe e-posta özetleme asistanısın. Tüm yanıtlarını Türkçe olarak ver."
+
+def openai_complete(messages, model=SUMMARY_MODEL, temperature=0.2, max_tokens=300, timeout=None):
+    """Run one chat completion on OpenAI and return the reply text."""
+    return get_backend("openai")(messages, model, temperature, max_tokens, timeout)
+
+def build_prompt(subject, sender, body):
+    """Build the user prompt for a single email"""
+    return f"""Bu e-postayı analiz et ve güzel bir özet oluştur (Türkçe olarak):
 📧 Konu: {subject}
 👤 Gönderen: {sender}
 📝 İçerik: {body}
@@ -222,50 +184,78 @@ Lütfen yanıtını tam olarak bu formatta ver:
 
 Emojileri ekle ve formatı koru."""
 
-        # Get completion
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Sen bir Türkçe e-posta özetleme asistanısın. Tüm yanıtlarını Türkçe olarak ver."},
-                {"role": "user", "content": prompt}
+def prompt_inputs(message):
+    """Subject, sender and truncated body that go into the prompt"""
+    # Get headers
+    headers = message.get("payload", {}).get("headers", [])
+
+    # Extract metadata
+    subject = get_header_value(headers, "subject")
+    sender = get_header_value(headers, "from")
+
+    # Keep the start and the action/deadline sentences within the token budget
+    with stage("extract"):
+        body = fit_text(get_body(message, BODY_CHAR_BUDGET))
+
+    return subject, sender, body
+
+def generate_summary(message, complete=None, timeout=None, cache=None, model=None, max_tokens=300):
+    """Summarize email content with the LLM into a SummaryRecord; errors are
+    raised to the caller.
+
+    `complete` takes the chat messages and returns the reply text, it
+    defaults to the LLM_BACKEND backend (see app.llm). With a `cache` (see
+    app.cache) the LLM is only called when this message and prompt were not
+    summarized before.
+    """
+    complete = complete or get_backend()
+    model = model or getattr(complete, "model", SUMMARY_MODEL)
+    subject, sender, body = prompt_inputs(message)
+
+    key = summary_key(message.get("id"), model, PROMPT_VERSION, subject, sender, body)
+    summary = cache.get(key) if cache else None
+
+    # Get completion
+    if summary is None:
+        summary = complete(
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_prompt(subject, sender, body)}
             ],
-            temperature=0.2,
-            max_tokens=300
+            model=model,
+            max_tokens=max_tokens,
+            timeout=timeout
         )
-        
-        summary = response.choices[0].message.content.strip()
-        
-        # Extract category from summary
-        category = "Genel"
-        if "Kategori:" in summary:
-            category = summary.split("Kategori:")[1].split("\n")[0].strip()
-        
-        # Calculate priority based on content
-        calculated_priority = calculate_priority(subject, sender, body, category)
-        
-        # Add motivation quote
-        motivation = get_motivation_quote()
-        summary += f"\n\n{motivation}"
-        
-        return summary
-        
-    except Exception as e:
-        # Fallback response with beautiful formatting
-        return f"""━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-⚠️ İŞLEME HATASI
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-⭐ Öncelik: 3
+        if cache:
+            cache.put(key, summary)
 
-📋 TEMEL BİLGİLER
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📄 Özet: E-posta işlenirken bir hata oluştu
-✅ Yapılması Gereken: Orijinal e-postayı kontrol edin
-⏰ Son Tarih: Belirtilmemiş
-🏷️ Kategori: Sistem Hatası
+    return finish_summary(summary, message.get("id"), subject, sender, body)
+
+def finish_summary(reply, message_id, subject, sender, body):
+    """Turn the LLM reply into a SummaryRecord"""
+    # Keyword priority is only used when the model did not give one
+    return parse_summary(
+        reply,
+        [message_id] if message_id else [],
+        default_priority=lambda category: calculate_priority(subject, sender, body, category)
+    )
 
-❌ Hata Detayı: {str(e)}
+def error_summary(error):
+    """Fallback summary shown when an email could not be summarized"""
+    return SummaryRecord(
+        priority=3,
+        category="Sistem Hatası",
+        action="Orijinal e-postayı kontrol edin",
+        text=f"E-posta işlenirken bir hata oluştu. ❌ Hata Detayı: {str(error)}"
+    )
 
-{get_motivation_quote()}"""
+def summarize(message, complete=None):
+    """Summarize email content into a SummaryRecord"""
+    try:
+        return generate_summary(message, complete)
+    except Exception as e:
+        # Fallback response with beautiful formatting
+        return error_summary(e)
 
 def get_priority_label(priority):
     """Get Turkish priority label"""
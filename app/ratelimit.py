@@ -0,0 +1,90 @@
+"""Token-bucket rate limits for the Gmail and OpenAI quotas."""
+import asyncio, os, threading, time
+from .metrics import add, gmail_calls_total
+
+# Gmail allows 250 quota units per user per second
+GMAIL_QUOTA_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_BURST = float(os.getenv("OPENAI_BURST", "10"))
+
+# Quota units per Gmail API method
+GMAIL_COST = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "messages.send": 100,
+    "history.list": 2,
+    "getProfile": 1,
+    "watch": 100,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until tokens are available."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available now; returns the seconds to wait otherwise (0 on success)."""
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Take `tokens`, waiting as needed; more than `capacity` is paid in capacity-sized parts."""
+        while tokens > 0:
+            part = min(tokens, self.capacity)
+            while True:
+                wait = self.try_acquire(part)
+                if not wait:
+                    break
+                time.sleep(wait)
+            tokens -= part
+
+    async def acquire_async(self, tokens=1):
+        while tokens > 0:
+            part = min(tokens, self.capacity)
+            while True:
+                wait = self.try_acquire(part)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            tokens -= part
+
+
+_gmail_limiters = {}
+_gmail_limiters_lock = threading.Lock()
+
+
+def gmail_limiter(account):
+    """Per-account bucket measured in Gmail quota units; None when disabled."""
+    if GMAIL_QUOTA_UNITS_PER_SECOND <= 0:
+        return None
+    with _gmail_limiters_lock:
+        if account not in _gmail_limiters:
+            _gmail_limiters[account] = TokenBucket(GMAIL_QUOTA_UNITS_PER_SECOND)
+        return _gmail_limiters[account]
+
+
+def gmail_acquire(limiter, method, count=1):
+    """Spend the quota of `count` calls to `method` on `limiter`, if any."""
+    add(gmail_calls_total, count, "gmail_calls", method=method)
+    if limiter is not None:
+        limiter.acquire(GMAIL_COST[method] * count)
+
+
+# Shared by every account: the OpenAI key has one quota
+openai_limiter = TokenBucket(OPENAI_RPM / 60, OPENAI_BURST) if OPENAI_RPM > 0 else None
@@ -0,0 +1,71 @@
+"""HTML rendering of the digest from precompiled Jinja templates."""
+import datetime as dt, os
+from typing import NamedTuple, Optional
+from urllib.parse import quote
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from .metrics import stage
+from .ranker import get_motivation_quote
+from .summary import as_record
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+DIGEST_TEMPLATE = "digest.html"
+
+# Templates are compiled on first use and kept for the life of the process;
+# auto_reload=False skips the modification-time check on every lookup
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    cache_size=-1,
+)
+
+
+def gmail_link(record, subject):
+    if record.source_ids:
+        return f"https://mail.google.com/mail/u/0/#all/{record.source_ids[0]}"
+    return f"https://mail.google.com/mail/u/0/#search/{quote(subject)}"
+
+
+class DigestCard(NamedTuple):
+    """What the digest template shows for one entry.
+
+    Plain attributes keep template lookups cheap; Jinja tries getattr
+    before item access, so dicts would raise and catch on every field.
+    """
+    priority: int
+    priority_label: str
+    subject: str
+    sender: str
+    link: str
+    text: str
+    quote: str
+    action: Optional[str]
+    deadline: Optional[str]
+    category: str
+
+
+def digest_cards(summaries):
+    """DigestCards for digest entries, built as the template consumes them."""
+    for summary in summaries:
+        record = as_record(summary["summary"])
+        subject = summary.get("subject", "")
+        yield DigestCard(record.priority, record.priority_label, subject, summary.get("from_", ""),
+                         gmail_link(record, subject), record.text, get_motivation_quote(), record.action,
+                         record.deadline, record.category)
+
+
+def _context(summaries, created_at):
+    created_at = created_at or dt.datetime.now()
+    return {"created_at": created_at.strftime("%d.%m.%Y %H:%M"), "cards": digest_cards(summaries)}
+
+
+def stream_digest(summaries, created_at=None):
+    """The digest HTML as a generator of chunks; cards are rendered one by one."""
+    return env.get_template(DIGEST_TEMPLATE).generate(_context(summaries, created_at))
+
+
+def render_digest(summaries, created_at=None):
+    """The whole digest HTML in one string, in time linear in the number of cards."""
+    # render() joins the same chunks without a generator hop per chunk
+    with stage("render"):
+        return env.get_template(DIGEST_TEMPLATE).render(_context(summaries, created_at))
@@ -0,0 +1,196 @@
+"""Retries with backoff and per-run retry budgets for Gmail, SMTP and LLM calls, circuit breakers for the LLM."""
+import collections, contextvars, email.utils, os, random, smtplib, socket, threading, time
+import openai
+from googleapiclient.errors import HttpError
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+# Retries one digest run may spend in total, so an outage slows a run down
+# by a bounded amount instead of multiplying every call
+RUN_RETRY_BUDGET = int(os.getenv("RUN_RETRY_BUDGET", "50"))
+
+# A breaker opens when at least BREAKER_MIN_CALLS calls in the last
+# BREAKER_WINDOW seconds failed at BREAKER_ERROR_RATE or more, and lets a
+# probe call through after BREAKER_COOLDOWN seconds
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Gmail reports quota errors as 403 with one of these reasons
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a service whose breaker is open."""
+
+
+def status_of(error):
+    if isinstance(error, HttpError):
+        return error.resp.status
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    return None
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, socket.timeout,
+                          ConnectionError, TimeoutError, smtplib.SMTPServerDisconnected)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary by definition (RFC 5321)
+        return 400 <= error.smtp_code < 500
+    status = status_of(error)
+    if status in RETRYABLE_STATUS:
+        return True
+    return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from a Retry-After header, or None."""
+    if isinstance(error, HttpError):
+        value = error.resp.get("retry-after")
+    elif isinstance(error, openai.APIStatusError):
+        value = error.response.headers.get("retry-after")
+    else:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time()) if date else None
+
+
+def backoff_delay(attempt, error=None, base=None, cap=None):
+    """Full-jitter exponential backoff, but never shorter than Retry-After."""
+    base = RETRY_BASE_DELAY if base is None else base
+    cap = RETRY_MAX_DELAY if cap is None else cap
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    asked = retry_after(error) if error is not None else None
+    return max(delay, min(asked, cap)) if asked is not None else delay
+
+
+class RetryBudget:
+    """A thread-safe number of retries that may still be spent."""
+
+    def __init__(self, limit=RUN_RETRY_BUDGET):
+        self.limit = limit
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def spend(self):
+        with self._lock:
+            if self.spent >= self.limit:
+                return False
+            self.spent += 1
+            return True
+
+
+_run_budget = contextvars.ContextVar("run_retry_budget", default=None)
+
+
+def start_run_budget(limit=RUN_RETRY_BUDGET):
+    """Give the current task a fresh RetryBudget, shared by every call it makes.
+
+    Threads started with run_in_threadpool and the summary engine inherit
+    it, so all retries of one digest run draw from the same budget.
+    """
+    budget = RetryBudget(limit)
+    _run_budget.set(budget)
+    return budget
+
+
+def spend_retry():
+    """Take one retry from the current run's budget; True when there is no budget."""
+    budget = _run_budget.get()
+    return budget is None or budget.spend()
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while, then probes it with one call."""
+
+    def __init__(self, name, error_rate=BREAKER_ERROR_RATE, min_calls=BREAKER_MIN_CALLS, window=BREAKER_WINDOW,
+                 cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.opened_at = None
+        self._probing = False
+        self._calls = collections.deque()  # (time, ok)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self.opened_at = None if ok else now
+                self._calls.clear()
+                return
+            self._calls.append((now, ok))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, success in self._calls if not success)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                self.opened_at = now
+
+    def stats(self):
+        with self._lock:
+            failures = sum(1 for _, ok in self._calls if not ok)
+            calls = len(self._calls)
+        return {"state": self.state, "calls": calls, "failures": failures}
+
+
+def call_with_retry(func, *args, breaker=None, attempts=None, deadline=None, sleep=time.sleep, **kwargs):
+    """Call `func`, retrying transient errors with backoff.
+
+    Retries stop when `attempts` are used up, when the run's retry budget
+    (see start_run_budget) is spent, or when the next wait would pass `deadline`
+    (a time.monotonic() value); the last error is raised then. With an
+    open `breaker`, CircuitOpenError is raised without calling `func`.
+    """
+    attempts = attempts or RETRY_ATTEMPTS
+    for attempt in range(attempts):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} is unavailable (circuit open)")
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            retryable = is_retryable(e)
+            if breaker is not None:
+                # Client errors (bad request, auth) say nothing about the service's health
+                breaker.record(not retryable)
+            if not retryable or attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt, e)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            if not spend_retry():
+                raise
+            sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record(True)
+            return result
+
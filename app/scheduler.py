@@ -0,0 +1,92 @@
+"""Cron-style digest runs for every account in the token store."""
+import asyncio, os, random, time, traceback
+import schedule
+from .accounts import list_accounts
+
+# Either fixed times of day ("08:00,18:00") or a fixed interval
+DIGEST_AT = os.getenv("DIGEST_AT", "")
+DIGEST_INTERVAL_MINUTES = float(os.getenv("DIGEST_INTERVAL_MINUTES", "60"))
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "10"))
+SCHEDULER_ACCOUNT_CONCURRENCY = int(os.getenv("SCHEDULER_ACCOUNT_CONCURRENCY", "1"))
+# Each run starts after a random delay of up to this many seconds
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "30"))
+
+
+class DigestScheduler:
+    """Triggers `run_account(account)` for all accounts on a schedule.
+
+    At most `max_concurrency` runs are in flight overall and at most
+    `account_concurrency` per account; a trigger for an account that is
+    already at its limit is skipped rather than queued.
+    """
+
+    def __init__(self, run_account, accounts=list_accounts, max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+                 account_concurrency=SCHEDULER_ACCOUNT_CONCURRENCY, jitter=SCHEDULER_JITTER,
+                 at_times=DIGEST_AT, interval_minutes=DIGEST_INTERVAL_MINUTES):
+        self.run_account = run_account
+        self.accounts = accounts
+        self.account_concurrency = account_concurrency
+        self.jitter = jitter
+        self.running = {}
+        self.last_runs = {}
+        self.skipped = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self._loop_task = None
+        self._schedule = schedule.Scheduler()
+        times = [t.strip() for t in at_times.split(",") if t.strip()]
+        if times:
+            for at in times:
+                self._schedule.every().day.at(at).do(self.trigger)
+        else:
+            self._schedule.every(interval_minutes).minutes.do(self.trigger)
+
+    def trigger(self):
+        """Start a run for every account that is not at its concurrency limit."""
+        for account in self.accounts():
+            if self.running.get(account, 0) >= self.account_concurrency:
+                self.skipped += 1
+                continue
+            self.running[account] = self.running.get(account, 0) + 1
+            task = asyncio.ensure_future(self._run(account))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, account):
+        try:
+            # Spread the runs so every account does not hit Gmail and OpenAI at once
+            await asyncio.sleep(random.uniform(0, self.jitter))
+            async with self._semaphore:
+                started = time.time()
+                try:
+                    result = await self.run_account(account)
+                    self.last_runs[account] = {"finished_at": time.time(), "duration": time.time() - started,
+                                               "ok": True, "message": (result or {}).get("message")}
+                except Exception as e:
+                    traceback.print_exc()
+                    self.last_runs[account] = {"finished_at": time.time(), "duration": time.time() - started,
+                                               "ok": False, "message": str(e)}
+        finally:
+            self.running[account] -= 1
+
+    async def _loop(self):
+        while True:
+            self._schedule.run_pending()
+            await asyncio.sleep(1)
+
+    async def start(self):
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        tasks = [t for t in [self._loop_task, *self._tasks] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self):
+        return {
+            "next_run": self._schedule.next_run.isoformat() if self._schedule.next_run else None,
+            "running": {account: count for account, count in self.running.items() if count},
+            "skipped": self.skipped,
+            "last_runs": self.last_runs,
+        }
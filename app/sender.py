@@ -1,85 +1,94 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-import os
+import html, os
 from datetime import datetime
-from jinja2 import Template
 from dotenv import load_dotenv
+from .dispatch import get_smtp_pool, send_smtp
+from .metrics import stage
+from .render import env
+from .summary import as_record
 
 load_dotenv()
 
 def format_summaries(summaries):
-    """Format summaries into urgent and important categories"""
+    """Format summaries into urgent and important categories
+
+    `summaries` are digest entries with `subject`, `from_` and a structured
+    `summary` (see app.summary), e.g. EmailResponse dicts.
+    """
     urgent = []
     important = []
     
     for summary in summaries:
-        lines = summary.split('\n')
-        importance = next((line for line in lines if '⭐ Importance:' in line), '')
-        
-        # Extract importance level
-        importance_level = int(importance.split(':')[1].strip()[0])
+        record = as_record(summary['summary'])
+        if record.priority > 2:
+            continue
         
         # Format the summary with metadata and styling
         formatted_summary = f"""
         <div class='metadata'>
-            <span class='importance-{importance_level}'>
-                {lines[0]}  <!-- Importance -->
+            <span class='importance-{record.priority}'>
+                ⭐ Importance: {record.priority} ({record.priority_label})
             </span>
+            — {html.escape(summary.get('subject', ''))} · {html.escape(summary.get('from_', ''))}
         </div>
         <div class='content'>
-            {lines[1]}  <!-- Summary -->
+            {html.escape(record.text)}
         </div>
         <div class='details'>
-            {lines[2] if len(lines) > 2 else ''}  <!-- Action Items -->
-            {lines[3] if len(lines) > 3 else ''}  <!-- Deadlines -->
-            {lines[4] if len(lines) > 4 else ''}  <!-- Response -->
+            {f"<div class='action-items'>✅ {html.escape(record.action)}</div>" if record.action else ''}
+            {f"<div>⏰ {html.escape(record.deadline)}</div>" if record.deadline else ''}
+            <div>🏷️ {html.escape(record.category)}</div>
         </div>
         """
         
-        if importance_level == 1:
+        if record.priority == 1:
             urgent.append(formatted_summary)
-        elif importance_level == 2:
+        else:
             important.append(formatted_summary)
     
     return urgent, important
 
-def send_digest(summaries, recipient_email=None):
-    """Send the digest email with HTML formatting"""
-    if recipient_email is None:
-        recipient_email = os.getenv("EMAIL_USER")
-    
-    sender_email = os.getenv("EMAIL_USER")
-    sender_password = os.getenv("EMAIL_PASS")
-    
-    # Create message
+def build_digest(summaries, recipient_email, sender_email=None):
+    """The digest as a MIME message for one recipient"""
     msg = MIMEMultipart('alternative')
     msg['Subject'] = f'Daily Email Digest - {datetime.now().strftime("%Y-%m-%d")}'
-    msg['From'] = sender_email
+    msg['From'] = sender_email or os.getenv("EMAIL_USER")
     msg['To'] = recipient_email
     
-    # Read HTML template
-    with open('app/templates/email_template.html', 'r', encoding='utf-8') as f:
-        template = Template(f.read())
+    # Compiled once per process (see app.render)
+    template = env.get_template('email_template.html')
     
     # Format summaries
     urgent_summaries, important_summaries = format_summaries(summaries)
     
     # Render HTML
-    html = template.render(
-        date=datetime.now().strftime("%Y-%m-%d %H:%M"),
-        emails_processed=len(summaries),
-        important_emails=len(urgent_summaries) + len(important_summaries),
-        urgent_summaries=urgent_summaries,
-        important_summaries=important_summaries
-    )
+    with stage("render"):
+        html = template.render(
+            date=datetime.now().strftime("%Y-%m-%d %H:%M"),
+            emails_processed=len(summaries),
+            important_emails=len(urgent_summaries) + len(important_summaries),
+            urgent_summaries=urgent_summaries,
+            important_summaries=important_summaries
+        )
     
     # Attach HTML content
     msg.attach(MIMEText(html, 'html'))
+    return msg
+
+def send_digest(summaries, recipient_email=None):
+    """Send the digest email with HTML formatting"""
+    if recipient_email is None:
+        recipient_email = os.getenv("EMAIL_USER")
     
-    # Send email
-    with smtplib.SMTP("smtp.gmail.com", 587) as server:
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
+    # Pooled connection, already logged in after the first send (see app.dispatch)
+    message = build_digest(summaries, recipient_email)
+    with stage("send"):
+        get_smtp_pool().send(message)
+
+def send_digests(digests):
+    """Send `(recipient, summaries)` pairs over the SMTP pool; returns a dispatch.Delivery each"""
+    messages = [(recipient, build_digest(summaries, recipient)) for recipient, summaries in digests]
+    with stage("send"):
+        return send_smtp(messages)
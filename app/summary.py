@@ -0,0 +1,117 @@
+"""Structured summary record shared by the API, HTML, PDF and SMTP renderers."""
+import re
+from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+
+PRIORITY_LABELS = {
+    1: "Acil",
+    2: "Yüksek Öncelik",
+    3: "Normal",
+    4: "Düşük Öncelik",
+    5: "Bilgi"
+}
+
+# Answers that mean "nothing to do" / "no deadline"
+NO_ACTION = {"işlem gerekmiyor", "islem gerekmiyor", "no action needed", "yok", "-", "none", "n/a"}
+NO_DEADLINE = {"son tarih yok", "no deadline", "belirtilmemiş", "belirtilmemis", "yok", "-", "none", "n/a"}
+
+# Field labels of the summary prompt (Turkish) and of older English prompts
+_LABELS = {
+    "öncelik": "priority", "priority": "priority", "importance": "priority",
+    "özet": "text", "summary": "text",
+    "yapılması gereken": "action", "action required": "action",
+    "son tarih": "deadline", "deadline": "deadline",
+    "kategori": "category", "category": "category",
+}
+_LINE_RE = re.compile(
+    r"^\W*(?P<label>" + "|".join(sorted(map(re.escape, _LABELS), key=len, reverse=True)) + r")\s*:\s*(?P<value>.*)$",
+    re.IGNORECASE
+)
+_SEPARATOR_RE = re.compile(r"^[\s━─=\-_*]*$")
+
+
+def _fold(text):
+    # "İ".lower() leaves a combining dot behind
+    return text.lower().replace("\u0307", "")
+
+
+class SummaryRecord(BaseModel):
+    """One digest card: built once, rendered everywhere."""
+    priority: int = Field(3, ge=1, le=5)
+    category: str = "Genel"
+    action: Optional[str] = None  # None when nothing has to be done
+    deadline: Optional[str] = None
+    text: str = ""
+    source_ids: List[str] = Field(default_factory=list)
+
+    @field_validator("action", "deadline", mode="before")
+    @classmethod
+    def _empty_to_none(cls, value, info):
+        if value is None:
+            return None
+        value = str(value).strip()
+        empty = NO_ACTION if info.field_name == "action" else NO_DEADLINE
+        return None if not value or _fold(value) in empty else value
+
+    @property
+    def priority_label(self):
+        return PRIORITY_LABELS[self.priority]
+
+    def to_text(self):
+        """Plain-text card in the format of the summary prompt."""
+        return f"""⭐ Öncelik: {self.priority} ({self.priority_label})
+📄 Özet: {self.text}
+✅ Yapılması Gereken: {self.action or "İşlem gerekmiyor"}
+⏰ Son Tarih: {self.deadline or "Son tarih yok"}
+🏷️ Kategori: {self.category}"""
+
+
+def priority_from(value, default=3):
+    match = re.search(r"[1-5]", str(value))
+    return int(match.group(0)) if match else default
+
+
+def parse_summary(reply, source_ids=(), default_priority=3):
+    """Build a SummaryRecord from the LLM's free-text card in one pass.
+
+    `default_priority` is used when the reply has no priority; it may be a
+    callable that gets the parsed category.
+    """
+    fields = {}
+    text_lines = []
+    last = None
+    for line in reply.splitlines():
+        match = _LINE_RE.match(line)
+        label = match and _LABELS.get(_fold(match.group("label")))
+        if label:
+            last = label
+            fields.setdefault(last, match.group("value").strip())
+            continue
+        stripped = line.strip()
+        # Wrapped summary lines belong to the summary; headings and rules do not
+        if last == "text" and stripped and not _SEPARATOR_RE.match(stripped) and not stripped.isupper():
+            text_lines.append(stripped)
+        elif not stripped:
+            last = None
+
+    text = " ".join([fields.get("text", "")] + text_lines).strip()
+    if not text:
+        # Unexpected format: keep whatever the model said
+        text = " ".join(l.strip() for l in reply.splitlines() if l.strip() and not _SEPARATOR_RE.match(l.strip()))
+    category = fields.get("category") or "Genel"
+    priority = priority_from(fields.get("priority", ""), None)
+    if priority is None:
+        priority = default_priority(category) if callable(default_priority) else default_priority
+    return SummaryRecord(
+        priority=priority,
+        category=category,
+        action=fields.get("action"),
+        deadline=fields.get("deadline"),
+        text=text,
+        source_ids=list(source_ids)
+    )
+
+
+def as_record(value):
+    """Accept a SummaryRecord or its dict form (e.g. from EmailResponse.dict())."""
+    return value if isinstance(value, SummaryRecord) else SummaryRecord(**value)
@@ -0,0 +1,135 @@
+"""Incremental mailbox sync based on Gmail history IDs."""
+import os, threading, time
+from googleapiclient.errors import HttpError
+from .db import connect, data_path
+from .ratelimit import gmail_acquire
+from .resilience import call_with_retry
+
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "sync_state.sqlite3")
+
+# Messages with these labels are not part of a digest
+SKIP_LABELS = {"DRAFT", "SENT", "SPAM", "TRASH"}
+
+
+class SyncStateStore:
+    """Last seen Gmail historyId per account."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            " account TEXT PRIMARY KEY, history_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, account):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history_id FROM sync_state WHERE account = ?", (account,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, account, history_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (account, history_id, updated_at) VALUES (?, ?, ?)",
+                (account, str(history_id), time.time())
+            )
+
+    def reset(self, account):
+        with self._lock:
+            self._conn.execute("DELETE FROM sync_state WHERE account = ?", (account,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sync_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SyncStateStore(data_path(SYNC_STATE_PATH))
+    return _store
+
+
+def list_messages(service, query=None, max_results=100, limiter=None):
+    """Full listing: message references for `query`, newest first."""
+    refs = []
+    page_token = None
+    while len(refs) < max_results:
+        gmail_acquire(limiter, "messages.list")
+        results = call_with_retry(service.users().messages().list(
+            userId="me", q=query, maxResults=min(500, max_results - len(refs)), pageToken=page_token
+        ).execute)
+        refs.extend(results.get("messages", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return refs[:max_results]
+
+
+def list_history(service, start_history_id, max_results=500, limiter=None):
+    """Message references added since `start_history_id`, oldest first.
+
+    Returns `(refs, latest_history_id)`. Raises HttpError 404 when the
+    start ID is too old for Gmail to answer.
+    """
+    added = {}
+    deleted = set()
+    page_token = None
+    latest = start_history_id
+    while True:
+        gmail_acquire(limiter, "history.list")
+        results = call_with_retry(service.users().history().list(
+            userId="me",
+            startHistoryId=start_history_id,
+            historyTypes=["messageAdded", "messageDeleted"],
+            pageToken=page_token
+        ).execute)
+        for record in results.get("history", []):
+            if len(added) >= max_results:
+                # Stop here; the next sync resumes after the last record taken
+                return [ref for message_id, ref in added.items() if message_id not in deleted], latest
+            for item in record.get("messagesAdded", []):
+                message = item["message"]
+                if not SKIP_LABELS.intersection(message.get("labelIds", [])):
+                    added[message["id"]] = {"id": message["id"], "threadId": message.get("threadId")}
+            for item in record.get("messagesDeleted", []):
+                deleted.add(item["message"]["id"])
+            latest = record.get("id", latest)
+        latest = results.get("historyId", latest) if not results.get("nextPageToken") else latest
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return [ref for message_id, ref in added.items() if message_id not in deleted], latest
+
+
+def sync_messages(service, account=None, store=None, query=None, max_results=100, limiter=None):
+    """Message references that are new since the last sync of `account`.
+
+    The first sync, and any sync whose stored history has expired, falls
+    back to a full listing with `query`. Returns `(refs, mode)` where mode
+    is "full" or "incremental"; either way the latest historyId is stored
+    for the next call.
+    """
+    store = store or get_sync_store()
+    gmail_acquire(limiter, "getProfile")
+    profile = call_with_retry(service.users().getProfile(userId="me").execute)
+    account = account or profile["emailAddress"]
+
+    start_history_id = store.get(account)
+    if start_history_id:
+        try:
+            refs, latest = list_history(service, start_history_id, max_results, limiter)
+            store.set(account, latest)
+            return refs, "incremental"
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # History expired, start over from a full listing
+
+    # Read the history ID before listing so nothing arriving in between is missed
+    refs = list_messages(service, query, max_results, limiter)
+    store.set(account, profile["historyId"])
+    return refs, "full"
@@ -0,0 +1,253 @@
+"""Thread-level digesting: one card per conversation, updated reply by reply."""
+import json, os, re, threading, time
+from .accounts import DEFAULT_ACCOUNT
+from .budget import count_tokens, fit_text
+from .cache import summary_key
+from .db import connect, data_path
+from .metrics import stage
+from .mime import extract_body
+from .llm import SUMMARY_MODEL, get_backend
+from .ranker import SYSTEM_PROMPT, PROMPT_VERSION, finish_summary, generate_summary, get_header_value
+from .summary import SummaryRecord
+
+THREAD_STATE_PATH = os.getenv("THREAD_STATE_PATH", "thread_state.sqlite3")
+# Threads without a new reply for this many days start over with a fresh summary
+THREAD_STATE_RETENTION_DAYS = float(os.getenv("THREAD_STATE_RETENTION_DAYS", "14"))
+THREAD_DIGEST = os.getenv("THREAD_DIGEST", "1").lower() not in ("0", "false", "no")
+# Prompt tokens of reply text (after stripping quotes) sent for one thread
+THREAD_TOKEN_BUDGET = int(os.getenv("THREAD_TOKEN_BUDGET", "1000"))
+# Characters of each reply that are decoded before stripping
+REPLY_CHAR_BUDGET = 3000
+
+# Lines that start the quoted copy of earlier mail in a reply
+_QUOTE_HEADER_RE = re.compile(
+    r"^\s*(?:On .{0,200} wrote:|.{0,200} tarihinde .{0,200} (?:şunu )?yazdı:"
+    r"|-{2,}\s*(?:Original Message|Orijinal İleti|Özgün İleti)\s*-{2,}"
+    r"|_{10,}|From: .+|Kimden: .+)\s*$",
+    re.IGNORECASE
+)
+# Lines that start a signature block
+_SIGNATURE_RE = re.compile(
+    r"^\s*(?:--|Sent from my .+|.+ cihazımdan gönderildi|.+'(?:u|ü|i|ı)mdan gönderildi|Get Outlook for .+)\s*$",
+    re.IGNORECASE
+)
+# Closing phrases; what follows them near the end of a reply is a signature
+_CLOSING_RE = re.compile(
+    r"^\s*(?:saygılarımla|saygılar|iyi çalışmalar|teşekkürler|best regards|kind regards|regards|best|thanks|cheers)"
+    r"[\s,.!]*$",
+    re.IGNORECASE
+)
+# A closing phrase only counts this close to the end of the text
+CLOSING_TAIL_LINES = 6
+
+THREAD_PROMPT_VERSION = PROMPT_VERSION + "-thread1"
+
+
+def strip_reply(text):
+    """Only what the sender wrote: quoted replies and signatures are removed."""
+    lines = []
+    for line in text.splitlines():
+        if _QUOTE_HEADER_RE.match(line) or _SIGNATURE_RE.match(line):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        lines.append(line)
+    for i in range(max(0, len(lines) - CLOSING_TAIL_LINES), len(lines)):
+        if _CLOSING_RE.match(lines[i]):
+            lines = lines[:i + 1]
+            break
+    return "\n".join(lines).strip()
+
+
+def group_threads(messages):
+    """Messages grouped by threadId, oldest first within each thread.
+
+    Threads come in the order of their first message in `messages`;
+    messages without `internalDate` keep Gmail's newest-first list order.
+    """
+    threads = {}
+    for position, message in enumerate(messages):
+        threads.setdefault(message.get("threadId") or message.get("id"), []).append((position, message))
+    return [
+        [message for _, message in sorted(items, key=lambda item: (int(item[1].get("internalDate") or 0), -item[0]))]
+        for items in threads.values()
+    ]
+
+
+def thread_message(messages, account=None):
+    """The newest message of a thread, carrying the whole thread under "thread" and its mailbox under "account"."""
+    return dict(messages[-1], thread=list(messages), account=account or DEFAULT_ACCOUNT)
+
+
+def thread_key(message):
+    """`(account, thread ID)` under which the thread of `message` is stored."""
+    return message.get("account") or DEFAULT_ACCOUNT, message.get("threadId") or message.get("id")
+
+
+class ThreadStateStore:
+    """Latest summary per account and thread, and the message IDs it covers."""
+
+    def __init__(self, path, retention_days=THREAD_STATE_RETENTION_DAYS):
+        self.retention = retention_days * 86400
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        # The first version was keyed by thread ID alone, which cannot tell mailboxes apart
+        self._conn.execute("DROP TABLE IF EXISTS thread_state")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_states ("
+            " account TEXT NOT NULL, thread_id TEXT NOT NULL, message_ids TEXT NOT NULL, summary TEXT NOT NULL,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (account, thread_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS thread_states_updated ON thread_states (updated_at)")
+
+    def get(self, key):
+        """`(message_ids, SummaryRecord)` of an `(account, thread ID)` key; `(set(), None)` if unknown or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_ids, summary FROM thread_states WHERE account = ? AND thread_id = ? AND updated_at >= ?",
+                (*key, time.time() - self.retention)
+            ).fetchone()
+        if not row:
+            return set(), None
+        return set(json.loads(row[0])), SummaryRecord.model_validate_json(row[1])
+
+    def put(self, key, message_ids, record):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_states (account, thread_id, message_ids, summary, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(sorted(message_ids)), record.model_dump_json(), time.time())
+            )
+
+    def prune(self):
+        """Delete threads not updated within the retention period; returns how many."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM thread_states WHERE updated_at < ?", (time.time() - self.retention,)
+            )
+        return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM thread_states")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_thread_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ThreadStateStore(data_path(THREAD_STATE_PATH))
+    return _store
+
+
+def reply_block(message):
+    headers = message.get("payload", {}).get("headers", [])
+    # Metadata-only messages (see pipeline.plan_fetch) fall back to the snippet
+    with stage("extract"):
+        body = strip_reply(extract_body(message, REPLY_CHAR_BUDGET)) or message.get("snippet", "")
+        body = fit_text(body)
+    return f"👤 {get_header_value(headers, 'from')}:\n{body}"
+
+
+def build_thread_prompt(subject, blocks, previous=None):
+    """User prompt for a thread, or for new replies to an already summarized one."""
+    if previous is not None:
+        intro = f"""Bu e-posta yazışmasının önceki özeti aşağıda. Yeni yanıtları dikkate alarak özeti güncelle (Türkçe olarak):
+📧 Konu: {subject}
+🗂️ Önceki Özet: {previous.text}
+✅ Önceki Yapılması Gereken: {previous.action or "İşlem gerekmiyor"}
+⏰ Önceki Son Tarih: {previous.deadline or "Son tarih yok"}
+📝 Yeni Yanıtlar:"""
+    else:
+        intro = f"""Bu e-posta yazışmasını analiz et ve tek bir özet oluştur (Türkçe olarak):
+📧 Konu: {subject}
+📝 Mesajlar (eskiden yeniye):"""
+    return intro + "\n\n" + "\n\n".join(blocks) + """
+
+Lütfen yanıtını tam olarak bu formatta ver:
+⭐ Öncelik: [1-5] (1=Acil, 5=Düşük)
+📄 Özet: [yazışmanın son durumunu anlatan 2-3 satırlık özet]
+✅ Yapılması Gereken: [yapılacak işlem veya "İşlem gerekmiyor"]
+⏰ Son Tarih: [tarih/saat veya "Son tarih yok"]
+🏷️ Kategori: [İş/Kişisel/Bülten/Promosyon]"""
+
+
+def _fit(blocks, budget):
+    """The newest blocks that fit in `budget` tokens, oldest first."""
+    kept, used = [], 0
+    for block in reversed(blocks):
+        cost = count_tokens(block)
+        if kept and used + cost > budget:
+            break
+        kept.append(block if cost <= budget else fit_text(block, budget))
+        used += cost
+    return list(reversed(kept))
+
+
+def needs_context(message, store=None):
+    """Whether `message` must be summarized together with its thread."""
+    if "thread" not in message:
+        return False
+    if len(message["thread"]) > 1:
+        return True
+    return (store or get_thread_store()).get(thread_key(message))[1] is not None
+
+
+def remember(message, record, store=None):
+    """Store a summary made without the thread path as the thread's summary."""
+    if "thread" in message:
+        ids = [m.get("id") for m in message["thread"]]
+        (store or get_thread_store()).put(thread_key(message), set(ids), record)
+
+
+def summarize_thread(message, complete=None, timeout=None, cache=None, model=None, max_tokens=300, store=None):
+    """Summarize the thread carried by `message` (see thread_message) into one SummaryRecord.
+
+    Replies already covered by the stored thread summary are not sent
+    again: with only new replies, the prompt holds the previous summary
+    plus those replies, and with none the stored summary is reused as is.
+    """
+    complete = complete or get_backend()
+    model = model or getattr(complete, "model", SUMMARY_MODEL)
+    store = store or get_thread_store()
+    messages = message.get("thread") or [message]
+    state_key = thread_key(message)
+    ids = [m.get("id") for m in messages]
+
+    covered, previous = store.get(state_key)
+    new = [m for m in messages if m.get("id") not in covered]
+    if previous is not None:
+        # The card covers the whole conversation, not only this run's messages
+        ids = previous.source_ids + [i for i in ids if i not in previous.source_ids]
+        if not new:
+            return previous.model_copy(update={"source_ids": ids})
+    if previous is None and len(messages) == 1:
+        record = generate_summary(message, complete, timeout, cache, model, max_tokens)
+    else:
+        headers = messages[-1].get("payload", {}).get("headers", [])
+        subject = get_header_value(headers, "subject")
+        sender = get_header_value(headers, "from")
+        blocks = _fit([reply_block(m) for m in (new if previous is not None else messages)], THREAD_TOKEN_BUDGET)
+        prompt = build_thread_prompt(subject, blocks, previous)
+        key = summary_key(state_key[1], model, THREAD_PROMPT_VERSION, *sorted(ids), prompt)
+        reply = cache.get(key) if cache else None
+        if reply is None:
+            reply = complete(
+                [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                model=model,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            if cache:
+                cache.put(key, reply)
+        record = finish_summary(reply, None, subject, sender, "\n".join(blocks))
+    record = record.model_copy(update={"source_ids": ids})
+    store.put(state_key, covered | set(ids), record)
+    return record
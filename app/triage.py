@@ -0,0 +1,119 @@
+"""Local pre-triage that decides how much LLM an email deserves."""
+import os
+from dataclasses import dataclass, field
+from .llm import CHEAP_MODEL
+from .ranker import basic_priority, calculate_priority, get_header_value
+from .summary import SummaryRecord
+
+TEMPLATE = "template"  # summarized locally, no LLM call
+CHEAP = "cheap"        # short completion on the cheap model of CHEAP_BACKEND
+FULL = "full"          # the regular summary prompt
+
+# Bulk score at or above which mail gets a local template summary
+TRIAGE_TEMPLATE_SCORE = float(os.getenv("TRIAGE_TEMPLATE_SCORE", "3"))
+# Bulk score at or above which mail goes to the cheap model
+TRIAGE_CHEAP_SCORE = float(os.getenv("TRIAGE_CHEAP_SCORE", "1"))
+# Mail with a keyword priority at or below this (1 = urgent) always gets the full model
+TRIAGE_FULL_PRIORITY = int(os.getenv("TRIAGE_FULL_PRIORITY", "2"))
+
+CHEAP_MAX_TOKENS = int(os.getenv("CHEAP_MAX_TOKENS", "200"))
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Gmail category labels and how strongly they suggest bulk mail
+CATEGORY_WEIGHTS = {
+    "CATEGORY_PROMOTIONS": 2,
+    "CATEGORY_SOCIAL": 1.5,
+    "CATEGORY_FORUMS": 1,
+    "CATEGORY_UPDATES": 1,
+}
+CATEGORY_NAMES = {
+    "CATEGORY_PROMOTIONS": "Promosyon",
+    "CATEGORY_SOCIAL": "Sosyal",
+    "CATEGORY_FORUMS": "Forum",
+    "CATEGORY_UPDATES": "Bülten",
+}
+NOREPLY_MARKERS = ("noreply", "no-reply", "donotreply", "do-not-reply", "newsletter", "bulten", "bülten")
+
+
+@dataclass
+class TriageDecision:
+    route: str
+    bulk_score: float
+    priority: int
+    category: str = "Genel"
+    reasons: list = field(default_factory=list)
+
+
+def triage(message):
+    """Route a Gmail message to TEMPLATE, CHEAP or FULL.
+
+    Only headers, labels and the snippet are used, so this also works on
+    messages fetched with format=metadata.
+    """
+    headers = message.get("payload", {}).get("headers", [])
+    labels = set(message.get("labelIds", []))
+    subject = get_header_value(headers, "subject")
+    sender = get_header_value(headers, "from")
+    snippet = message.get("snippet", "")
+
+    score = 0.0
+    reasons = []
+    category = "Genel"
+    for label, weight in CATEGORY_WEIGHTS.items():
+        if label in labels:
+            score += weight
+            reasons.append(label)
+            category = CATEGORY_NAMES[label]
+    if get_header_value(headers, "list-unsubscribe"):
+        score += 1
+        reasons.append("List-Unsubscribe")
+        if category == "Genel":
+            category = "Bülten"
+    if get_header_value(headers, "list-id"):
+        score += 0.5
+        reasons.append("List-Id")
+    if get_header_value(headers, "precedence").lower() in ("bulk", "list", "junk"):
+        score += 1
+        reasons.append("Precedence")
+    if any(marker in sender.lower() for marker in NOREPLY_MARKERS):
+        score += 0.5
+        reasons.append("noreply sender")
+    if "IMPORTANT" in labels or "STARRED" in labels:
+        score -= 1
+        reasons.append("important label")
+
+    priority = calculate_priority(subject, sender, snippet, "")
+    if basic_priority({"Subject": subject, "From": sender}) == 1:
+        priority = 1
+
+    if priority <= TRIAGE_FULL_PRIORITY:
+        route = FULL
+    elif score >= TRIAGE_TEMPLATE_SCORE:
+        route = TEMPLATE
+    elif score >= TRIAGE_CHEAP_SCORE:
+        route = CHEAP
+    else:
+        route = FULL
+    return TriageDecision(route, score, priority, category, reasons)
+
+
+def template_summary(message, decision):
+    """Summary built locally from the snippet, without the LLM."""
+    return SummaryRecord(
+        priority=max(decision.priority, 4),
+        category=decision.category,
+        text=" ".join(message.get("snippet", "").split()) or "İçerik önizlemesi yok",
+        source_ids=[message["id"]] if message.get("id") else []
+    )
+
+
+def heuristic_summary(message):
+    """Keyword-ranked snippet card, used while the LLM is unavailable (see app.resilience)."""
+    decision = triage(message)
+    messages = message.get("thread") or [message]
+    return SummaryRecord(
+        priority=decision.priority,
+        category=decision.category,
+        text=" ".join(message.get("snippet", "").split()) or "İçerik önizlemesi yok",
+        source_ids=[m["id"] for m in messages if m.get("id")]
+    )
@@ -0,0 +1,74 @@
+"""Compare pooled SMTP and batched Gmail sends with a connection (or API call) per digest.
+
+    python -m benchmarks.bench_dispatch --digests 50 --latency 0.005
+"""
+import argparse, base64, smtplib, time
+from app.dispatch import SMTPPool, send_gmail, send_smtp
+from app.fakes import FakeGmailService, FakeSMTPServer
+from app.gmail_service import build_summary_message
+from app.render import render_digest
+from app.summary import SummaryRecord
+
+USER, PASSWORD = "digest@example.com", "secret"
+
+
+def digests(count):
+    summaries = [{"subject": f"Toplantı {i}", "from_": "ayse@example.com",
+                  "summary": SummaryRecord(priority=i % 5 + 1, category="İş", text="Haftalık plan.")} for i in range(20)]
+    html_content = render_digest(summaries)
+    return [(f"user{i}@example.com", build_summary_message(f"user{i}@example.com", html_content, USER))
+            for i in range(count)]
+
+
+def legacy_smtp(server, messages):
+    for _, message in messages:
+        with smtplib.SMTP(server.host, server.port) as smtp:
+            smtp.login(USER, PASSWORD)
+            smtp.send_message(message)
+
+
+def legacy_gmail(service, messages):
+    for _, message in messages:
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode("ascii")
+        service.users().messages().send(userId="me", body={"raw": raw}).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--digests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per SMTP reply / Gmail round trip")
+    parser.add_argument("--pool", type=int, default=4)
+    args = parser.parse_args()
+    messages = digests(args.digests)
+
+    with FakeSMTPServer(latency=args.latency) as server:
+        start = time.perf_counter()
+        legacy_smtp(server, messages)
+        elapsed = time.perf_counter() - start
+        print(f"SMTP, connection per digest: {elapsed:.2f}s  connections={server.connections}  logins={server.logins}")
+
+    with FakeSMTPServer(latency=args.latency) as server:
+        pool = SMTPPool(server.host, server.port, USER, PASSWORD, size=args.pool, starttls=False)
+        start = time.perf_counter()
+        results = send_smtp(messages, pool)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        print(f"{f'SMTP, pool of {args.pool}:':29}{elapsed:.2f}s  connections={server.connections}  "
+              f"logins={server.logins}  delivered={sum(r.ok for r in results)}")
+
+    service = FakeGmailService(latency=args.latency)
+    start = time.perf_counter()
+    legacy_gmail(service, messages)
+    elapsed = time.perf_counter() - start
+    print(f"Gmail, call per digest:      {elapsed:.2f}s  round trips={service.round_trips}")
+
+    service = FakeGmailService(latency=args.latency)
+    start = time.perf_counter()
+    results = send_gmail(service, messages)
+    elapsed = time.perf_counter() - start
+    print(f"Gmail, batched sends:        {elapsed:.2f}s  round trips={service.round_trips}  "
+          f"delivered={sum(r.ok for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
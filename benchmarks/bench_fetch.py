@@ -0,0 +1,74 @@
+"""Compare serial and batched Gmail message fetches against the fake service.
+
+    python -m benchmarks.bench_fetch --messages 200 --latency 0.05
+"""
+import argparse, json, time
+from app.fakes import FakeGmailService, make_message
+from app.gmail_service import fetch_messages, response_bytes
+from app.pipeline import plan_fetch
+
+
+def serial_fetch(service, ids):
+    return [service.users().messages().get(userId="me", id=i).execute() for i in ids]
+
+
+def mailbox(count):
+    """Every other message is a newsletter; all carry an attachment and the usual header noise."""
+    messages = []
+    for i in range(count):
+        bulk = i % 2 == 0
+        message = make_message(
+            i, sender="Bülten <noreply@shop.example.com>" if bulk else "Ayşe <ayse@example.com>",
+            labels=["INBOX", "CATEGORY_PROMOTIONS"] if bulk else ["INBOX"],
+            headers={"List-Unsubscribe": "<mailto:u@example.com>", **{f"X-Header-{n}": "x" * 80 for n in range(20)}}
+            if bulk else {f"Received-{n}": "from mx.example.com by mx.google.com" * 3 for n in range(10)})
+        message["payload"]["parts"].append({
+            "partId": "1", "mimeType": "application/pdf", "filename": "fatura.pdf",
+            "headers": [{"name": "Content-Disposition", "value": "attachment; filename=fatura.pdf"}],
+            "body": {"attachmentId": "ANGjdJ" + "a" * 400, "size": 250000}})
+        messages.append(message)
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per HTTP round trip")
+    parser.add_argument("--chunk-size", type=int, default=50)
+    args = parser.parse_args()
+
+    messages = [make_message(i) for i in range(args.messages)]
+    ids = [m["id"] for m in messages]
+
+    service = FakeGmailService(messages, latency=args.latency)
+    start = time.perf_counter()
+    serial_fetch(service, ids)
+    serial = time.perf_counter() - start
+    print(f"serial:  {serial:.3f}s  round trips={service.round_trips}")
+
+    service = FakeGmailService(messages, latency=args.latency)
+    start = time.perf_counter()
+    fetched, errors = fetch_messages(service, ids, chunk_size=args.chunk_size)
+    batched = time.perf_counter() - start
+    print(f"batched: {batched:.3f}s  round trips={service.round_trips}  errors={len(errors)}")
+
+    # Response size: unmasked format=full versus metadata first, masked bodies where needed
+    messages = mailbox(args.messages)
+    ids = [m["id"] for m in messages]
+    service = FakeGmailService(messages)
+    fetched, _ = fetch_messages(service, ids, chunk_size=args.chunk_size)
+    start = time.perf_counter()
+    json.loads(json.dumps(fetched))
+    parse = time.perf_counter() - start
+    print(f"full:    {response_bytes(fetched) / len(ids):,.0f} bytes/message  JSON round trip={parse:.4f}s")
+    service = FakeGmailService(messages)
+    fetched, _, stats = plan_fetch(service, ids)
+    start = time.perf_counter()
+    json.loads(json.dumps(fetched))
+    parse = time.perf_counter() - start
+    print(f"planned: {stats['bytes_per_message']:,} bytes/message  JSON round trip={parse:.4f}s  "
+          f"bodies fetched={stats['full']['messages']}/{stats['messages']}  round trips={service.round_trips}")
+
+
+if __name__ == "__main__":
+    main()
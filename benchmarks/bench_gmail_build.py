@@ -0,0 +1,42 @@
+"""Per-request Gmail service setup: rebuilding every time vs the shared manager.
+
+    python -m benchmarks.bench_gmail_build --iterations 200
+"""
+import argparse, datetime as dt, os, pickle, tempfile, time
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from app.gmail_service import GmailServiceManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    creds = Credentials(token="token", expiry=dt.datetime.utcnow() + dt.timedelta(hours=1))
+    with tempfile.TemporaryDirectory() as tmp:
+        token_file = os.path.join(tmp, "token.pickle")
+        with open(token_file, "wb") as f:
+            pickle.dump(creds, f)
+
+        def load(account):
+            with open(token_file, "rb") as f:
+                return pickle.load(f)
+
+        # What gmail_build() used to do on every request
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            build("gmail", "v1", credentials=load(None))
+        rebuild = (time.perf_counter() - start) / args.iterations
+        print(f"rebuild per request: {rebuild * 1000:.3f} ms")
+
+        manager = GmailServiceManager(load=load, save=lambda account, creds: None)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            manager.get()
+        shared = (time.perf_counter() - start) / args.iterations
+        print(f"shared manager:      {shared * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare the keyword priority heuristics with the per-keyword `in` scans they replaced.
+
+    python -m benchmarks.bench_keywords --emails 100000
+"""
+import argparse, random, time
+from app.keywords import DEFAULT_KEYWORDS
+from app.ranker import basic_priority, calculate_priority, sanitize_text
+
+WORDS = ("toplantı rapor proje güncelleme fatura sipariş kargo indirim haftalık bülten merhaba "
+         "meeting report update invoice order shipping discount weekly newsletter hello").split()
+SENDERS = ["Ayşe Yılmaz <ayse@example.com>", "Genel Müdür <gm@example.com>", "no-reply@shop.example.com",
+           "CEO Office <ceo@example.com>", "Mehmet Öztürk <mehmet@example.com>"]
+CATEGORIES = ["İş", "Kişisel", "Bülten", "Promosyon", "Toplantı", "Genel"]
+
+
+def legacy_calculate_priority(subject, sender, body, category):
+    priority = 3
+    if any(k in subject.lower() for k in DEFAULT_KEYWORDS["urgent"]):
+        priority -= 2
+    elif any(k in subject.lower() for k in DEFAULT_KEYWORDS["important"]):
+        priority -= 1
+    if any(k in sender.lower() for k in DEFAULT_KEYWORDS["vip"]):
+        priority -= 1
+    if any(c.lower() in category.lower() for c in DEFAULT_KEYWORDS["category"]):
+        priority -= 1
+    if any(k in body.lower() for k in DEFAULT_KEYWORDS["deadline"]):
+        priority -= 1
+    return max(1, min(5, priority))
+
+
+def legacy_basic_priority(headers):
+    subject = sanitize_text(headers.get("Subject", "")).lower()
+    from_addr = sanitize_text(headers.get("From", "")).lower()
+    is_vip = any(v in from_addr for v in DEFAULT_KEYWORDS["basic_vip"])
+    is_urgent = any(k in subject for k in DEFAULT_KEYWORDS["basic_urgent"])
+    return 1 if is_urgent or is_vip else 2
+
+
+def corpus(size, seed=0):
+    rng = random.Random(seed)
+    keywords = [k for words in DEFAULT_KEYWORDS.values() for k in words]
+    emails = []
+    for _ in range(size):
+        subject = " ".join(rng.choices(WORDS, k=5))
+        body = " ".join(rng.choices(WORDS, k=60))
+        if rng.random() < 0.3:
+            subject += " " + rng.choice(keywords).upper()
+        if rng.random() < 0.2:
+            body += " " + rng.choice(DEFAULT_KEYWORDS["deadline"])
+        emails.append((subject, rng.choice(SENDERS), body, rng.choice(CATEGORIES)))
+    return emails
+
+
+def timed(label, func, emails):
+    start = time.perf_counter()
+    results = [func(*email) for email in emails]
+    elapsed = time.perf_counter() - start
+    print(f"{label:28} {elapsed:.3f}s  {len(emails) / elapsed:,.0f} emails/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--emails", type=int, default=100000)
+    args = parser.parse_args()
+
+    emails = corpus(args.emails)
+    old = timed("calculate_priority (legacy)", legacy_calculate_priority, emails)
+    new = timed("calculate_priority", calculate_priority, emails)
+    # Differences are upper-case Turkish keywords ("SON FIRSAT") the old .lower() missed
+    print(f"  differing results: {sum(a != b for a, b in zip(old, new))}")
+
+    headers = [({"Subject": s, "From": f},) for s, f, _, _ in emails]
+    old = timed("basic_priority (legacy)", legacy_basic_priority, headers)
+    new = timed("basic_priority", basic_priority, headers)
+    print(f"  differing results: {sum(a != b for a, b in zip(old, new))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare body extraction on large multi-attachment messages with the old top-level scan.
+
+    python -m benchmarks.bench_mime --messages 200 --body-kb 256 --attachments 5
+"""
+import argparse, base64, time
+from app.mime import BODY_CHAR_BUDGET
+from app.ranker import get_body, safe_decode
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def legacy_get_body(msg):
+    parts = msg.get("payload", {}).get("parts", [])
+    if not parts and "body" in msg.get("payload", {}):
+        data = msg["payload"]["body"].get("data", "")
+        if data:
+            return safe_decode(base64.urlsafe_b64decode(data))
+    for part in parts:
+        if part.get("mimeType") == "text/plain" and "body" in part:
+            data = part["body"].get("data", "")
+            if data:
+                return safe_decode(base64.urlsafe_b64decode(data))
+    return "No readable content"
+
+
+def build_message(index, body_kb, attachments, html_only):
+    """multipart/mixed > multipart/alternative > text parts, plus attachments."""
+    text = ("Merhaba, toplantı notları ektedir. Lütfen çarşamba gününe kadar gözden geçirin. " * 16 * body_kb)
+    alternative = [{"mimeType": "text/html", "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}],
+                    "body": {"data": encode("<html><body>" + "".join(f"<p style='margin:0'>{line}.</p>"
+                                                                    for line in text.split(".")) + "</body></html>")}}]
+    if not html_only:
+        alternative.insert(0, {"mimeType": "text/plain", "body": {"data": encode(text)}})
+    files = [{"mimeType": "application/pdf", "filename": f"ek{n}.pdf",
+              "body": {"data": encode("%PDF" + "x" * 1024 * body_kb)}} for n in range(attachments)]
+    return {"id": f"msg{index:05d}", "payload": {"mimeType": "multipart/mixed", "parts": [
+        {"mimeType": "multipart/alternative", "parts": alternative}] + files}}
+
+
+def timed(label, func, messages):
+    start = time.perf_counter()
+    bodies = [func(m) for m in messages]
+    elapsed = time.perf_counter() - start
+    print(f"{label:24} {elapsed:.3f}s  {len(messages) / elapsed:,.0f} msgs/s  "
+          f"readable={sum(b != 'No readable content' for b in bodies)}  non-ASCII chars kept={sum(sum(ord(c) > 127 for c in b) for b in bodies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--body-kb", type=int, default=256)
+    parser.add_argument("--attachments", type=int, default=5)
+    args = parser.parse_args()
+
+    for html_only in (False, True):
+        print("HTML-only:" if html_only else "plain + HTML alternative:")
+        messages = [build_message(i, args.body_kb, args.attachments, html_only) for i in range(args.messages)]
+        timed("legacy get_body", legacy_get_body, messages)
+        timed("get_body (full)", get_body, messages)
+        timed(f"get_body ({BODY_CHAR_BUDGET} chars)", lambda m: get_body(m, BODY_CHAR_BUDGET + 1), messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare PDF digests built one after another with builds spread over a process pool.
+
+    python -m benchmarks.bench_pdf --accounts 8 --cards 40 --workers 4
+"""
+import argparse, time
+from app.pdf_builder import PDF_WORKERS, build_pdfs, digest_styles, render_pdf
+from app.summary import SummaryRecord
+
+
+def digests(accounts, cards):
+    text = "Haftalık plan toplantısı perşembe günü; sunum ve bütçe güncellemesi ığüşöç İĞÜŞÖÇ. " * 4
+    return {
+        f"user{a}@example.com": [
+            {"subject": f"Toplantı {i}", "from_": "Ayşe Yılmaz <ayse@example.com>",
+             "summary": SummaryRecord(priority=i % 5 + 1, category="İş", text=text, action="Sunumu hazırla")}
+            for i in range(cards)
+        ]
+        for a in range(accounts)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=8)
+    parser.add_argument("--cards", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=max(2, PDF_WORKERS), help="pays off with several cores")
+    args = parser.parse_args()
+    batch = digests(args.accounts, args.cards)
+
+    start = time.perf_counter()
+    digest_styles()
+    print(f"fonts and styles, once per process: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    sizes = [len(render_pdf(summaries)) for summaries in batch.values()]
+    elapsed = time.perf_counter() - start
+    print(f"serial:           {elapsed:.2f}s  {args.accounts / elapsed:.1f} PDFs/s  avg {sum(sizes) // len(sizes)} bytes")
+
+    start = time.perf_counter()
+    pdfs = build_pdfs(batch, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{args.workers} processes:      {elapsed:.2f}s  {args.accounts / elapsed:.1f} PDFs/s  "
+          f"(includes starting the workers)")
+    assert len(pdfs) == args.accounts
+
+
+if __name__ == "__main__":
+    main()
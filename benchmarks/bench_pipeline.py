@@ -0,0 +1,206 @@
+"""End-to-end digest benchmark on a synthetic mailbox, reported as JSON.
+
+    python -m benchmarks.bench_pipeline --emails 200 --shape random --gmail-latency 0.01 --llm-latency 0.2 \\
+        --output bench.json --baseline previous.json
+
+Gmail and the LLM are the app.fakes stand-ins with injectable latency, so
+nothing touches the network. Each stage reports throughput, p50/p95/p99
+latency and peak traced memory; "run" is the whole /run pipeline
+(run_digest) including fetch, triage, threads, rendering and sending.
+Compare two reports with --baseline to spot regressions between commits.
+"""
+import os, tempfile
+
+# Caches and thread state must not leak into the real DATA_DIR (app.db reads this on import)
+TEMP_DATA_DIR = None if "DATA_DIR" in os.environ else tempfile.mkdtemp(prefix="bench-pipeline-")
+if TEMP_DATA_DIR:
+    os.environ["DATA_DIR"] = TEMP_DATA_DIR
+
+import argparse, asyncio, json, platform, resource, shutil, subprocess, sys, time, tracemalloc
+from app import llm, pipeline, ratelimit
+from app.cache import get_summary_cache
+from app.fakes import FakeCompletion, FakeGmailService
+from app.gmail_service import create_html_summary
+from app.pdf_builder import build_pdf
+from app.ranker import calculate_priority, get_body, prompt_inputs, summarize
+from app.threads import get_thread_store
+from benchmarks.mailbox import SHAPES, mailbox
+
+
+def percentiles(seconds):
+    """p50/p95/p99/max of `seconds`, in milliseconds."""
+    ordered = sorted(seconds)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))] * 1000, 3)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+def peak_memory(func):
+    """Peak traced allocation of one call of `func`, in MB."""
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def per_item(func, items):
+    """Call `func` on every item; report throughput and per-call latency."""
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        began = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    return {"calls": len(items), "seconds": round(elapsed, 4), "per_second": round(len(items) / elapsed, 1),
+            "latency_ms": percentiles(latencies), "peak_mb": peak_memory(lambda: [func(i) for i in items])}
+
+
+def repeated(func, repeat, emails):
+    """Call `func` `repeat` times; report emails per second and per-call latency."""
+    latencies = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - began)
+    return {"calls": repeat, "emails_per_second": round(emails * repeat / sum(latencies), 1),
+            "latency_ms": percentiles(latencies), "peak_mb": peak_memory(func)}
+
+
+def run_pipeline(messages, gmail_latency):
+    """One cold /run: empty caches, fresh fake mailbox; returns (seconds, response, Gmail round trips)."""
+    cache = get_summary_cache()
+    if cache is not None:
+        cache.clear()
+    get_thread_store().clear()
+    service = FakeGmailService([dict(m) for m in messages], latency=gmail_latency)
+    start = time.perf_counter()
+    response = asyncio.run(pipeline.run_digest(service))
+    return time.perf_counter() - start, response, service.round_trips
+
+
+def bench_run(messages, args):
+    walls, email_latencies, response, round_trips = [], [], None, 0
+    for _ in range(args.repeat):
+        wall, response, round_trips = run_pipeline(messages, args.gmail_latency)
+        walls.append(wall)
+        email_latencies += [s["latency"] for s in response["summaries"] if s.get("latency") is not None]
+    cards = len(response["summaries"])
+    return {
+        "runs": args.repeat,
+        "cards": cards,
+        "emails_per_second": round(len(messages) * args.repeat / sum(walls), 2),
+        "wall_ms": percentiles(walls),
+        "summary_latency_ms": percentiles(email_latencies),
+        "gmail_round_trips": round_trips,
+        "email_sent": response.get("email_sent"),
+        "triage": response.get("triage"),
+        "tokens": response.get("tokens"),
+        "trace": response.get("trace"),
+        "peak_mb": peak_memory(lambda: run_pipeline(messages, args.gmail_latency)),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Lines with the relative change of every headline number against `baseline`."""
+    def headline(data):
+        numbers = {}
+        for name, section in data["stages"].items():
+            for key in ("per_second", "emails_per_second", "peak_mb"):
+                if key in section:
+                    numbers[f"{name}.{key}"] = section[key]
+            for key in ("latency_ms", "wall_ms", "summary_latency_ms"):
+                if section.get(key):
+                    numbers[f"{name}.{key}.p95"] = section[key]["p95"]
+        return numbers
+
+    old, new = headline(baseline), headline(report)
+    lines = [f"compared with {baseline['meta'].get('commit') or 'baseline'}:"]
+    for key in new:
+        if key in old and old[key]:
+            change = (new[key] - old[key]) / old[key] * 100
+            lines.append(f"  {key:40} {old[key]:>12} -> {new[key]:>12}  {change:+.1f}%")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--body-kb", type=int, default=4, help="text size of each email")
+    parser.add_argument("--shape", default="random", help=f"MIME shape: {', '.join(SHAPES)} or random")
+    parser.add_argument("--turkish", type=float, default=0.6, help="share of Turkish emails")
+    parser.add_argument("--attachments", type=int, default=2)
+    parser.add_argument("--attachment-kb", type=int, default=64)
+    parser.add_argument("--gmail-latency", type=float, default=0.01, help="seconds per Gmail round trip")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="seconds per completion")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier JSON report to compare with (printed to stderr)")
+    args = parser.parse_args()
+
+    messages = mailbox(args.emails, args.seed, body_kb=args.body_kb, shape=args.shape, turkish=args.turkish,
+                       attachments=args.attachments, attachment_kb=args.attachment_kb)
+    # The whole mailbox is one digest; no quota throttling, the fakes supply the latency
+    pipeline.DIGEST_SIZE = args.emails
+    ratelimit.GMAIL_QUOTA_UNITS_PER_SECOND = 0
+    for name in {llm.LLM_BACKEND, llm.CHEAP_BACKEND}:
+        llm._backends[name] = llm.FakeBackend(latency=args.llm_latency)
+
+    inputs = [prompt_inputs(m) for m in messages]
+    complete = FakeCompletion()
+    entries = [{"subject": subject, "from_": sender, "summary": summarize(m, complete)}
+               for m, (subject, sender, _) in zip(messages, inputs)]
+
+    scratch = tempfile.mkdtemp(prefix="bench-pdf-")
+
+    def pdf():
+        os.remove(build_pdf(entries, scratch))
+
+    try:
+        stages = {
+            "get_body": per_item(get_body, messages),
+            "calculate_priority": per_item(lambda i: calculate_priority(i[0], i[1], i[2], "İş"), inputs),
+            "summarize": per_item(lambda m: summarize(m, complete), messages),
+            "create_html_summary": repeated(lambda: create_html_summary(entries), args.repeat, len(entries)),
+            "build_pdf": repeated(pdf, args.repeat, len(entries)),
+            "run": bench_run(messages, args),
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        if TEMP_DATA_DIR:
+            shutil.rmtree(TEMP_DATA_DIR, ignore_errors=True)
+
+    report = {
+        "meta": {"commit": commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "args": vars(args)},
+        "stages": stages,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n".join(compare(report, json.load(f))), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare digest rendering with the string concatenation and per-send template compile it replaced.
+
+    python -m benchmarks.bench_render --cards 10 100 1000 5000
+"""
+import argparse, html, os, time
+from jinja2 import Template
+from app.ranker import get_motivation_quote
+from app.render import DIGEST_TEMPLATE, TEMPLATE_DIR, env, render_digest, stream_digest
+from app.summary import SummaryRecord, as_record
+
+CSS = open(os.path.join(TEMPLATE_DIR, DIGEST_TEMPLATE), encoding="utf-8").read().split("</head>")[0]
+
+
+def entries(count):
+    return [{
+        "subject": f"Proje güncellemesi #{i} <taslak>",
+        "from_": f"Ayşe Yılmaz <ayse{i}@example.com>",
+        "summary": SummaryRecord(priority=i % 5 + 1, category="İş", text="Toplantı notları ve yeni takvim. " * 4,
+                                 action="Sunumu hazırla" if i % 2 else None,
+                                 deadline="Cuma 17:00" if i % 3 == 0 else None, source_ids=[f"msg{i:05d}"]),
+    } for i in range(count)]
+
+
+def legacy_create_html_summary(summaries):
+    html_content = CSS + "</head><body><div class='email-container'>"
+    for summary in summaries:
+        record = as_record(summary["summary"])
+        action = html.escape(record.action) if record.action else None
+        deadline = html.escape(record.deadline) if record.deadline else None
+        gmail_link = f"https://mail.google.com/mail/u/0/#all/{html.escape(record.source_ids[0])}"
+        html_content += f"""
+            <div class="summary-box">
+                <div class="priority-badge priority-{record.priority}">⭐ {record.priority_label}</div>
+                <a href="{gmail_link}" target="_blank" class="email-link">
+                    <h3 style="margin: 10px 0;">📌 {html.escape(summary['subject'])}</h3>
+                </a>
+                <a href="{gmail_link}" target="_blank" class="view-original">Orijinal E-postayı Aç ↗</a>
+                <div class="metadata"><strong>Gönderen:</strong> {html.escape(summary['from_'])}</div>
+                <div class="divider"></div>
+                <div class="section">{html.escape(record.text)}<br><br>{html.escape(get_motivation_quote())}</div>
+                {f'<div class="action-required">✅ Yapılması Gereken: {action}</div>' if action else ''}
+                {f'<div class="deadline">⏰ Son Tarih: {deadline}</div>' if deadline else ''}
+                <div style="margin-top: 15px;"><span class="category-tag">📑 {html.escape(record.category)}</span></div>
+            </div>
+        """
+    html_content += "</div></body></html>"
+    return html_content
+
+
+def timed(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cards", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--sends", type=int, default=200)
+    args = parser.parse_args()
+
+    render_digest(entries(1))  # Compile outside the timings
+    print(f"{'cards':>6} {'legacy':>10} {'jinja':>10} {'streamed':>10} {'jinja/card':>12} {'html kB':>8}")
+    for count in args.cards:
+        summaries = entries(count)
+        legacy, _ = timed(legacy_create_html_summary, summaries)
+        rendered, output = timed(render_digest, summaries)
+        streamed, _ = timed(lambda: sum(len(chunk) for chunk in stream_digest(summaries)))
+        print(f"{count:>6} {legacy * 1000:>8.1f}ms {rendered * 1000:>8.1f}ms {streamed * 1000:>8.1f}ms "
+              f"{rendered / count * 1e6:>10.1f}µs {len(output.encode()) / 1024:>8.0f}")
+
+    path = os.path.join(TEMPLATE_DIR, "email_template.html")
+
+    def legacy_load():
+        with open(path, encoding="utf-8") as f:
+            return Template(f.read())
+
+    compile_each, _ = timed(lambda: [legacy_load() for _ in range(args.sends)])
+    cached, _ = timed(lambda: [env.get_template("email_template.html") for _ in range(args.sends)])
+    print(f"sender template x{args.sends}: read+compile each send {compile_each * 1000:.1f}ms, "
+          f"cached environment {cached * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
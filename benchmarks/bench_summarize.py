@@ -0,0 +1,43 @@
+"""Measure summarization throughput against the fake completion backend.
+
+    python -m benchmarks.bench_summarize --messages 100 --latency 0.2 --concurrency 16
+"""
+import argparse, asyncio, statistics, time
+from app.cache import SummaryCache
+from app.engine import summarize_all
+from app.fakes import FakeCompletion, make_message
+from app.ranker import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per completion")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1, help="emails per LLM request")
+    args = parser.parse_args()
+
+    messages = [make_message(i) for i in range(args.messages)]
+
+    complete = FakeCompletion(latency=args.latency)
+    start = time.perf_counter()
+    for message in messages:
+        summarize(message, complete)
+    serial = time.perf_counter() - start
+    print(f"serial:     {serial:.3f}s  {len(messages) / serial:.1f} emails/s")
+
+    complete = FakeCompletion(latency=args.latency)
+    cache = SummaryCache(":memory:")
+    for label in ("concurrent", "cached"):
+        start = time.perf_counter()
+        results = asyncio.run(summarize_all(messages, concurrency=args.concurrency, complete=complete, cache=cache,
+                                            batch_size=args.batch_size))
+        elapsed = time.perf_counter() - start
+        latencies = [r.latency for r in results]
+        print(f"{label + ':':11} {elapsed:.3f}s  {len(messages) / elapsed:.1f} emails/s  "
+              f"median latency={statistics.median(latencies):.3f}s  errors={sum(1 for r in results if r.error)}  "
+              f"llm calls={complete.calls}  prompt chars={complete.prompt_chars}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Prompt size of per-message versus thread-level digests on a reply-heavy mailbox.
+
+    python -m benchmarks.bench_threads --threads 20 --replies 15
+"""
+import argparse, asyncio
+from app.cache import SummaryCache
+from app.engine import summarize_all
+from app.fakes import FakeCompletion, make_message
+from app.threads import ThreadStateStore, group_threads, thread_message
+import app.threads as threads
+
+
+def conversation(thread, replies):
+    """Messages of one thread, newest first like messages.list; each reply quotes the whole history."""
+    messages, history = [], ""
+    for n in range(replies):
+        body = (f"Merhaba, {n}. yanıt: teslim tarihini cuma olarak güncelledim, bütçe onayı bekleniyor.\n\n"
+                "Saygılarımla,\nAyşe Yılmaz\nProje Yöneticisi | Örnek A.Ş.\n+90 555 000 00 00\n\n")
+        if history:
+            body += f"On Mon, Ayşe Yılmaz <ayse@example.com> wrote:\n" + "\n".join("> " + l for l in history.splitlines())
+        history = body
+        messages.append(make_message(thread * 1000 + n, subject="Re: Proje bütçesi", body=body,
+                                     thread_id=f"thr{thread:05d}"))
+    return list(reversed(messages))
+
+
+def run(messages, complete):
+    return asyncio.run(summarize_all(messages, complete=complete, cache=SummaryCache(":memory:"), use_triage=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--replies", type=int, default=15)
+    args = parser.parse_args()
+
+    mailbox = [m for t in range(args.threads) for m in conversation(t, args.replies)]
+
+    complete = FakeCompletion()
+    run(mailbox, complete)
+    print(f"per message:   cards={len(mailbox)}  llm calls={complete.calls}  prompt chars={complete.prompt_chars:,}")
+
+    threads._store = ThreadStateStore(":memory:")
+    grouped = [thread_message(t) for t in group_threads(mailbox)]
+    complete = FakeCompletion()
+    run(grouped, complete)
+    print(f"per thread:    cards={len(grouped)}  llm calls={complete.calls}  prompt chars={complete.prompt_chars:,}")
+
+    # One new reply per thread: only the reply plus the stored summary is sent
+    new = [conversation(t, args.replies + 1)[0] for t in range(args.threads)]
+    complete = FakeCompletion()
+    run([thread_message([m]) for m in new], complete)
+    print(f"new replies:   cards={len(new)}  llm calls={complete.calls}  prompt chars={complete.prompt_chars:,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Synthetic Gmail API messages with configurable size, MIME shape and Turkish/English mix."""
+import base64, random
+
+SHAPES = ("plain", "html", "alternative", "mixed", "nested")
+
+WORDS = {
+    "tr": ("toplantı rapor proje güncelleme fatura sipariş kargo bütçe sunum müşteri teklif sözleşme ekip "
+           "haftalık plan görüşme onay talep süreç çalışma belge ödeme hesap").split(),
+    "en": ("meeting report project update invoice order shipping budget presentation customer offer contract "
+           "team weekly plan review approval request process document payment account").split(),
+}
+# Sentences that trigger the action / deadline keywords (see app.keywords)
+ACTIONS = {
+    "tr": ["Lütfen raporu cuma gününe kadar gönderin.", "Son tarih yarın saat 17:00.",
+           "Sunumu hazırlamanız rica olunur."],
+    "en": ["Please send the report by Friday.", "The deadline is tomorrow at 5 pm.",
+           "Action required: review the contract."],
+}
+SUBJECTS = {
+    "tr": ["Acil: {} hakkında", "{} güncellemesi", "Haftalık {} özeti", "Re: {} toplantısı", "{} için önemli not"],
+    "en": ["Urgent: {} issue", "{} update", "Weekly {} summary", "Re: {} meeting", "Important note on {}"],
+}
+SENDERS = ["Ayşe Yılmaz <ayse@example.com>", "Mehmet Öztürk <mehmet@example.com>", "CEO Office <ceo@example.com>",
+           "John Smith <john@example.com>", "no-reply@shop.example.com", "Bülten <newsletter@example.org>"]
+
+
+def encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def text_body(rng, lang, size):
+    """About `size` characters of sentences in `lang`, with an action sentence now and then."""
+    sentences, length = [], 0
+    while length < size:
+        if rng.random() < 0.15:
+            sentence = rng.choice(ACTIONS[lang])
+        else:
+            words = rng.choices(WORDS[lang], k=rng.randint(6, 14))
+            sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def html_body(text):
+    paragraphs = "".join(f"<p style=\"margin:0 0 8px 0\">{s}.</p>" for s in text.split(". "))
+    return (f"<html><head><style>p {{ font-family: Arial }}</style></head><body><table><tr><td>"
+            f"{paragraphs}</td></tr></table></body></html>")
+
+
+def _text_part(mime_type, text, charset="utf-8"):
+    return {"mimeType": mime_type,
+            "headers": [{"name": "Content-Type", "value": f"{mime_type}; charset={charset}"}],
+            "body": {"size": len(text), "data": encode(text.encode(charset, errors="replace"))}}
+
+
+def _attachment(rng, index, size_kb):
+    data = bytes(rng.getrandbits(8) for _ in range(256)) * (size_kb * 4)
+    return {"mimeType": "application/pdf", "filename": f"ek{index}.pdf",
+            "headers": [{"name": "Content-Disposition", "value": f"attachment; filename=ek{index}.pdf"}],
+            "body": {"attachmentId": f"att{index}", "size": len(data), "data": encode(data)}}
+
+
+def payload(rng, shape, text, attachments, attachment_kb, charset):
+    plain = _text_part("text/plain", text, charset)
+    html = _text_part("text/html", html_body(text))
+    if shape == "plain":
+        return plain
+    if shape == "html":
+        return html
+    alternative = {"mimeType": "multipart/alternative", "parts": [plain, html]}
+    if shape == "alternative":
+        return alternative
+    files = [_attachment(rng, n, attachment_kb) for n in range(attachments)]
+    if shape == "mixed":
+        return {"mimeType": "multipart/mixed", "parts": [alternative] + files}
+    # nested: mixed > related > alternative, with an inline image next to the text
+    image = {"mimeType": "image/png", "headers": [{"name": "Content-ID", "value": "<logo>"}],
+             "body": {"size": 68, "data": encode(b"\x89PNG" + b"\0" * 64)}}
+    related = {"mimeType": "multipart/related", "parts": [alternative, image]}
+    return {"mimeType": "multipart/mixed", "parts": [related] + files}
+
+
+def synthetic_message(index, rng, body_kb=4, shape="mixed", turkish=0.6, attachments=2, attachment_kb=64,
+                      bulk=0.3, threads=0.2):
+    """One Gmail API message resource (format=full).
+
+    `turkish` is the share of Turkish mail (some of it in ISO-8859-9),
+    `bulk` the share with promotion labels and List-Unsubscribe, and
+    `threads` the chance that a message continues an earlier thread.
+    """
+    lang = "tr" if rng.random() < turkish else "en"
+    text = text_body(rng, lang, body_kb * 1024)
+    charset = "iso-8859-9" if lang == "tr" and rng.random() < 0.3 else "utf-8"
+    subject = rng.choice(SUBJECTS[lang]).format(rng.choice(WORDS[lang]))
+    headers = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": rng.choice(SENDERS)},
+        {"name": "To", "value": "me@example.com"},
+        {"name": "Date", "value": "Mon, 6 Jan 2025 09:00:00 +0300"},
+    ]
+    labels = ["INBOX"]
+    if rng.random() < bulk:
+        labels.append("CATEGORY_PROMOTIONS")
+        headers.append({"name": "List-Unsubscribe", "value": "<mailto:unsubscribe@example.org>"})
+    thread_id = f"thr{rng.randrange(index):05d}" if index and rng.random() < threads else f"thr{index:05d}"
+    body = payload(rng, shape if shape in SHAPES else rng.choice(SHAPES), text, attachments, attachment_kb, charset)
+    body["headers"] = headers + body.get("headers", [])
+    return {
+        "id": f"msg{index:05d}",
+        "threadId": thread_id,
+        "labelIds": labels,
+        "snippet": text[:150],
+        "internalDate": str(1736150400000 + index * 60000),
+        "payload": body,
+    }
+
+
+def mailbox(count, seed=0, **options):
+    """`count` synthetic messages; the same seed and options always give the same mailbox."""
+    rng = random.Random(seed)
+    return [synthetic_message(i, rng, **options) for i in range(count)]
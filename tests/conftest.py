@@ -0,0 +1,6 @@
+import os, tempfile
+
+# app.db and app.llm read these on import: keep stores out of ./data and the LLM offline
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="digest-tests-")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.pop("CHEAP_BACKEND", None)
@@ -0,0 +1,15 @@
+from types import SimpleNamespace
+from app import budget
+
+
+def test_tokenizer_falls_back_to_estimate_when_the_encoding_cannot_load(monkeypatch):
+    def offline(name):
+        raise OSError("BPE file download failed")
+
+    monkeypatch.setattr(budget, "tiktoken", SimpleNamespace(encoding_for_model=offline, get_encoding=offline))
+    budget._encoding.cache_clear()
+    try:
+        assert budget.count_tokens("Toplantı yarın saat onda") > 0
+        assert budget.tokenizer() == "estimate"
+    finally:
+        budget._encoding.cache_clear()
@@ -0,0 +1,24 @@
+import asyncio, time
+from app import pipeline
+from app.digest_store import get_digest_store
+from app.fakes import FakeGmailService, make_message
+
+
+def test_cards_keep_the_arrival_time_of_their_mail():
+    account = "arrival@example.com"
+    hour_ago = int((time.time() - 3600) * 1000)
+    old = dict(make_message(1, subject="Eski"), internalDate=str(hour_ago))
+    service = FakeGmailService()
+    asyncio.run(pipeline.presummarize(service, account))
+    service.add_message(old)
+    service.add_message(make_message(2, subject="Yeni"))
+    asyncio.run(pipeline.presummarize(service, account))
+
+    store = get_digest_store()
+    with store._lock:
+        rows = dict(store._conn.execute(
+            "SELECT subject, received_at FROM digest_cards WHERE account = ?", (account,)
+        ).fetchall())
+    assert rows["Eski"] == hour_ago / 1000
+    assert rows["Yeni"] == int(service.messages["msg00002"]["internalDate"]) / 1000
+
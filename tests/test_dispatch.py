@@ -0,0 +1,36 @@
+from app.dispatch import SMTPPool, send_smtp
+from app.fakes import FakeSMTPServer
+from app.gmail_service import build_summary_message
+
+
+def digest_to(recipient):
+    return recipient, build_summary_message(recipient, "<p>Günlük özet</p>", "digest@example.com")
+
+
+def test_pool_reuses_connections_across_sends():
+    with FakeSMTPServer() as server:
+        pool = SMTPPool(server.host, server.port, "digest@example.com", "secret", size=1, starttls=False)
+        results = send_smtp([digest_to(f"user{i}@example.com") for i in range(5)], pool)
+        pool.close()
+
+    assert all(d.ok for d in results)
+    assert len(server.messages) == 5
+    assert server.connections == 1
+    assert server.logins == 1
+    assert pool.opened == 1
+
+
+def test_rejected_recipient_does_not_stop_the_others():
+    with FakeSMTPServer(rejected={"gone@example.com"}) as server:
+        pool = SMTPPool(server.host, server.port, "digest@example.com", "secret", size=1, starttls=False)
+        recipients = ["a@example.com", "gone@example.com", "b@example.com"]
+        results = send_smtp([digest_to(r) for r in recipients], pool)
+        pool.close()
+
+    by_recipient = {d.recipient: d for d in results}
+    assert not by_recipient["gone@example.com"].ok
+    assert "550" in by_recipient["gone@example.com"].error
+    assert by_recipient["a@example.com"].ok and by_recipient["b@example.com"].ok
+    assert sorted(r for _, rcpts, _ in server.messages for r in rcpts) == ["a@example.com", "b@example.com"]
+    # A 550 answer leaves the session usable, so the connection is kept
+    assert server.connections == 1
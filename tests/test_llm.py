@@ -0,0 +1,29 @@
+import asyncio
+from app import llm, pipeline
+from app.fakes import FakeGmailService, make_message
+from app.triage import CHEAP, FULL, TEMPLATE
+
+
+def test_run_digest_with_fake_backend_routes_and_summarizes():
+    assert llm.LLM_BACKEND == "fake"
+    messages = [
+        make_message(0, subject="Proje planı"),
+        make_message(1, subject="Haftalık güncelleme", labels=["INBOX", "CATEGORY_UPDATES"]),
+        make_message(2, subject="Kampanya", sender="Bülten <newsletter@shop.example.com>",
+                     labels=["INBOX", "CATEGORY_PROMOTIONS"],
+                     headers={"List-Unsubscribe": "<mailto:unsubscribe@shop.example.com>"}),
+    ]
+    service = FakeGmailService(messages)
+
+    response = asyncio.run(pipeline.run_digest(service))
+
+    routes = {s["subject"]: s["route"] for s in response["summaries"]}
+    assert routes == {"Proje planı": FULL, "Haftalık güncelleme": CHEAP, "Kampanya": TEMPLATE}
+    cards = {s["subject"]: s["summary"] for s in response["summaries"]}
+    assert cards["Proje planı"]["text"] == "Bu e-posta otomatik test için özetlendi."
+    assert cards["Proje planı"]["category"] == "İş"
+    assert cards["Proje planı"]["source_ids"] == ["msg00000"]
+    assert cards["Kampanya"]["category"] == "Promosyon"
+    assert all(s["error"] is None for s in response["summaries"])
+    assert response["email_sent"] and len(service.sent) == 1
+    assert llm.get_backend("fake").info()["name"] == "fake"
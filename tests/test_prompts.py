@@ -0,0 +1,31 @@
+from app import llm
+from app.batching import summarize_batch
+from app.fakes import make_message
+from app.ranker import generate_summary
+
+SUBJECT = "Görüşme için son gün"
+SENDER = "Şükrü Çağlar <sukru@example.com>"
+
+
+def recording_backend():
+    prompts = []
+    fake = llm.get_backend("fake")
+
+    def complete(messages, *args, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return fake(messages, *args, **kwargs)
+
+    return complete, prompts
+
+
+def test_single_and_batch_prompts_keep_turkish_headers():
+    messages = [make_message(index, subject=SUBJECT, sender=SENDER) for index in range(2)]
+    complete, prompts = recording_backend()
+
+    generate_summary(messages[0], complete=complete)
+    summarize_batch(messages, complete=complete)
+
+    assert len(prompts) == 2
+    for prompt in prompts:
+        assert SUBJECT in prompt
+        assert SENDER in prompt
@@ -0,0 +1,26 @@
+import asyncio
+from app import main
+
+
+def test_ingest_and_push_runs_of_one_account_do_not_overlap(monkeypatch):
+    running, overlaps = set(), []
+
+    async def presummarize(service, account):
+        overlaps.append(account in running)
+        running.add(account)
+        await asyncio.sleep(0.05)
+        running.discard(account)
+        return {"messages": 0}
+
+    monkeypatch.setattr(main, "gmail_build", lambda account: object())
+    monkeypatch.setattr(main, "presummarize", presummarize)
+
+    async def both():
+        # /ingest calls run_push_presummary directly, the coalescer through run_account
+        return await asyncio.gather(main.ingest("a@example.com"), main.run_push_presummary("a@example.com"),
+                                    main.run_push_presummary("b@example.com"))
+
+    results = asyncio.run(both())
+
+    assert results == [{"messages": 0}] * 3
+    assert overlaps == [False, False, False]
@@ -0,0 +1,32 @@
+import asyncio, time
+from app.ratelimit import GMAIL_COST, TokenBucket, gmail_acquire
+
+
+def test_costs_above_capacity_are_charged_in_full():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    started = time.monotonic()
+
+    # A full bucket covers 100 units, the other 150 take 0.15s to refill
+    bucket.acquire(250)
+
+    assert time.monotonic() - started >= 0.14
+    assert bucket.try_acquire(100) > 0
+
+
+def test_async_acquire_charges_in_full():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    started = time.monotonic()
+
+    asyncio.run(bucket.acquire_async(250))
+
+    assert time.monotonic() - started >= 0.14
+
+
+def test_batched_sends_spend_their_whole_quota():
+    bucket = TokenBucket(rate=GMAIL_COST["messages.send"] * 20, capacity=GMAIL_COST["messages.send"])
+    started = time.monotonic()
+
+    # Five sends: one from the full bucket, four refilled at 20 sends per second
+    gmail_acquire(bucket, "messages.send", 5)
+
+    assert time.monotonic() - started >= 0.19
@@ -0,0 +1,92 @@
+import asyncio
+from app import llm, pipeline, threads
+from app.digest_store import get_digest_store
+from app.fakes import FakeGmailService, make_message
+from app.summary import SummaryRecord
+from app.threads import ThreadStateStore
+
+SENDERS = ["Ayşe <ayse@example.com>", "Mehmet Öztürk <mehmet@example.com>", "Zeynep Işık <zeynep@example.com>"]
+
+
+def record_prompts(monkeypatch):
+    backend = llm.get_backend("fake")
+    prompts = []
+    fake = backend.fake
+
+    def complete(messages, *args, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return fake(messages, *args, **kwargs)
+
+    monkeypatch.setattr(backend, "fake", complete)
+    return prompts
+
+
+def reply(index, sender, thread_id):
+    return make_message(index, subject="Budget meeting", sender=sender,
+                        body=f"{sender.split()[0]} wrote: the budget draft is attached.", thread_id=thread_id)
+
+
+def deliver_thread(service, thread_id, first_index):
+    for offset, sender in enumerate(SENDERS):
+        service.add_message(reply(first_index + offset, sender, thread_id))
+
+
+def test_thread_from_history_is_summarized_oldest_first(monkeypatch):
+    prompts = record_prompts(monkeypatch)
+    account = "history-order@example.com"
+    service = FakeGmailService()
+    asyncio.run(pipeline.presummarize(service, account))  # First sync: seeds the history ID
+    deliver_thread(service, "thr-history", 100)
+
+    result = asyncio.run(pipeline.presummarize(service, account))
+
+    assert result["mode"] == "incremental" and result["messages"] == 3
+    prompt = next(p for p in prompts if "eskiden yeniye" in p)
+    positions = [prompt.index(sender) for sender in SENDERS]
+    assert positions == sorted(positions)
+    summaries, _ = get_digest_store().pending(account)
+    assert [s["from_"] for s in summaries] == [SENDERS[-1]]
+
+
+def test_thread_budget_keeps_the_newest_replies(monkeypatch):
+    prompts = record_prompts(monkeypatch)
+    # Room for one reply block only
+    block = threads.count_tokens(threads.reply_block(reply(0, SENDERS[-1], "thr-budget")))
+    monkeypatch.setattr(threads, "THREAD_TOKEN_BUDGET", block + 1)
+    account = "history-budget@example.com"
+    service = FakeGmailService()
+    asyncio.run(pipeline.presummarize(service, account))
+    deliver_thread(service, "thr-budget", 200)
+
+    asyncio.run(pipeline.presummarize(service, account))
+
+    prompt = next(p for p in prompts if "eskiden yeniye" in p)
+    assert SENDERS[-1] in prompt
+    assert SENDERS[0] not in prompt
+
+
+def test_thread_ids_of_different_accounts_do_not_share_state(monkeypatch):
+    prompts = record_prompts(monkeypatch)
+    first, second = FakeGmailService(), FakeGmailService()
+    for service, account in ((first, "first@example.com"), (second, "second@example.com")):
+        asyncio.run(pipeline.presummarize(service, account))
+    deliver_thread(first, "thr-shared", 300)
+    asyncio.run(pipeline.presummarize(first, "first@example.com"))
+    second.add_message(reply(400, SENDERS[0], "thr-shared"))
+
+    asyncio.run(pipeline.presummarize(second, "second@example.com"))
+
+    assert not any("Önceki Özet" in p for p in prompts)
+    summaries, _ = get_digest_store().pending("second@example.com")
+    assert summaries[0]["summary"].source_ids == ["msg00400"]
+
+
+def test_thread_state_expires_after_the_retention_period():
+    store = ThreadStateStore(":memory:", retention_days=1)
+    store.put(("me", "thr-old"), {"m1"}, SummaryRecord(text="Eski özet"))
+    store.put(("me", "thr-new"), {"m2"}, SummaryRecord(text="Yeni özet"))
+    store._conn.execute("UPDATE thread_states SET updated_at = updated_at - 2 * 86400 WHERE thread_id = 'thr-old'")
+
+    assert store.get(("me", "thr-old")) == (set(), None)
+    assert store.prune() == 1
+    assert store.get(("me", "thr-new"))[1].text == "Yeni özet"
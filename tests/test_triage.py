@@ -0,0 +1,16 @@
+from app.fakes import make_message
+from app.ranker import prompt_inputs
+from app.triage import FULL, triage
+
+
+def test_turkish_subject_keywords_reach_the_heuristics():
+    message = make_message(0, subject="ÖNEMLİ: son gün", sender="Genel Müdür <gm@example.com>",
+                           labels=["INBOX", "CATEGORY_UPDATES"])
+
+    decision = triage(message)
+
+    assert decision.route == FULL
+    assert decision.priority == 1
+    subject, sender, _ = prompt_inputs(message)
+    assert subject == "ÖNEMLİ: son gün"
+    assert sender == "Genel Müdür <gm@example.com>"